@@ -0,0 +1,95 @@
+"""numeric listing columns
+
+Revision ID: 122277ced8b1
+Revises: 4c1807ecf8d4
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '122277ced8b1'
+down_revision: Union[str, None] = '4c1807ecf8d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+
+
+def _decimal(column: str, int_digits: int) -> str:
+    # Те же правила, что и app.operations.numeric.to_decimal: пробелы убираются, запятая -> точка
+    cleaned = f"replace(regexp_replace({column}, '\\s', '', 'g'), ',', '.')"
+    return (
+        f"CASE WHEN {cleaned} ~ '^[0-9]{{1,{int_digits}}}(\\.[0-9]{{1,2}})?$' "
+        f"THEN ({cleaned})::numeric END"
+    )
+
+
+def _int(column: str) -> str:
+    cleaned = f"regexp_replace({column}, '\\s', '', 'g')"
+    return f"CASE WHEN {cleaned} ~ '^[0-9]{{1,9}}$' THEN ({cleaned})::integer END"
+
+
+BACKFILLS = {
+    'home': f"price_value = {_decimal('price', 12)}",
+    'options': ", ".join([
+        f"numbers_of_room_value = {_int('numbers_of_room')}",
+        f"square_value = {_decimal('square', 8)}",
+        f"year_of_construction_value = {_int('year_of_construction')}",
+        f"floor_value = {_int('floor')}",
+        f"ceiling_height_value = {_decimal('ceiling_height', 4)}",
+    ]),
+}
+
+
+def _backfill(table: str, assignments: str) -> None:
+    if op.get_context().as_sql:
+        # В offline-режиме диапазон id неизвестен — одна команда на всю таблицу
+        op.execute(f"UPDATE {table} SET {assignments}")
+        return
+
+    bind = op.get_bind()
+    max_id = bind.execute(sa.text(f"SELECT coalesce(max(id), 0) FROM {table}")).scalar()
+    # Пачками по id, каждая в своей транзакции: короткие блокировки и умеренный объём WAL
+    for start in range(0, max_id + 1, BATCH_SIZE):
+        with op.get_context().autocommit_block():
+            bind.execute(
+                sa.text(f"UPDATE {table} SET {assignments} WHERE id >= :start AND id < :end"),
+                {"start": start, "end": start + BATCH_SIZE},
+            )
+
+
+def upgrade() -> None:
+    op.add_column('home', sa.Column('price_value', sa.Numeric(14, 2), nullable=True))
+    op.add_column('options', sa.Column('numbers_of_room_value', sa.Integer(), nullable=True))
+    op.add_column('options', sa.Column('square_value', sa.Numeric(10, 2), nullable=True))
+    op.add_column('options', sa.Column('year_of_construction_value', sa.Integer(), nullable=True))
+    op.add_column('options', sa.Column('floor_value', sa.Integer(), nullable=True))
+    op.add_column('options', sa.Column('ceiling_height_value', sa.Numeric(6, 2), nullable=True))
+
+    for table, assignments in BACKFILLS.items():
+        _backfill(table, assignments)
+
+    # Индексы строим после бэкфила, чтобы не обновлять их на каждой пачке
+    with op.get_context().autocommit_block():
+        op.create_index('ix_home_price_value', 'home', ['price_value'], postgresql_concurrently=True)
+        op.create_index(
+            'ix_options_numbers_of_room_value', 'options', ['numbers_of_room_value'], postgresql_concurrently=True
+        )
+        op.create_index('ix_options_square_value', 'options', ['square_value'], postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_options_square_value', table_name='options')
+    op.drop_index('ix_options_numbers_of_room_value', table_name='options')
+    op.drop_index('ix_home_price_value', table_name='home')
+    op.drop_column('options', 'ceiling_height_value')
+    op.drop_column('options', 'floor_value')
+    op.drop_column('options', 'year_of_construction_value')
+    op.drop_column('options', 'square_value')
+    op.drop_column('options', 'numbers_of_room_value')
+    op.drop_column('home', 'price_value')
@@ -0,0 +1,36 @@
+"""home updated_at
+
+Revision ID: 2efdb5a6bbe8
+Revises: 8861571ed534
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2efdb5a6bbe8'
+down_revision: Union[str, None] = '8861571ed534'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Значение по умолчанию стабильное (вычисляется один раз), поэтому таблица не перезаписывается
+    op.add_column('home', sa.Column(
+        'updated_at', sa.DateTime(), nullable=False, server_default=sa.text("(now() at time zone 'utc')"),
+    ))
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_home_updated_at_id', 'home', ['updated_at', 'id'],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_home_updated_at_id', table_name='home', postgresql_concurrently=True)
+    op.drop_column('home', 'updated_at')
@@ -0,0 +1,68 @@
+"""home popularity counters
+
+Revision ID: 3020670498a8
+Revises: 4fe558b5e77b
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3020670498a8'
+down_revision: Union[str, None] = '4fe558b5e77b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Строка счётчиков заводится вместе с объявлением: сортировка "популярные" идёт по индексу
+# home_stats внутренним JOIN, и объявления без строки из неё выпали бы.
+# Триггер уровня оператора — массовый импорт вставляет строки одним INSERT на пачку
+INSERT_FUNCTION = """
+CREATE OR REPLACE FUNCTION home_stats_on_insert_home() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO home_stats (home_id, updated_at)
+    SELECT id, now() at time zone 'utc' FROM new_rows
+    ON CONFLICT (home_id) DO NOTHING;
+    RETURN NULL;
+END
+$$
+"""
+
+
+def upgrade() -> None:
+    op.create_table(
+        'home_stats',
+        sa.Column('home_id', sa.Integer(), sa.ForeignKey('home.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('views_count', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('favorites_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('trending_log', sa.Float(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+    )
+    # Строка на каждое объявление с начальными значениями избранного; просмотры до этой миграции не считались
+    op.execute(
+        "INSERT INTO home_stats (home_id, favorites_count, updated_at) "
+        "SELECT h.id, coalesce(f.favorites, 0), now() at time zone 'utc' FROM home h "
+        "LEFT JOIN (SELECT home_id, count(*) AS favorites FROM user_favorites GROUP BY home_id) f "
+        "ON f.home_id = h.id"
+    )
+    op.execute(INSERT_FUNCTION)
+    op.execute(
+        "CREATE TRIGGER home_stats_home_insert AFTER INSERT ON home "
+        "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION home_stats_on_insert_home()"
+    )
+    op.create_index(
+        'ix_home_stats_popular', 'home_stats',
+        [sa.text('favorites_count DESC'), sa.text('views_count DESC'), sa.text('home_id DESC')],
+    )
+    op.create_index('ix_home_stats_trending_log', 'home_stats', [sa.text('trending_log DESC NULLS LAST')])
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER home_stats_home_insert ON home")
+    op.execute("DROP FUNCTION home_stats_on_insert_home()")
+    op.drop_index('ix_home_stats_trending_log', table_name='home_stats')
+    op.drop_index('ix_home_stats_popular', table_name='home_stats')
+    op.drop_table('home_stats')
@@ -0,0 +1,162 @@
+"""partition visits by day
+
+Revision ID: 3e30986a6c37
+Revises: bca84b26a9ed
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from datetime import datetime, timedelta
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e30986a6c37'
+down_revision: Union[str, None] = 'bca84b26a9ed'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PREMAKE_DAYS = 7
+# Срок хранения на момент миграции (VISIT_RETENTION_DAYS в app.config): секции старше него
+# не создаются, а визиты за их дни уходят в visits_archive
+RETENTION_DAYS = 90
+
+# Создаёт недостающие дневные секции visits_pYYYYMMDD; advisory lock — от гонки воркеров
+ENSURE_FUNCTION = """
+CREATE OR REPLACE FUNCTION visits_ensure_partitions(first_day date, last_day date) RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    d date;
+    partition_name text;
+    created integer := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('visits_partitions'));
+    FOR d IN SELECT generate_series(first_day, last_day, interval '1 day')::date LOOP
+        partition_name := 'visits_p' || to_char(d, 'YYYYMMDD');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF visits FOR VALUES FROM (%L) TO (%L)',
+                partition_name, d, d + 1
+            );
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END
+$$
+"""
+
+# Срок хранения: секция целиком удаляется DROP TABLE вместо построчного DELETE
+DROP_FUNCTION = """
+CREATE OR REPLACE FUNCTION visits_drop_partitions(before_day date) RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    partition_name text;
+    dropped integer := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('visits_partitions'));
+    FOR partition_name IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'visits'::regclass
+          AND c.relname ~ '^visits_p[0-9]{8}$'
+          AND to_date(substring(c.relname from 9), 'YYYYMMDD') < before_day
+    LOOP
+        EXECUTE format('DROP TABLE %I', partition_name);
+        dropped := dropped + 1;
+    END LOOP;
+    RETURN dropped;
+END
+$$
+"""
+
+
+def upgrade() -> None:
+    today = datetime.utcnow().date()
+
+    # Старая таблица уходит в сторону; её последовательность id переходит к новой
+    op.execute("ALTER TABLE visits RENAME TO visits_legacy")
+    op.execute("ALTER TABLE visits_legacy RENAME CONSTRAINT visits_pkey TO visits_legacy_pkey")
+    op.execute("DROP INDEX IF EXISTS ix_visits_id")
+    op.execute("DROP INDEX IF EXISTS ix_visits_user_id")
+    op.execute("ALTER SEQUENCE visits_id_seq OWNED BY NONE")
+
+    # Ключ секционирования обязан входить в первичный ключ
+    op.execute("""
+        CREATE TABLE visits (
+            id integer NOT NULL DEFAULT nextval('visits_id_seq'),
+            user_id varchar,
+            visit_time timestamp without time zone NOT NULL,
+            CONSTRAINT visits_pkey PRIMARY KEY (id, visit_time)
+        ) PARTITION BY RANGE (visit_time)
+    """)
+    op.execute("ALTER SEQUENCE visits_id_seq OWNED BY visits.id")
+    op.execute(ENSURE_FUNCTION)
+    op.execute(DROP_FUNCTION)
+    # Секции только в пределах срока хранения: с greatest(min(visit_time), today - RETENTION_DAYS),
+    # иначе многолетняя история дала бы тысячи секций, которые обслуживание тут же удалит
+    first_day = f"'{today - timedelta(days=RETENTION_DAYS)}'::date"
+    op.execute(
+        "SELECT visits_ensure_partitions("
+        f"greatest((SELECT min(visit_time)::date FROM visits_legacy), {first_day}), "
+        f"greatest((SELECT max(visit_time)::date FROM visits_legacy), '{today + timedelta(days=PREMAKE_DAYS)}'::date))"
+    )
+
+    # BRIN по времени: визиты пишутся по возрастанию visit_time, индекс крошечный
+    op.execute("CREATE INDEX ix_visits_visit_time_brin ON visits USING brin (visit_time)")
+    op.execute("CREATE INDEX ix_visits_user_id ON visits (user_id)")
+
+    op.execute(
+        "INSERT INTO visits (id, user_id, visit_time) "
+        f"SELECT id, user_id, visit_time FROM visits_legacy WHERE visit_time >= {first_day}"
+    )
+    # Визиты старше срока хранения и без времени не попадают ни в одну секцию: они не удаляются
+    # молча, а остаются в visits_archive (таблица создаётся, только если такие строки есть)
+    op.execute(f"DELETE FROM visits_legacy WHERE visit_time >= {first_day}")
+    op.execute("""
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM visits_legacy) THEN
+                ALTER TABLE visits_legacy RENAME TO visits_archive;
+                ALTER TABLE visits_archive RENAME CONSTRAINT visits_legacy_pkey TO visits_archive_pkey;
+            ELSE
+                DROP TABLE visits_legacy;
+            END IF;
+        END
+        $$
+    """)
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE visits RENAME TO visits_partitioned")
+    op.execute("ALTER TABLE visits_partitioned RENAME CONSTRAINT visits_pkey TO visits_partitioned_pkey")
+    op.execute("DROP INDEX ix_visits_user_id")
+    op.execute("ALTER SEQUENCE visits_id_seq OWNED BY NONE")
+    op.execute("""
+        CREATE TABLE visits (
+            id integer NOT NULL DEFAULT nextval('visits_id_seq'),
+            user_id varchar,
+            visit_time timestamp without time zone,
+            CONSTRAINT visits_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute("ALTER SEQUENCE visits_id_seq OWNED BY visits.id")
+    op.execute("CREATE INDEX ix_visits_id ON visits (id)")
+    op.execute("CREATE INDEX ix_visits_user_id ON visits (user_id)")
+    op.execute("INSERT INTO visits (id, user_id, visit_time) SELECT id, user_id, visit_time FROM visits_partitioned")
+    op.execute("""
+        DO $$
+        BEGIN
+            IF to_regclass('visits_archive') IS NOT NULL THEN
+                INSERT INTO visits (id, user_id, visit_time) SELECT id, user_id, visit_time FROM visits_archive;
+                DROP TABLE visits_archive;
+            END IF;
+        END
+        $$
+    """)
+    op.execute("DROP TABLE visits_partitioned")
+    op.execute("DROP FUNCTION visits_drop_partitions(date)")
+    op.execute("DROP FUNCTION visits_ensure_partitions(date, date)")
@@ -0,0 +1,39 @@
+"""listing indexes
+
+Revision ID: 4c1807ecf8d4
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c1807ecf8d4'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY не блокирует запись в таблицы, но требует выполнения вне транзакции
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_home_transaction_housing_id', 'home',
+            ['type_of_transaction', 'type_of_housing', 'id'],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index('ix_home_user_id', 'home', ['user_id'], postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_photos_home_id', 'photos', ['home_id'], postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_options_home_id', 'options', ['home_id'], postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_options_home_id', table_name='options', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_photos_home_id', table_name='photos', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_home_user_id', table_name='home', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_home_transaction_housing_id', table_name='home', postgresql_concurrently=True, if_exists=True)
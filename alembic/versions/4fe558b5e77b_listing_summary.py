@@ -0,0 +1,183 @@
+"""listing summary read model
+
+Revision ID: 4fe558b5e77b
+Revises: 5e14bc51ac13
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4fe558b5e77b'
+down_revision: Union[str, None] = '5e14bc51ac13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+
+# Пересборка строк сводки по списку id: удалённые объявления убираются, остальные upsert-ом
+REFRESH_FUNCTION = """
+CREATE OR REPLACE FUNCTION listing_summary_refresh(ids integer[]) RETURNS void LANGUAGE sql AS $$
+    DELETE FROM listing_summary s
+    WHERE s.id = ANY(ids) AND NOT EXISTS (SELECT 1 FROM home h WHERE h.id = s.id);
+
+    INSERT INTO listing_summary (
+        id, user_id, name, price, price_value, description, address,
+        type_of_transaction, type_of_housing, latitude, longitude, geohash,
+        rooms, square_value, cover_photo, photos, updated_at
+    )
+    SELECT
+        h.id, h.user_id, h.name, h.price, h.price_value, h.description, h.address,
+        h.type_of_transaction, h.type_of_housing, h.latitude, h.longitude, h.geohash,
+        o.numbers_of_room_value, o.square_value, p.photos ->> 0, coalesce(p.photos, '[]'::json), h.updated_at
+    FROM home h
+    LEFT JOIN LATERAL (
+        SELECT numbers_of_room_value, square_value FROM options WHERE home_id = h.id ORDER BY id LIMIT 1
+    ) o ON true
+    LEFT JOIN LATERAL (
+        SELECT json_agg(photo ORDER BY id) AS photos FROM photos WHERE home_id = h.id
+    ) p ON true
+    WHERE h.id = ANY(ids)
+    ON CONFLICT (id) DO UPDATE SET
+        user_id = EXCLUDED.user_id,
+        name = EXCLUDED.name,
+        price = EXCLUDED.price,
+        price_value = EXCLUDED.price_value,
+        description = EXCLUDED.description,
+        address = EXCLUDED.address,
+        type_of_transaction = EXCLUDED.type_of_transaction,
+        type_of_housing = EXCLUDED.type_of_housing,
+        latitude = EXCLUDED.latitude,
+        longitude = EXCLUDED.longitude,
+        geohash = EXCLUDED.geohash,
+        rooms = EXCLUDED.rooms,
+        square_value = EXCLUDED.square_value,
+        cover_photo = EXCLUDED.cover_photo,
+        photos = EXCLUDED.photos,
+        updated_at = EXCLUDED.updated_at;
+$$
+"""
+
+# Колонки home, которые попадают в сводку (включая updated_at — иначе он в сводке отстаёт):
+# служебные обновления (аренда очереди геокодера и т.п.) сводку не пересобирают
+HOME_CARD_COLUMNS = (
+    "user_id, name, price, price_value, description, address, type_of_transaction, type_of_housing, "
+    "latitude, longitude, geohash, updated_at"
+)
+
+# Триггеры уровня оператора с таблицами переходов: пачка строк (массовый импорт) — один пересчёт
+TRIGGER_FUNCTIONS = {
+    "listing_summary_on_insert_home": "SELECT id FROM new_rows",
+    "listing_summary_on_update_home": (
+        f"SELECT n.id FROM new_rows n JOIN old_rows o ON o.id = n.id "
+        f"WHERE ({', '.join('o.' + c for c in HOME_CARD_COLUMNS.split(', '))}) "
+        f"IS DISTINCT FROM ({', '.join('n.' + c for c in HOME_CARD_COLUMNS.split(', '))})"
+    ),
+    "listing_summary_on_insert_child": "SELECT home_id FROM new_rows",
+    "listing_summary_on_delete_child": "SELECT home_id FROM old_rows",
+    "listing_summary_on_update_options": (
+        "SELECT home_id FROM new_rows UNION SELECT home_id FROM old_rows"
+    ),
+    # Сверка фото обновляет status/checked_at у всех строк — на сводку влияют только имя и дом
+    "listing_summary_on_update_photos": (
+        "SELECT unnest(ARRAY[o.home_id, n.home_id]) FROM new_rows n JOIN old_rows o ON o.id = n.id "
+        "WHERE (o.home_id, o.photo) IS DISTINCT FROM (n.home_id, n.photo)"
+    ),
+}
+
+TRIGGERS = [
+    # (имя, таблица, событие, transition tables, функция)
+    ("listing_summary_home_insert", "home", "INSERT", "NEW TABLE AS new_rows", "listing_summary_on_insert_home"),
+    ("listing_summary_home_update", "home", "UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows",
+     "listing_summary_on_update_home"),
+    ("listing_summary_options_insert", "options", "INSERT", "NEW TABLE AS new_rows", "listing_summary_on_insert_child"),
+    ("listing_summary_options_update", "options", "UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows",
+     "listing_summary_on_update_options"),
+    ("listing_summary_options_delete", "options", "DELETE", "OLD TABLE AS old_rows", "listing_summary_on_delete_child"),
+    ("listing_summary_photos_insert", "photos", "INSERT", "NEW TABLE AS new_rows", "listing_summary_on_insert_child"),
+    ("listing_summary_photos_update", "photos", "UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows",
+     "listing_summary_on_update_photos"),
+    ("listing_summary_photos_delete", "photos", "DELETE", "OLD TABLE AS old_rows", "listing_summary_on_delete_child"),
+]
+
+
+def _trigger_function(name: str, ids_query: str) -> str:
+    return f"""
+CREATE OR REPLACE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM listing_summary_refresh(ARRAY({ids_query}));
+    RETURN NULL;
+END
+$$
+"""
+
+
+def _backfill() -> None:
+    refresh = "SELECT listing_summary_refresh(ARRAY(SELECT id FROM home{where}))"
+    if op.get_context().as_sql:
+        op.execute(refresh.format(where=""))
+        return
+
+    bind = op.get_bind()
+    max_id = bind.execute(sa.text("SELECT coalesce(max(id), 0) FROM home")).scalar()
+    for start in range(0, max_id + 1, BATCH_SIZE):
+        with op.get_context().autocommit_block():
+            bind.execute(
+                sa.text(refresh.format(where=" WHERE id >= :start AND id < :end")),
+                {"start": start, "end": start + BATCH_SIZE},
+            )
+
+
+def upgrade() -> None:
+    op.create_table(
+        'listing_summary',
+        sa.Column('id', sa.Integer(), sa.ForeignKey('home.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('price', sa.String(), nullable=True),
+        sa.Column('price_value', sa.Numeric(14, 2), nullable=True),
+        sa.Column('description', sa.String(), nullable=True),
+        sa.Column('address', sa.String(), nullable=True),
+        sa.Column('type_of_transaction', sa.String(), nullable=True),
+        sa.Column('type_of_housing', sa.String(), nullable=True),
+        sa.Column('latitude', sa.Float(), nullable=True),
+        sa.Column('longitude', sa.Float(), nullable=True),
+        sa.Column('geohash', sa.String(length=12, collation='C'), nullable=True),
+        sa.Column('rooms', sa.Integer(), nullable=True),
+        sa.Column('square_value', sa.Numeric(10, 2), nullable=True),
+        sa.Column('cover_photo', sa.String(), nullable=True),
+        sa.Column('photos', sa.JSON(), nullable=False, server_default='[]'),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+    )
+    op.execute(REFRESH_FUNCTION)
+    for name, ids_query in TRIGGER_FUNCTIONS.items():
+        op.execute(_trigger_function(name, ids_query))
+    # Триггеры до бэкфила: изменения во время миграции тоже попадут в сводку
+    for trigger, table, event, referencing, function in TRIGGERS:
+        op.execute(
+            f"CREATE TRIGGER {trigger} AFTER {event} ON {table} "
+            f"REFERENCING {referencing} FOR EACH STATEMENT EXECUTE FUNCTION {function}()"
+        )
+
+    _backfill()
+
+    # Таблица новая и ещё не используется приложением — индексы можно строить обычным способом
+    op.create_index('ix_listing_summary_transaction_housing_id', 'listing_summary',
+                    ['type_of_transaction', 'type_of_housing', 'id'])
+    op.create_index('ix_listing_summary_price_value', 'listing_summary', ['price_value'])
+    op.create_index('ix_listing_summary_rooms', 'listing_summary', ['rooms'])
+    op.create_index('ix_listing_summary_geohash', 'listing_summary', ['geohash'])
+    op.create_index('ix_listing_summary_user_id', 'listing_summary', ['user_id'])
+
+
+def downgrade() -> None:
+    for trigger, table, _, _, _ in reversed(TRIGGERS):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger} ON {table}")
+    for name in TRIGGER_FUNCTIONS:
+        op.execute(f"DROP FUNCTION IF EXISTS {name}()")
+    op.execute("DROP FUNCTION IF EXISTS listing_summary_refresh(integer[])")
+    op.drop_table('listing_summary')
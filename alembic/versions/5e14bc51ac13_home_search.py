@@ -0,0 +1,98 @@
+"""home full-text search
+
+Revision ID: 5e14bc51ac13
+Revises: 2efdb5a6bbe8
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e14bc51ac13'
+down_revision: Union[str, None] = '2efdb5a6bbe8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+
+# Вектор собирается в двух конфигурациях: russian — со стеммингом для обычных слов,
+# simple — без него, чтобы находились названия улиц, номера и аббревиатуры как есть.
+# Веса: название важнее адреса, адрес важнее описания.
+SEARCH_VECTOR_FUNCTION = """
+CREATE OR REPLACE FUNCTION home_search_vector(name text, address text, description text)
+RETURNS tsvector LANGUAGE sql IMMUTABLE AS $$
+    SELECT setweight(to_tsvector('russian'::regconfig, coalesce(name, '')), 'A')
+        || setweight(to_tsvector('simple'::regconfig, coalesce(name, '')), 'A')
+        || setweight(to_tsvector('russian'::regconfig, coalesce(address, '')), 'B')
+        || setweight(to_tsvector('simple'::regconfig, coalesce(address, '')), 'B')
+        || setweight(to_tsvector('russian'::regconfig, coalesce(description, '')), 'C')
+$$
+"""
+
+TRIGGER_FUNCTION = """
+CREATE OR REPLACE FUNCTION home_search_vector_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_vector := home_search_vector(NEW.name, NEW.address, NEW.description);
+    RETURN NEW;
+END
+$$
+"""
+
+TRIGGER = """
+CREATE TRIGGER home_search_vector_update
+BEFORE INSERT OR UPDATE OF name, address, description ON home
+FOR EACH ROW EXECUTE FUNCTION home_search_vector_trigger()
+"""
+
+BACKFILL = "UPDATE home SET search_vector = home_search_vector(name, address, description)"
+
+
+def _backfill() -> None:
+    if op.get_context().as_sql:
+        op.execute(BACKFILL)
+        return
+
+    bind = op.get_bind()
+    max_id = bind.execute(sa.text("SELECT coalesce(max(id), 0) FROM home")).scalar()
+    for start in range(0, max_id + 1, BATCH_SIZE):
+        with op.get_context().autocommit_block():
+            bind.execute(
+                sa.text(f"{BACKFILL} WHERE id >= :start AND id < :end"),
+                {"start": start, "end": start + BATCH_SIZE},
+            )
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.add_column('home', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.execute(SEARCH_VECTOR_FUNCTION)
+    op.execute(TRIGGER_FUNCTION)
+    # Триггер создаётся до бэкфила: строки, изменённые во время миграции, тоже получат вектор
+    op.execute(TRIGGER)
+
+    _backfill()
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_home_search_vector', 'home', ['search_vector'],
+            postgresql_using='gin', postgresql_concurrently=True,
+        )
+        # Нечёткий поиск по адресу (опечатки, неполный адрес) через оператор %
+        op.create_index(
+            'ix_home_address_trgm', 'home', ['address'],
+            postgresql_using='gin', postgresql_ops={'address': 'gin_trgm_ops'}, postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_home_address_trgm', table_name='home')
+    op.drop_index('ix_home_search_vector', table_name='home')
+    op.execute("DROP TRIGGER IF EXISTS home_search_vector_update ON home")
+    op.execute("DROP FUNCTION IF EXISTS home_search_vector_trigger()")
+    op.execute("DROP FUNCTION IF EXISTS home_search_vector(text, text, text)")
+    op.drop_column('home', 'search_vector')
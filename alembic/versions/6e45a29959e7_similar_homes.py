@@ -0,0 +1,35 @@
+"""similar homes
+
+Revision ID: 6e45a29959e7
+Revises: 122277ced8b1
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6e45a29959e7'
+down_revision: Union[str, None] = '122277ced8b1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Таблица заполняется лениво при первом запросе и пересчитывается при изменении объявлений
+    op.create_table(
+        'similar_homes',
+        sa.Column('home_id', sa.Integer(), sa.ForeignKey('home.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('similar_id', sa.Integer(), sa.ForeignKey('home.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('home_id', 'similar_id'),
+    )
+    op.create_index('ix_similar_homes_similar_id', 'similar_homes', ['similar_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_similar_homes_similar_id', table_name='similar_homes')
+    op.drop_table('similar_homes')
@@ -0,0 +1,37 @@
+"""home geocode status
+
+Revision ID: 79a86cd8c380
+Revises: de11cd0e1c7f
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '79a86cd8c380'
+down_revision: Union[str, None] = 'de11cd0e1c7f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('home', sa.Column('geocode_status', sa.String(length=16), nullable=False, server_default='pending'))
+    op.add_column('home', sa.Column('geocode_attempts', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('home', sa.Column('geocode_next_attempt_at', sa.DateTime(), nullable=True))
+    # Уже геокодированные объявления в очередь не попадают; остальные догеокодирует воркер
+    op.execute("UPDATE home SET geocode_status = 'done' WHERE latitude IS NOT NULL AND longitude IS NOT NULL")
+    op.create_index(
+        'ix_home_geocode_pending', 'home', ['geocode_next_attempt_at', 'id'],
+        postgresql_where=sa.text("geocode_status = 'pending'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_home_geocode_pending', table_name='home')
+    op.drop_column('home', 'geocode_next_attempt_at')
+    op.drop_column('home', 'geocode_attempts')
+    op.drop_column('home', 'geocode_status')
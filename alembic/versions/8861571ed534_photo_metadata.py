@@ -0,0 +1,41 @@
+"""photo metadata
+
+Revision ID: 8861571ed534
+Revises: 79a86cd8c380
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8861571ed534'
+down_revision: Union[str, None] = '79a86cd8c380'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('photos', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.add_column('photos', sa.Column('width', sa.Integer(), nullable=True))
+    op.add_column('photos', sa.Column('height', sa.Integer(), nullable=True))
+    op.add_column('photos', sa.Column('size_bytes', sa.Integer(), nullable=True))
+    op.add_column('photos', sa.Column('mime_type', sa.String(length=32), nullable=True))
+    op.add_column('photos', sa.Column('variants', sa.JSON(), nullable=True, server_default='[]'))
+    op.add_column('photos', sa.Column('status', sa.String(length=16), nullable=False, server_default='ok'))
+    # Для существующих фото метаданные заполнит первая сверка (checked_at IS NULL)
+    op.add_column('photos', sa.Column('checked_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('photos', 'checked_at')
+    op.drop_column('photos', 'status')
+    op.drop_column('photos', 'variants')
+    op.drop_column('photos', 'mime_type')
+    op.drop_column('photos', 'size_bytes')
+    op.drop_column('photos', 'height')
+    op.drop_column('photos', 'width')
+    op.drop_column('photos', 'content_hash')
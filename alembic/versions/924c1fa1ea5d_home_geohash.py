@@ -0,0 +1,80 @@
+"""home geohash
+
+Revision ID: 924c1fa1ea5d
+Revises: 6e45a29959e7
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '924c1fa1ea5d'
+down_revision: Union[str, None] = '6e45a29959e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+
+# Замороженная копия app.operations.geo.encode_geohash на момент миграции:
+# миграция не зависит от кода и настроек приложения
+GEOHASH_PRECISION = 9
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode_geohash(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def upgrade() -> None:
+    # Collation "C": побайтовое сравнение, чтобы префиксный поиск шёл диапазоном по B-tree
+    op.add_column('home', sa.Column('geohash', sa.String(length=12, collation='C'), nullable=True))
+
+    # Geohash считается в Python тем же алгоритмом, что и на запись; в offline-режиме
+    # бэкфил пропускается — строки без geohash просто не попадут в выдачу по карте
+    if not op.get_context().as_sql:
+        bind = op.get_bind()
+        last_id = 0
+        while True:
+            rows = bind.execute(
+                sa.text(
+                    "SELECT id, latitude, longitude FROM home "
+                    "WHERE id > :last_id AND latitude IS NOT NULL AND longitude IS NOT NULL "
+                    "ORDER BY id LIMIT :limit"
+                ),
+                {"last_id": last_id, "limit": BATCH_SIZE},
+            ).all()
+            if not rows:
+                break
+            bind.execute(
+                sa.text("UPDATE home SET geohash = :geohash WHERE id = :id"),
+                [{"id": row.id, "geohash": encode_geohash(row.latitude, row.longitude)} for row in rows],
+            )
+            last_id = rows[-1].id
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_home_geohash', 'home', ['geohash'], postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_home_geohash', table_name='home')
+    op.drop_column('home', 'geohash')
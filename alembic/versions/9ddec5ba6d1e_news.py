@@ -0,0 +1,38 @@
+"""news table
+
+Revision ID: 9ddec5ba6d1e
+Revises: 3020670498a8
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9ddec5ba6d1e'
+down_revision: Union[str, None] = '3020670498a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'news',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('url', sa.String(), nullable=False),
+        sa.Column('title', sa.String(), nullable=True),
+        sa.Column('image_url', sa.String(), nullable=True),
+        sa.Column('views', sa.String(), nullable=True),
+        sa.Column('date', sa.String(), nullable=True),
+        sa.Column('content', sa.String(), nullable=True),
+        sa.Column('first_seen_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.UniqueConstraint('url', name='news_url_key'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('news')
@@ -0,0 +1,81 @@
+"""visit analytics rollups
+
+Revision ID: bca84b26a9ed
+Revises: 9ddec5ba6d1e
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'bca84b26a9ed'
+down_revision: Union[str, None] = '9ddec5ba6d1e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Сроки хранения строк "пользователь за день/час" на момент миграции
+USER_DAYS_RETENTION = 90
+USER_HOURS_RETENTION = 14
+
+
+def upgrade() -> None:
+    op.create_table(
+        'visit_user_days',
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('user_id', sa.String(), primary_key=True),
+        sa.Column('visits', sa.Integer(), nullable=False),
+    )
+    op.create_table(
+        'visit_user_hours',
+        sa.Column('hour', sa.DateTime(), primary_key=True),
+        sa.Column('user_id', sa.String(), primary_key=True),
+        sa.Column('visits', sa.Integer(), nullable=False),
+    )
+    op.create_table(
+        'visit_days',
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('visits', sa.BigInteger(), nullable=False),
+        sa.Column('uniques', sa.Integer(), nullable=False),
+    )
+    op.create_table(
+        'visit_hours',
+        sa.Column('hour', sa.DateTime(), primary_key=True),
+        sa.Column('visits', sa.BigInteger(), nullable=False),
+        sa.Column('uniques', sa.Integer(), nullable=False),
+    )
+
+    # Однократный проход по накопленным визитам; дальше агрегаты пополняются пачками при записи.
+    # Итоги — за всю историю, строки пользователей — только за их срок хранения
+    # (USER_ROLLUP_RETENTION в app.operations.visit_analytics)
+    op.execute(
+        "INSERT INTO visit_days (day, visits, uniques) "
+        "SELECT visit_time::date, count(*), count(DISTINCT user_id) FROM visits "
+        "WHERE visit_time IS NOT NULL AND user_id IS NOT NULL GROUP BY 1"
+    )
+    op.execute(
+        "INSERT INTO visit_hours (hour, visits, uniques) "
+        "SELECT date_trunc('hour', visit_time), count(*), count(DISTINCT user_id) FROM visits "
+        "WHERE visit_time IS NOT NULL AND user_id IS NOT NULL GROUP BY 1"
+    )
+    op.execute(
+        "INSERT INTO visit_user_days (day, user_id, visits) "
+        "SELECT visit_time::date, user_id, count(*) FROM visits "
+        f"WHERE visit_time >= current_date - {USER_DAYS_RETENTION} AND user_id IS NOT NULL GROUP BY 1, 2"
+    )
+    op.execute(
+        "INSERT INTO visit_user_hours (hour, user_id, visits) "
+        "SELECT date_trunc('hour', visit_time), user_id, count(*) FROM visits "
+        f"WHERE visit_time >= date_trunc('hour', now() at time zone 'utc') - interval '{USER_HOURS_RETENTION} days' "
+        "AND user_id IS NOT NULL GROUP BY 1, 2"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('visit_hours')
+    op.drop_table('visit_days')
+    op.drop_table('visit_user_hours')
+    op.drop_table('visit_user_days')
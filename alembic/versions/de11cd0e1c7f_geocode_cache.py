@@ -0,0 +1,37 @@
+"""geocode cache
+
+Revision ID: de11cd0e1c7f
+Revises: 924c1fa1ea5d
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'de11cd0e1c7f'
+down_revision: Union[str, None] = '924c1fa1ea5d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'geocode_cache',
+        sa.Column('address_key', sa.String(), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=True),
+        sa.Column('longitude', sa.Float(), nullable=True),
+        sa.Column('found', sa.Boolean(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('address_key'),
+    )
+    op.create_index('ix_geocode_cache_expires_at', 'geocode_cache', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_geocode_cache_expires_at', table_name='geocode_cache')
+    op.drop_table('geocode_cache')
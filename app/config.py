@@ -16,5 +16,59 @@ DOCKER_PORT = os.environ.get("DOCKER_PORT", 5432)
 SECRET_AUTH = os.environ.get("SECRET_AUTH")
 PHOTO_DIR = Path("uploads/photos")
 
+# Ленты объявлений собираются в JSON на стороне Postgres (app.operations.listings); "0" — через ORM
+LISTING_SQL_JSON = os.environ.get("LISTING_SQL_JSON", "1") == "1"
+
+# Загрузка фотографий (app.operations.uploads)
+MAX_PHOTO_SIZE = int(os.environ.get("MAX_PHOTO_SIZE_MB", 15)) * 1024 * 1024
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", 4))
+# Процессы для генерации превью (app.operations.images)
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+# Если фронтовой nginx раздаёт файлы сам, укажите internal location, например "/protected-uploads/photos/"
+PHOTO_ACCEL_REDIRECT_PREFIX = os.environ.get("PHOTO_ACCEL_REDIRECT_PREFIX", "")
+# Периодическая сверка записей о фото с файлами на диске (app.operations.photo_manifest)
+PHOTO_RECONCILE_ENABLED = os.environ.get("PHOTO_RECONCILE_ENABLED", "1") == "1"
+PHOTO_RECONCILE_INTERVAL_MINUTES = int(os.environ.get("PHOTO_RECONCILE_INTERVAL_MINUTES", 60))
+# Файлы без записи в БД только логируются; удалять их — только явно
+PHOTO_RECONCILE_DELETE_ORPHANS = os.environ.get("PHOTO_RECONCILE_DELETE_ORPHANS", "0") == "1"
+
+# Геокодер: "yandex" в проде, "stub" — локальная заглушка для тестов и бенчмарков
+GEOCODER_BACKEND = os.environ.get("GEOCODER_BACKEND", "yandex")
+YANDEX_API_KEY = os.environ.get("YANDEX_API_KEY", "dad88f6c-dba8-4a6b-8a3f-c08810043cb8")
+GEOCODE_CACHE_TTL_DAYS = int(os.environ.get("GEOCODE_CACHE_TTL_DAYS", 90))
+GEOCODE_NEGATIVE_TTL_HOURS = int(os.environ.get("GEOCODE_NEGATIVE_TTL_HOURS", 24))
+
+# Фоновое геокодирование объявлений (app.operations.geocode_worker)
+GEOCODE_WORKER_ENABLED = os.environ.get("GEOCODE_WORKER_ENABLED", "1") == "1"
+GEOCODE_CONCURRENCY = int(os.environ.get("GEOCODE_CONCURRENCY", 4))
+GEOCODE_RATE_PER_SECOND = float(os.environ.get("GEOCODE_RATE_PER_SECOND", 5))
+
+# Загрузка новостей (app.operations.news): URL страницы или file:///путь/к/сохранённой/странице.html
+NEWS_SOURCE = os.environ.get("NEWS_SOURCE", "https://realt.by/news/")
+NEWS_INGEST_ENABLED = os.environ.get("NEWS_INGEST_ENABLED", "1") == "1"
+NEWS_REFRESH_MINUTES = int(os.environ.get("NEWS_REFRESH_MINUTES", 15))
+
+# Приём визитов (app.operations.visits): пачки в БД и пересылка в сервис статистики на Spring Boot
+SPRING_BOOT_API_URL = os.environ.get("SPRING_BOOT_API_URL", "http://localhost:5050/api/record-visit")
+# Если у сервиса есть приём списком визитов — пересылка одним POST на пачку
+VISIT_FORWARD_BATCH_URL = os.environ.get("VISIT_FORWARD_BATCH_URL", "")
+VISIT_FORWARD_ENABLED = os.environ.get("VISIT_FORWARD_ENABLED", "1") == "1"
+VISIT_FLUSH_MS = int(os.environ.get("VISIT_FLUSH_MS", 500))
+VISIT_BATCH_SIZE = int(os.environ.get("VISIT_BATCH_SIZE", 1000))
+VISIT_QUEUE_SIZE = int(os.environ.get("VISIT_QUEUE_SIZE", 100000))
+# Пачки, которые не удалось записать или переслать, ждут повтора здесь
+VISIT_SPILL_DIR = Path(os.environ.get("VISIT_SPILL_DIR", "spool/visits"))
+
+# Дневные секции visits (app.operations.visit_partitions): срок хранения сырых визитов и запас вперёд
+VISIT_RETENTION_DAYS = int(os.environ.get("VISIT_RETENTION_DAYS", 90))
+VISIT_PARTITION_PREMAKE_DAYS = int(os.environ.get("VISIT_PARTITION_PREMAKE_DAYS", 7))
+VISIT_PARTITION_MAINTENANCE_ENABLED = os.environ.get("VISIT_PARTITION_MAINTENANCE_ENABLED", "1") == "1"
+VISIT_PARTITION_MAINTENANCE_MINUTES = int(os.environ.get("VISIT_PARTITION_MAINTENANCE_MINUTES", 60))
+
+# Счётчики популярности (app.operations.popularity): буфер в памяти воркера сбрасывается в БД пачкой
+POPULARITY_FLUSH_SECONDS = float(os.environ.get("POPULARITY_FLUSH_SECONDS", 10))
+# Период полураспада рейтинга /trending; рейтинг хранится в шкале этого периода, на живой базе его не меняют
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get("TRENDING_HALF_LIFE_HOURS", 24))
+
 if not SECRET_AUTH:
     raise ValueError("SECRET_AUTH is not defined in the environment variables.")
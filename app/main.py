@@ -1,16 +1,56 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Depends
 from fastapi_users import FastAPIUsers
 
 from app.shemas.users import UserRead, UserCreate, BaseUser, UserUpdate
 
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.staticfiles import StaticFiles
 from app.router.router import router as router_operation, router
 from app.auth.base_config import auth_backend
 from app.auth.manager import get_user_manager
 from app.models import users
+from app.config import GEOCODE_WORKER_ENABLED, PHOTO_DIR, PHOTO_RECONCILE_ENABLED, NEWS_INGEST_ENABLED, \
+    VISIT_PARTITION_MAINTENANCE_ENABLED
+from app.operations.geocode_worker import geocode_worker
+from app.operations.photo_manifest import photo_reconciler
+from app.operations.popularity import popularity_counters
+from app.operations.news import news_ingestor
+from app.operations.visits import visit_pipeline
+from app.operations.visit_partitions import visit_partition_maintainer
+from app.operations.images import shutdown_executor
+from app.operations.http_clients import http_clients
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Фоновые воркеры живут столько же, сколько приложение
+    if GEOCODE_WORKER_ENABLED:
+        await geocode_worker.start()
+    if PHOTO_RECONCILE_ENABLED:
+        await photo_reconciler.start()
+    if NEWS_INGEST_ENABLED:
+        await news_ingestor.start()
+    if VISIT_PARTITION_MAINTENANCE_ENABLED:
+        await visit_partition_maintainer.start()
+    await popularity_counters.start()
+    await visit_pipeline.start()
+    yield
+    await visit_pipeline.stop()
+    await visit_partition_maintainer.stop()
+    await news_ingestor.stop()
+    await popularity_counters.stop()
+    await geocode_worker.stop()
+    await photo_reconciler.stop()
+    # Клиенты внешних сервисов закрываются последними: воркеры выше могли ими пользоваться
+    await http_clients.aclose()
+    shutdown_executor()
+
 
 app = FastAPI(
-    title="Flats"
+    title="Flats",
+    lifespan=lifespan,
 )
 
 
@@ -41,6 +81,10 @@ app.include_router(
 
 
 app.include_router(router_operation)
+
+# Каталог загрузок относительно рабочей директории (раньше был абсолютный путь Windows);
+# для кэшируемой отдачи фото используйте /operations/photos/{name}
+app.mount("/uploads", StaticFiles(directory=PHOTO_DIR.parent, check_dir=False), name="uploads")
 # app.include_router(users.router)
 
 
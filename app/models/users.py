@@ -1,8 +1,10 @@
 from datetime import datetime
 
 from pydantic import BaseModel
-from sqlalchemy import MetaData, Table, Column, Integer, String, TIMESTAMP, ForeignKey, JSON, Boolean, Float, DateTime
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import MetaData, Table, Column, Integer, String, TIMESTAMP, ForeignKey, JSON, Boolean, Float, DateTime, Index, \
+    Numeric, BigInteger, Date, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import declarative_base, relationship, deferred
 
 from app.shemas.users import BaseUser, BaseUserWithRole
 
@@ -46,15 +48,26 @@ class Home(Base):
     __tablename__ = "home"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey("user.id"))
+    user_id = Column(Integer, ForeignKey("user.id"), index=True)
     name = Column(String)
     price = Column(String)
+    price_value = Column(Numeric(14, 2), index=True)  # Цена числом (заполняется из price)
     type_of_transaction = Column(String)
     type_of_housing = Column(String)
     description = Column(String)
     latitude = Column(Float, nullable=True)
     longitude = Column(Float, nullable=True)
+    geohash = Column(String(12, collation="C"), nullable=True)  # Geohash точки для поиска по карте (app.operations.geo)
+    # Состояние фонового геокодирования: pending -> done | failed (app.operations.geocode_worker)
+    geocode_status = Column(String(16), nullable=False, default="pending", server_default="pending")
+    geocode_attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    geocode_next_attempt_at = Column(DateTime, nullable=True)
     address = Column(String)
+    # Время последнего изменения — водяной знак для инкрементальной выгрузки (app.operations.export)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                        server_default=text("(now() at time zone 'utc')"))
+    # Полнотекстовый вектор по названию, адресу и описанию; заполняется триггером в БД
+    search_vector = deferred(Column(TSVECTOR, nullable=True))
     # Связь с фотографиями
     photos = relationship("Photo", back_populates="home")
     options = relationship("Options", uselist=False, back_populates="home")
@@ -63,12 +76,26 @@ class Home(Base):
     # Связь с пользователями, которые добавили этот объект в избранное
     favorited_by = relationship("User", secondary="user_favorites", back_populates="favorites")
 
+    # Индекс под фильтры ленты и keyset-пагинацию по id
+    __table_args__ = (
+        Index("ix_home_transaction_housing_id", "type_of_transaction", "type_of_housing", "id"),
+        Index("ix_home_geohash", "geohash"),
+        Index("ix_home_updated_at_id", "updated_at", "id"),
+        Index("ix_home_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_home_address_trgm", "address", postgresql_using="gin", postgresql_ops={"address": "gin_trgm_ops"}),
+        # Очередь геокодирования: маленький частичный индекс только по ожидающим строкам
+        Index(
+            "ix_home_geocode_pending", "geocode_next_attempt_at", "id",
+            postgresql_where=text("geocode_status = 'pending'"),
+        ),
+    )
+
 
 class Options(Base):
     __tablename__ = "options"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    home_id = Column(Integer, ForeignKey("home.id"))
+    home_id = Column(Integer, ForeignKey("home.id"), index=True)
     numbers_of_room = Column(String)
     square = Column(String)
     year_of_construction = Column(String)
@@ -77,6 +104,14 @@ class Options(Base):
     balcony = Column(String)
     internet = Column(String)
     elevator = Column(String)
+
+    # Числовые копии строковых полей — для диапазонных запросов по индексам
+    numbers_of_room_value = Column(Integer, index=True)
+    square_value = Column(Numeric(10, 2), index=True)
+    year_of_construction_value = Column(Integer)
+    floor_value = Column(Integer)
+    ceiling_height_value = Column(Numeric(6, 2))
+
     home = relationship("Home", back_populates="options")
 
 
@@ -84,27 +119,166 @@ class Photo(Base):
     __tablename__ = "photos"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    home_id = Column(Integer, ForeignKey("home.id"))
+    home_id = Column(Integer, ForeignKey("home.id"), index=True)
     photo = Column(String)
+    # Метаданные файла записываются при загрузке, чтобы не обращаться к диску при выдаче списков
+    content_hash = Column(String(64))
+    width = Column(Integer)
+    height = Column(Integer)
+    size_bytes = Column(Integer)
+    mime_type = Column(String(32))
+    variants = Column(JSON, default=list, server_default="[]")  # Готовые превью: ["thumb", "card", ...]
+    # ok | missing — выставляет сверка с диском (app.operations.photo_manifest)
+    status = Column(String(16), default="ok", server_default="ok", nullable=False)
+    checked_at = Column(DateTime)
 
     home = relationship("Home", back_populates="photos")
 
 
+class SimilarHome(Base):
+    # Предрасчитанные соседи объявления (top-K по взвешенному расстоянию, меньше — ближе)
+    __tablename__ = "similar_homes"
+
+    home_id = Column(Integer, ForeignKey("home.id", ondelete="CASCADE"), primary_key=True)
+    similar_id = Column(Integer, ForeignKey("home.id", ondelete="CASCADE"), primary_key=True, index=True)
+    score = Column(Float, nullable=False)
+
+
+class GeocodeCacheEntry(Base):
+    # Кэш геокодера по нормализованному адресу; found=False — адрес не найден (негативный кэш)
+    __tablename__ = "geocode_cache"
+
+    address_key = Column(String, primary_key=True)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    found = Column(Boolean, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ListingSummary(Base):
+    # Денормализованная карточка объявления для лент и карты: одна узкая таблица без JOIN.
+    # Поддерживается триггерами на home, options и photos (миграция 4fe558b5e77b)
+    __tablename__ = "listing_summary"
+
+    id = Column(Integer, ForeignKey("home.id", ondelete="CASCADE"), primary_key=True)  # id объявления
+    user_id = Column(Integer)
+    name = Column(String)
+    price = Column(String)
+    price_value = Column(Numeric(14, 2))
+    description = Column(String)
+    address = Column(String)
+    type_of_transaction = Column(String)
+    type_of_housing = Column(String)
+    latitude = Column(Float)
+    longitude = Column(Float)
+    geohash = Column(String(12, collation="C"))
+    rooms = Column(Integer)
+    square_value = Column(Numeric(10, 2))
+    cover_photo = Column(String)
+    photos = Column(JSON, nullable=False, server_default="[]")  # Имена всех фото в порядке загрузки
+    updated_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_listing_summary_transaction_housing_id", "type_of_transaction", "type_of_housing", "id"),
+        Index("ix_listing_summary_price_value", "price_value"),
+        Index("ix_listing_summary_rooms", "rooms"),
+        Index("ix_listing_summary_geohash", "geohash"),
+        Index("ix_listing_summary_user_id", "user_id"),
+    )
+
+
+class HomeStats(Base):
+    # Счётчики популярности объявления. Пишутся только пачками из буфера app.operations.popularity,
+    # а не инкрементом на каждый просмотр, поэтому строка не становится "горячей".
+    # Пустую строку для нового объявления заводит триггер home_stats_home_insert
+    __tablename__ = "home_stats"
+
+    home_id = Column(Integer, ForeignKey("home.id", ondelete="CASCADE"), primary_key=True)
+    views_count = Column(BigInteger, nullable=False, server_default="0")
+    favorites_count = Column(Integer, nullable=False, server_default="0")
+    # ln(Σ вес·e^(λ·часы от эпохи)): затухающий рейтинг без периодического пересчёта строк
+    trending_log = Column(Float)
+    updated_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_home_stats_popular", favorites_count.desc(), views_count.desc(), home_id.desc()),
+        Index("ix_home_stats_trending_log", trending_log.desc().nulls_last()),
+    )
+
+
 class FavoritesHome(Base):
     __tablename__ = "user_favorites"
     user_id = Column(Integer, ForeignKey("user.id"), primary_key=True)  # Исправление внешнего ключа
     home_id = Column(Integer, ForeignKey("home.id"), primary_key=True)  # Исправление внешнего ключа
 
 
+class News(Base):
+    # Новости realt.by, собранные фоновым загрузчиком app.operations.news; url — ключ дедупликации
+    __tablename__ = "news"
+
+    id = Column(Integer, primary_key=True)
+    url = Column(String, nullable=False, unique=True)
+    title = Column(String)
+    image_url = Column(String)
+    views = Column(String)
+    date = Column(String)  # Дата как на сайте
+    content = Column(String)
+    first_seen_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
 class Visit(Base):
+    # Секционирована по дням visit_time (миграция 3e30986a6c37); секции создаёт и удаляет
+    # app.operations.visit_partitions, поэтому visit_time входит в первичный ключ
     __tablename__ = "visits"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(String, index=True)  # ID пользователя
-    visit_time = Column(DateTime, default=datetime.utcnow)  # Время визита
+    visit_time = Column(DateTime, primary_key=True, default=datetime.utcnow)  # Время визита
+
+    __table_args__ = (
+        Index("ix_visits_visit_time_brin", "visit_time", postgresql_using="brin"),
+        {"postgresql_partition_by": "RANGE (visit_time)"},
+    )
 
 
     # Модель SQLAlchemy для отзыва
+# Агрегаты визитов для аналитики (app.operations.visit_analytics). Обновляются в той же транзакции,
+# что и пачка визитов, поэтому отчёты не читают сырую таблицу visits
+
+class VisitUserDay(Base):
+    __tablename__ = "visit_user_days"
+
+    day = Column(Date, primary_key=True)
+    user_id = Column(String, primary_key=True)
+    visits = Column(Integer, nullable=False)
+
+
+class VisitUserHour(Base):
+    __tablename__ = "visit_user_hours"
+
+    hour = Column(DateTime, primary_key=True)
+    user_id = Column(String, primary_key=True)
+    visits = Column(Integer, nullable=False)
+
+
+class VisitDay(Base):
+    __tablename__ = "visit_days"
+
+    day = Column(Date, primary_key=True)
+    visits = Column(BigInteger, nullable=False)
+    uniques = Column(Integer, nullable=False)  # Разных user_id за день
+
+
+class VisitHour(Base):
+    __tablename__ = "visit_hours"
+
+    hour = Column(DateTime, primary_key=True)
+    visits = Column(BigInteger, nullable=False)
+    uniques = Column(Integer, nullable=False)
+
+
 class ReviewModel(Base):
     __tablename__ = "reviews"
 
@@ -0,0 +1,278 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import re
+import zipfile
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import islice
+from types import SimpleNamespace
+from typing import BinaryIO, Iterator, Optional
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import MAX_PHOTO_SIZE
+from app.models.users import Home, Options, Photo
+from app.operations.geo import geohash_or_none
+from app.operations.numeric import apply_numeric_fields
+from app.operations.uploads import StoredPhoto, store_bytes, remove_photos, release_photos
+from app.shemas.schemas import ImportRow
+
+logger = logging.getLogger(__name__)
+
+# Строк в одном multi-row INSERT ... RETURNING и в одной транзакции
+IMPORT_CHUNK_SIZE = 500
+# Больше ошибок в ответ не кладём, только считаем
+IMPORT_MAX_REPORTED_ERRORS = 1000
+
+_PHOTO_SEPARATOR_RE = re.compile(r"[;\s]+")
+
+
+@dataclass
+class ImportReport:
+    imported: int = 0
+    failed: int = 0
+    home_ids: list[int] = field(default_factory=list)
+    errors: list[dict] = field(default_factory=list)
+
+    def error(self, row_number: int, message: str):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "error": message})
+
+
+# Невалидные байты UTF-8 не прерывают чтение: surrogateescape превращает их в суррогаты,
+# и такая строка уходит в отчёт как ошибка, а остальные импортируются
+_UNDECODABLE_RE = re.compile("[\udc80-\udcff]")
+_DECODE_ERROR = "Row is not valid UTF-8"
+
+
+def _text(source: BinaryIO, **kwargs) -> io.TextIOWrapper:
+    return io.TextIOWrapper(source, encoding="utf-8-sig", errors="surrogateescape", **kwargs)
+
+
+def _iter_ndjson(source: BinaryIO) -> Iterator[tuple[int, dict | str]]:
+    # Построчное чтение: файл не загружается в память целиком
+    for number, line in enumerate(_text(source), start=1):
+        if not line.strip():
+            continue
+        if _UNDECODABLE_RE.search(line):
+            yield number, _DECODE_ERROR
+            continue
+        try:
+            yield number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield number, f"Invalid JSON: {e.msg}"
+
+
+def _iter_csv(source: BinaryIO) -> Iterator[tuple[int, dict | str]]:
+    reader = csv.DictReader(_text(source, newline=""))
+    number = 1  # Строка 1 — заголовок
+    while True:
+        number += 1
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            # Битая запись (например, слишком длинное поле) пропускается, чтение продолжается
+            yield number, f"Invalid CSV: {e}"
+            continue
+        if any(_UNDECODABLE_RE.search(text) for item in row.items() for text in item if isinstance(text, str)):
+            yield number, _DECODE_ERROR
+            continue
+        # Пустые ячейки — значения по умолчанию; фото перечисляются через пробел или ";"
+        row = {key: value for key, value in row.items() if key and value not in ("", None)}
+        if "photos" in row:
+            row["photos"] = [name for name in _PHOTO_SEPARATOR_RE.split(row["photos"]) if name]
+        yield number, row
+
+
+def _read_chunk(rows: Iterator, size: int) -> list:
+    return list(islice(rows, size))
+
+
+class PhotoArchive:
+    # Фото из ZIP сохраняются так же, как загруженные через форму (дедупликация по хэшу)
+    def __init__(self, source: Optional[BinaryIO]):
+        self._zip = zipfile.ZipFile(source) if source is not None else None
+        self._stored: dict[str, StoredPhoto] = {}
+
+    def store(self, name: str) -> StoredPhoto:
+        if name in self._stored:
+            return self._stored[name]
+        if self._zip is None:
+            raise ValueError(f"Photo {name} given but no photo archive uploaded")
+        try:
+            info = self._zip.getinfo(name)
+        except KeyError:
+            raise ValueError(f"Photo {name} not found in archive")
+        if info.file_size > MAX_PHOTO_SIZE:
+            raise ValueError(f"Photo {name} is too large")
+        try:
+            data = self._zip.read(info)
+        except (zipfile.BadZipFile, zlib.error, NotImplementedError, EOFError, RuntimeError) as e:
+            # Повреждённый элемент архива или неподдерживаемое сжатие/шифрование — ошибка строки, а не импорта
+            raise ValueError(f"Photo {name} cannot be read from archive: {e}")
+        try:
+            stored = store_bytes(data)
+        except HTTPException as e:
+            raise ValueError(f"Photo {name}: {e.detail}")
+        self._stored[name] = stored
+        return stored
+
+    def cleanup(self, used: set[str]):
+        # Удаляем созданные этим импортом файлы, которые не достались ни одной сохранённой строке,
+        # затем закрепляем файлы сохранённых строк (одинаковые фото под разными именами в архиве
+        # восстановятся из своей копии)
+        remove_photos([stored for stored in self._stored.values() if stored.name not in used])
+        release_photos([stored for stored in self._stored.values() if stored.name in used])
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+
+
+def _prepare(row: ImportRow, user_id: int, photos: list[StoredPhoto]) -> tuple[dict, dict, list[dict]]:
+    geocoded = row.latitude is not None and row.longitude is not None
+    home = SimpleNamespace(
+        user_id=user_id,
+        name=row.name,
+        price=row.price,
+        type_of_transaction=row.type_of_transaction,
+        type_of_housing=row.type_of_housing,
+        description=row.description,
+        address=row.address,
+        latitude=row.latitude if geocoded else None,
+        longitude=row.longitude if geocoded else None,
+        geohash=geohash_or_none(row.latitude, row.longitude) if geocoded else None,
+        # Без координат строку подхватит фоновый геокодер после импорта
+        geocode_status="done" if geocoded else "pending",
+        geocode_attempts=0,
+        updated_at=datetime.utcnow(),
+    )
+    options = SimpleNamespace(
+        numbers_of_room=row.number_of_rooms,
+        square=row.square,
+        year_of_construction=row.year_of_construction,
+        floor=row.floor,
+        ceiling_height=row.ceiling_height,
+        balcony=row.balcony,
+        internet=row.internet,
+        elevator=row.elevator,
+    )
+    apply_numeric_fields(home=home, options=options)
+    now = datetime.utcnow()
+    photo_rows = [
+        {
+            "photo": stored.name,
+            "content_hash": stored.content_hash,
+            "width": stored.width,
+            "height": stored.height,
+            "size_bytes": stored.size,
+            "mime_type": stored.mime_type,
+            "variants": [],
+            "status": "ok",
+            "checked_at": now,
+        }
+        for stored in photos
+    ]
+    return vars(home), vars(options), photo_rows
+
+
+async def _insert_rows(db: AsyncSession, prepared: list[tuple[dict, dict, list[dict]]]) -> list[int]:
+    # Один INSERT ... RETURNING на пачку домов; id возвращаются в порядке строк,
+    # затем опции и фото вставляются пачками с уже известными home_id
+    result = await db.execute(
+        insert(Home).returning(Home.id, sort_by_parameter_order=True),
+        [home for home, _, _ in prepared],
+    )
+    home_ids = list(result.scalars())
+
+    await db.execute(
+        insert(Options),
+        [{**options, "home_id": home_id} for home_id, (_, options, _) in zip(home_ids, prepared)],
+    )
+    photo_rows = [
+        {**photo, "home_id": home_id}
+        for home_id, (_, _, photos) in zip(home_ids, prepared)
+        for photo in photos
+    ]
+    if photo_rows:
+        await db.execute(insert(Photo), photo_rows)
+    return home_ids
+
+
+async def _insert_chunk(db: AsyncSession, chunk: list[tuple[int, tuple]], report: ImportReport) -> list[tuple]:
+    # Сначала вся пачка одним савепоинтом; если база её отвергла — построчно, чтобы найти виноватые строки.
+    # Возвращает тройки (строка, подготовленные данные, id дома) для вставленных строк
+    try:
+        async with db.begin_nested():
+            home_ids = await _insert_rows(db, [prepared for _, prepared in chunk])
+        return [(number, prepared, home_id) for (number, prepared), home_id in zip(chunk, home_ids)]
+    except Exception:
+        logger.warning("Import chunk rejected, retrying row by row", exc_info=True)
+
+    inserted = []
+    for number, prepared in chunk:
+        try:
+            async with db.begin_nested():
+                home_ids = await _insert_rows(db, [prepared])
+            inserted.append((number, prepared, home_ids[0]))
+        except Exception as e:
+            report.error(number, f"Database error: {e.__class__.__name__}")
+    return inserted
+
+
+async def import_listings(
+        db: AsyncSession,
+        source: BinaryIO,
+        fmt: str,
+        user_id: int,
+        archive: Optional[BinaryIO] = None,
+) -> ImportReport:
+    report = ImportReport()
+    rows = _iter_csv(source) if fmt == "csv" else _iter_ndjson(source)
+    try:
+        photos = await asyncio.to_thread(PhotoArchive, archive)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Photo archive is not a valid ZIP file")
+    used_photos = set()
+    try:
+        while raw_chunk := await asyncio.to_thread(_read_chunk, rows, IMPORT_CHUNK_SIZE):
+            chunk = []
+            for number, raw in raw_chunk:
+                if isinstance(raw, str):
+                    report.error(number, raw)
+                    continue
+                try:
+                    row = ImportRow.model_validate(raw)
+                    stored = [await asyncio.to_thread(photos.store, name) for name in row.photos]
+                except ValidationError as e:
+                    report.error(number, "; ".join(
+                        f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()
+                    ))
+                    continue
+                except ValueError as e:
+                    report.error(number, str(e))
+                    continue
+                chunk.append((number, _prepare(row, user_id, stored)))
+
+            if not chunk:
+                continue
+            inserted = await _insert_chunk(db, chunk, report)
+            # Каждая пачка фиксируется отдельно: длинный импорт не держит одну огромную транзакцию
+            await db.commit()
+            report.imported += len(inserted)
+            report.home_ids += [home_id for _, _, home_id in inserted]
+            used_photos.update(photo["photo"] for _, (_, _, photo_rows), _ in inserted for photo in photo_rows)
+    finally:
+        await asyncio.to_thread(photos.cleanup, used_photos)
+        photos.close()
+    return report
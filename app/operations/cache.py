@@ -0,0 +1,84 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    # LRU-кэш в памяти процесса с временем жизни записей.
+    # У каждого воркера uvicorn свой экземпляр, поэтому TTL ограничивает устаревание данных.
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float | None = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class InFlight:
+    # Одновременные промахи по одному ключу ждут одну общую задачу, а не запускают каждый свою.
+    # shield: отмена одного ожидающего не отменяет общую задачу для остальных
+    def __init__(self):
+        self._pending: dict = {}
+
+    async def run(self, key, start):
+        # start() вызывается только первым промахом и возвращает корутину или future
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(start())
+            self._pending[key] = future
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(future)
+
+
+# invalidate_listing сбрасывает записи только в том воркере, который обработал изменение:
+# остальные воркеры отдают старую карточку и старых соседей до истечения TTL.
+# Поэтому TTL ниже — это и есть допустимое устаревание после правки или удаления объявления.
+
+# Похожие объявления: home_id -> список карточек, отсортированных по близости; до 30 с устаревания
+similar_cache = TTLCache(maxsize=4096, ttl=30)
+# Карточка объявления: home_id -> (etag, готовое JSON-тело ответа); до 10 с устаревания
+detail_cache = TTLCache(maxsize=4096, ttl=10)
+
+# Счётчики фасетов ленты: ключ — набор фильтров; короткий TTL вместо точечной инвалидации
+facets_cache = TTLCache(maxsize=512, ttl=30)
+
+
+# Лента /trending: ключ — фильтры и размер; рейтинг меняется плавно, точечная инвалидация не нужна
+trending_cache = TTLCache(maxsize=256, ttl=60)
+
+
+# Страницы новостей: (cursor, limit) -> (items, next_cursor); сбрасывается загрузчиком новостей
+news_cache = TTLCache(maxsize=64, ttl=300)
+
+
+def invalidate_listing(*home_ids: int):
+    # Сбрасываем всё, что закэшировано по объявлению, после его изменения или удаления.
+    # Действует только в текущем воркере — в остальных записи доживают до конца TTL
+    for home_id in home_ids:
+        similar_cache.pop(home_id)
+        detail_cache.pop(home_id)
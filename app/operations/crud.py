@@ -1,14 +1,11 @@
+import asyncio
 from datetime import datetime, timedelta
 from typing import List
 
-import httpx
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
-from bs4 import BeautifulSoup
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from playwright.async_api import async_playwright
-from sqlalchemy import select, delete, update, text, cast, Numeric
+from sqlalchemy import select, delete, update, text, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from fastapi import HTTPException, Depends, Cookie
@@ -20,7 +17,10 @@ from decimal import Decimal
 
 import app.database
 from app.shemas.schemas import AddRealEstate
-from app.models.users import User, Home, Options
+from app.models.users import User, Home, Options, FavoritesHome
+from app.operations.numeric import to_decimal
+from app.operations import favorites, news
+from app.operations.geocoding import geocode_cache, GeocodingError
 from app.config import SECRET_AUTH
 from app.shemas import schemas
 from app.models import users
@@ -29,17 +29,11 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 ALGORITHM = "HS256"
 SECRET_KEY = SECRET_AUTH
-YANDEX_API_KEY = "dad88f6c-dba8-4a6b-8a3f-c08810043cb8"
 
 
 
-# Пример URL для парсинга новостей
-
-url = "https://realt.by/news/"
-
-
 async def find_similar_announcements_by_price(
-        announcement_id: int, db: AsyncSession, price_range_percentage: float = 10
+        announcement_id: int, db: AsyncSession, price_range_percentage: float = 10, limit: int = 20
 ):
     # Получаем объявление по ID
     stmt = select(Home).where(Home.id == announcement_id)
@@ -49,21 +43,22 @@ async def find_similar_announcements_by_price(
     if not announcement:
         return []
 
-    # Преобразуем цену из str в Decimal
-    try:
-        price = Decimal(announcement.price)  # Преобразуем строку в Decimal
-    except Exception as e:
-        # Если не удается преобразовать строку в число
-        raise ValueError(f"Ошибка при преобразовании цены: {e}")
+    # Цена уже хранится числом в price_value (см. app.operations.numeric)
+    price = announcement.price_value
+    if price is None:
+        return []
 
     # Определяем диапазон цен
     price_range_percentage_decimal = Decimal(price_range_percentage)  # Преобразуем в Decimal
     min_price = price * (1 - price_range_percentage_decimal / 100)
     max_price = price * (1 + price_range_percentage_decimal / 100)
 
-    # Приводим поле price к типу NUMERIC
-    stmt = select(Home).where(
-        cast(Home.price, Numeric).between(min_price, max_price), Home.id != announcement.id
+    # Диапазон по price_value обслуживается индексом ix_home_price_value
+    stmt = (
+        select(Home)
+        .where(Home.price_value.between(min_price, max_price), Home.id != announcement.id)
+        .order_by(func.abs(Home.price_value - price))  # Сначала самые близкие по цене
+        .limit(limit)
     )
     result = await db.execute(stmt)
 
@@ -91,62 +86,16 @@ async def create_review(db: AsyncSession, review: schemas.ReviewCreate):
 
 
 async def fetch_news():
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url)
-        response.raise_for_status()
-        return response.text
+    # Страница новостей из источника NEWS_SOURCE (сайт или сохранённый файл)
+    result = await news.news_ingestor.source.fetch()
+    return result.body.decode("utf-8", errors="replace")
 
 
 async def parse_news():
+    # Разбор lxml в потоке; ленту /news отдаёт таблица news, которую наполняет app.operations.news
     html_content = await fetch_news()
-    soup = BeautifulSoup(html_content, 'html.parser')
-    all_news = soup.findAll('div', class_='bd-item')
-
-    news_data = []
-
-    for news in all_news:
-        image_tag = news.find('img')
-        image_url = image_tag['src'] if image_tag else None
-
-        views_tag = news.find('span', class_='views')
-        views = views_tag.get_text(strip=True) if views_tag else None
-
-        title_tag = news.find('div', class_='title').find('a', class_='b12')
-        title = title_tag.get_text(strip=True) if title_tag else None
-
-        date_tag = news.find('span', class_='data')
-        date = date_tag.get_text(strip=True) if date_tag else None
-
-        content_tag = news.find('div', class_='bd-item-right-center-2')
-        content = content_tag.get_text(strip=True) if content_tag else None
-
-        news_data.append({
-            'image_url': image_url,
-            'views': views,
-            'title': title,
-            'date': date,
-            'content': content,
-        })
-
-    return news_data
-
-
-# scheduler = BackgroundScheduler()
-#
-# # Функция для очистки таблицы
-# def clear_visits(db: AsyncSession):
-#     now = datetime.now()
-#     # Очистка записей, например, старше 30 дней
-#     threshold_date = now - timedelta(days=30)
-#     db.query(models.Visits).filter(models.Visits.created_at < threshold_date).delete()
-#     db.commit()
-#     print(f"Visits table cleared up to {threshold_date}")
-#
-# # Настройка задачи на очистку через 30 минут (можно настроить под свои нужды)
-# scheduler.add_job(clear_visits,
-#                   IntervalTrigger(minutes=30),  # Интервал в минутах
-#                   args=[database.SessionLocal])  # Передаем сессию базы данных
-#
+    return await asyncio.to_thread(news.parse_news_html, html_content, news.news_ingestor.source.base_url)
+
 
 async def update_item(db: AsyncSession, item_id: int, updated_data: AddRealEstate):
     result = await db.execute(select(Home).where(Home.id == item_id))
@@ -155,6 +104,10 @@ async def update_item(db: AsyncSession, item_id: int, updated_data: AddRealEstat
         raise HTTPException(status_code=404, detail="Item not found")
 
     updated_values = updated_data.dict(exclude_unset=True)
+    if "price" in updated_values:
+        updated_values["price_value"] = to_decimal(updated_values["price"])
+    # Явно, а не через onupdate: правка должна попасть в инкрементальную выгрузку даже без изменений в home
+    updated_values["updated_at"] = datetime.utcnow()
 
     await db.execute(update(Home).where(Home.id == item_id).values(**updated_values))
     await db.commit()
@@ -218,71 +171,31 @@ def verify_token(token: str = Depends(oauth2_scheme)):
 
 #     Добавление объекта в избранное:
 async def add_to_favorites(user_id: int, home_id: int, db: AsyncSession):
-    result = await db.execute(select(User).options(joinedload(User.favorites)).filter(User.id == user_id))
-    user = result.scalar_one_or_none()
-
-    if not user:
-        raise ValueError("User not found")
-
-    result = await db.execute(select(Home).filter(Home.id == home_id))
-    home = result.scalar_one_or_none()
-
-    if not home:
+    # Без загрузки всей коллекции User.favorites: один INSERT ... ON CONFLICT DO NOTHING
+    try:
+        await favorites.add_favorite(db, user_id, home_id)
+    except favorites.HomeNotFound:
         raise ValueError("Home not found")
 
-    if home not in user.favorites:
-        user.favorites.append(home)
-        await db.commit()
-
 
 # удаление из избранных
 async def remove_from_favorites(user_id: int, home_id: int, db: AsyncSession):
-    result = await db.execute(select(User).options(joinedload(User.favorites)).filter(User.id == user_id))
-    user = result.scalar_one_or_none()
-
-    if not user:
-        raise ValueError("User not found")
-
-    result = await db.execute(select(Home).filter(Home.id == home_id))
-    home = result.scalar_one_or_none()
-
-    if not home:
-        raise ValueError("Home not found")
-
-    if home in user.favorites:
-        user.favorites.remove(home)
-        await db.commit()
+    await favorites.remove_favorite(db, user_id, home_id)
 
 
 async def get_user_favorites(user_id: int, db: AsyncSession):
-    result = await db.execute(select(User).options(joinedload(User.favorites)).filter(User.id == user_id))
-    user = result.scalar_one_or_none()
-
-    if not user:
-        raise ValueError("User not found")
-
-    return user.favorites
+    result = await db.execute(
+        select(Home).join(FavoritesHome, FavoritesHome.home_id == Home.id).where(FavoritesHome.user_id == user_id)
+    )
+    return result.scalars().all()
 
 
 async def get_coordinates(address: str):
-    base_url = "https://geocode-maps.yandex.ru/1.x/"
-    params = {
-        "apikey": YANDEX_API_KEY,
-        "geocode": address,
-        "format": "json"
-    }
-    async with httpx.AsyncClient() as client:
-        response = await client.get(base_url, params=params)
-        if response.status_code == 200:
-            geo_data = response.json()
-            pos = (
-                geo_data["response"]["GeoObjectCollection"]["featureMember"][0]
-                ["GeoObject"]["Point"]["pos"]
-            )
-            lon, lat = map(float, pos.split())  # Координаты объекта
-            return lat, lon
-        else:
-            raise Exception(f"Error fetching coordinates: {response.status_code}")
+    # Координаты берутся через кэш геокодера (app.operations.geocoding)
+    coordinates = await geocode_cache.lookup(address)
+    if coordinates is None:
+        raise GeocodingError(f"Address not found: {address}")
+    return coordinates  # (lat, lon)
 
 
 async def get_options_by_home_id(home_id: int, db: AsyncSession):
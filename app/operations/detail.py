@@ -0,0 +1,78 @@
+import hashlib
+import json
+from typing import Optional
+
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.users import Home, Options, Photo
+from app.operations.cache import detail_cache
+
+OPTION_FIELDS = (
+    "numbers_of_room",
+    "square",
+    "year_of_construction",
+    "floor",
+    "ceiling_height",
+    "balcony",
+    "internet",
+    "elevator",
+)
+
+HOME_FIELDS = (
+    "id",
+    "user_id",
+    "name",
+    "price",
+    "description",
+    "latitude",
+    "longitude",
+    "address",
+    "type_of_transaction",
+    "type_of_housing",
+)
+
+
+async def load_item(db: AsyncSession, home_id: int) -> Optional[dict]:
+    # Объявление, опции и имена фото одним запросом: LEFT JOIN опций и подзапрос с array_agg по фото
+    photos = (
+        select(func.array_agg(aggregate_order_by(Photo.photo, Photo.id)))
+        .where(Photo.home_id == Home.id)
+        .scalar_subquery()
+    )
+    stmt = (
+        select(
+            *(getattr(Home, field) for field in HOME_FIELDS),
+            Options.id.label("options_id"),
+            *(getattr(Options, field) for field in OPTION_FIELDS),
+            photos.label("photos"),
+        )
+        .outerjoin(Options, Options.home_id == Home.id)
+        .where(Home.id == home_id)
+        .order_by(Options.id)
+        .limit(1)
+    )
+    row = (await db.execute(stmt)).mappings().first()
+    if row is None:
+        return None
+
+    item = {field: row[field] for field in HOME_FIELDS}
+    item["photos"] = row["photos"] or []
+    item["options"] = {field: row[field] for field in OPTION_FIELDS} if row["options_id"] is not None else None
+    return item
+
+
+async def get_item_response(db: AsyncSession, home_id: int) -> Optional[tuple[str, bytes]]:
+    # (ETag, тело ответа) из кэша; при промахе — один запрос к БД и сериализация один раз
+    cached = detail_cache.get(home_id)
+    if cached is not None:
+        return cached
+
+    item = await load_item(db, home_id)
+    if item is None:
+        return None
+    body = json.dumps(item, ensure_ascii=False, separators=(",", ":")).encode()
+    etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+    detail_cache.set(home_id, (etag, body))
+    return etag, body
@@ -0,0 +1,125 @@
+from sqlalchemy import select, func, tuple_, literal_column, and_, or_, true
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import async_session_maker
+from app.models.users import Home, Options
+from app.operations.cache import facets_cache, InFlight
+from app.operations.listings import listing_filter_conditions
+from app.shemas.schemas import ListingFilters
+
+# Границы ценовых диапазонов для фасета price (последний — "от ... и выше")
+PRICE_BUCKET_BOUNDS = [0, 30000, 50000, 75000, 100000, 150000, 200000, 300000, 500000]
+
+
+def _price_bucket_labels() -> dict[int, str]:
+    labels = {}
+    for index, low in enumerate(PRICE_BUCKET_BOUNDS, start=1):
+        high = PRICE_BUCKET_BOUNDS[index] if index < len(PRICE_BUCKET_BOUNDS) else None
+        labels[index] = f"{low}-{high}" if high is not None else f"{low}+"
+    return labels
+
+
+PRICE_BUCKET_LABELS = _price_bucket_labels()
+# Границы вписаны литералом: одно и то же выражение должно совпасть в SELECT и GROUP BY
+_PRICE_BOUNDS_SQL = literal_column(f"ARRAY[{', '.join(map(str, PRICE_BUCKET_BOUNDS))}]::numeric[]")
+
+FACET_COLUMNS = {
+    "type_of_transaction": Home.type_of_transaction,
+    "type_of_housing": Home.type_of_housing,
+    "rooms": Options.numbers_of_room_value,
+    # width_bucket даёт номер диапазона: 1 — [0, 30000), ..., len(bounds) — от последней границы
+    "price": func.width_bucket(Home.price_value, _PRICE_BOUNDS_SQL),
+    "balcony": Options.balcony,
+    "elevator": Options.elevator,
+    "internet": Options.internet,
+}
+# Порядок значений в ответе: для чисел — по значению, для остальных — по убыванию количества
+_ORDERED_BY_VALUE = {"rooms", "price"}
+
+_inflight = InFlight()
+
+
+def _cache_key(filters: ListingFilters) -> tuple:
+    return tuple(sorted(filters.model_dump().items()))
+
+
+def facet_conditions(filters: ListingFilters) -> tuple[dict[str, list], dict]:
+    # Фасет считается по всем фильтрам, кроме фильтра по его собственному измерению: выбрав
+    # type_of_transaction=rent, пользователь по-прежнему видит, сколько объявлений в продаже.
+    # Возвращает условия для каждого фасета и активные фильтры по измерениям
+    active = listing_filter_conditions(filters)
+    per_facet = {
+        name: [condition for dimension, condition in active.items() if dimension != name]
+        for name in FACET_COLUMNS
+    }
+    return per_facet, active
+
+
+def _all(conditions: list):
+    return and_(*conditions) if conditions else true()
+
+
+async def compute_facets(db: AsyncSession, filters: ListingFilters) -> dict:
+    # Все фасеты и общее количество одним запросом: GROUPING SETS по каждой колонке отдельно плюс ().
+    # У каждого фасета свой count(*) FILTER (WHERE ...); WHERE оставляет только строки,
+    # которые нужны хотя бы одному из них — подходящие под все фильтры, кроме одного активного
+    names = list(FACET_COLUMNS)
+    per_facet, active = facet_conditions(filters)
+    total_conditions = list(active.values())
+    columns = [FACET_COLUMNS[name].label(name) for name in names]
+    counts = [func.count().filter(_all(per_facet[name])).label(f"count_{name}") for name in names]
+    grouping = func.grouping(*FACET_COLUMNS.values()).label("grouping")
+    stmt = (
+        select(*columns, grouping, *counts, func.count().filter(_all(total_conditions)).label("count"))
+        .select_from(Home)
+        .outerjoin(Options, Options.home_id == Home.id)
+        .group_by(func.grouping_sets(*(tuple_(column) for column in FACET_COLUMNS.values()), tuple_()))
+    )
+    if active:
+        stmt = stmt.where(or_(*(_all(per_facet[dimension]) for dimension in active)))
+    rows = (await db.execute(stmt)).all()
+
+    # GROUPING() — битовая маска: 1 в разряде колонки, по которой строка НЕ сгруппирована
+    all_bits = (1 << len(names)) - 1
+    facet_by_mask = {all_bits ^ (1 << (len(names) - 1 - index)): name for index, name in enumerate(names)}
+
+    total = 0
+    facets = {name: [] for name in names}
+    for row in rows:
+        if row.grouping == all_bits:
+            total = row.count
+            continue
+        name = facet_by_mask[row.grouping]
+        value = getattr(row, name)
+        count = getattr(row, f"count_{name}")
+        if value is None or value == "" or not count:
+            continue
+        if name == "price":
+            facets[name].append({"value": PRICE_BUCKET_LABELS[value], "bucket": value, "count": count})
+        else:
+            facets[name].append({"value": value, "count": count})
+
+    for name, values in facets.items():
+        if name in _ORDERED_BY_VALUE:
+            values.sort(key=lambda item: item.get("bucket", item["value"]))
+        else:
+            values.sort(key=lambda item: -item["count"])
+    return {"total": total, "facets": facets}
+
+
+async def _compute_in_session(filters: ListingFilters) -> dict:
+    # Общий для нескольких запросов расчёт идёт в своей сессии, а не в сессии первого запроса
+    async with async_session_maker() as db:
+        return await compute_facets(db, filters)
+
+
+async def get_facets(filters: ListingFilters) -> dict:
+    # Кэш на несколько секунд; одновременные промахи по одному ключу ждут один запрос
+    key = _cache_key(filters)
+    cached = facets_cache.get(key)
+    if cached is not None:
+        return cached
+
+    result = await _inflight.run(key, lambda: _compute_in_session(filters))
+    facets_cache.set(key, result)
+    return result
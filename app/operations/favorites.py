@@ -0,0 +1,98 @@
+from typing import Optional
+
+from sqlalchemy import select, delete, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.users import FavoritesHome, Home, ListingSummary
+from app.operations.popularity import popularity_counters
+
+FAVORITES_PAGE_SIZE = 20
+FAVORITES_MAX_PAGE_SIZE = 100
+# Сколько id можно проверить одним запросом "в избранном ли"
+FAVORITES_STATUS_MAX_IDS = 200
+
+
+class HomeNotFound(Exception):
+    pass
+
+
+async def add_favorite(db: AsyncSession, user_id: int, home_id: int) -> bool:
+    # Идемпотентно: повторный клик не создаёт дубль и не падает на гонке двух запросов.
+    # INSERT ... SELECT из home не вставит ничего, если объявления нет
+    stmt = (
+        insert(FavoritesHome)
+        .from_select(
+            ["user_id", "home_id"],
+            select(literal(user_id), Home.id).where(Home.id == home_id),
+        )
+        .on_conflict_do_nothing(index_elements=[FavoritesHome.user_id, FavoritesHome.home_id])
+        .returning(FavoritesHome.home_id)
+    )
+    created = (await db.execute(stmt)).scalar_one_or_none() is not None
+    if not created:
+        # Ничего не вставлено: либо уже в избранном, либо объявления нет
+        exists = (await db.execute(select(Home.id).where(Home.id == home_id))).scalar_one_or_none()
+        if exists is None:
+            raise HomeNotFound(home_id)
+    await db.commit()
+    if created:
+        popularity_counters.record_favorite(home_id, 1)
+    return created
+
+
+async def remove_favorite(db: AsyncSession, user_id: int, home_id: int) -> bool:
+    result = await db.execute(
+        delete(FavoritesHome)
+        .where(FavoritesHome.user_id == user_id, FavoritesHome.home_id == home_id)
+        .returning(FavoritesHome.home_id)
+    )
+    removed = result.scalar_one_or_none() is not None
+    await db.commit()
+    if removed:
+        popularity_counters.record_favorite(home_id, -1)
+    return removed
+
+
+async def favorite_flags(db: AsyncSession, user_id: int, home_ids: list[int]) -> dict[int, bool]:
+    # Без кэша в памяти воркера: при нескольких воркерах он показывал бы устаревшие сердечки.
+    # Чтение — диапазон первичного ключа (user_id, home_id), не дороже похода в кэш
+    result = await db.execute(
+        select(FavoritesHome.home_id)
+        .where(FavoritesHome.user_id == user_id, FavoritesHome.home_id.in_(home_ids))
+    )
+    favorite_ids = set(result.scalars())
+    return {home_id: home_id in favorite_ids for home_id in home_ids}
+
+
+async def get_favorites_page(
+        db: AsyncSession,
+        user_id: int,
+        cursor: Optional[int] = None,
+        limit: int = FAVORITES_PAGE_SIZE,
+):
+    # Keyset по home_id (новые объявления первыми), карточки берутся из сводки listing_summary
+    stmt = (
+        select(
+            ListingSummary.id,
+            ListingSummary.name,
+            ListingSummary.price,
+            ListingSummary.address,
+            ListingSummary.type_of_transaction,
+            ListingSummary.type_of_housing,
+            ListingSummary.cover_photo,
+        )
+        .join(FavoritesHome, FavoritesHome.home_id == ListingSummary.id)
+        .where(FavoritesHome.user_id == user_id)
+        .order_by(FavoritesHome.home_id.desc())
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        stmt = stmt.where(FavoritesHome.home_id < cursor)
+    rows = (await db.execute(stmt)).mappings().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]["id"]
+    return [dict(row) for row in rows], next_cursor
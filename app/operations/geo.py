@@ -0,0 +1,213 @@
+import math
+from typing import Optional
+
+from sqlalchemy import select, func, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.users import ListingSummary
+from app.operations.listings import apply_listing_filters
+from app.shemas.schemas import ListingFilters
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+# Точность geohash, которая хранится в Home.geohash и в сводке listing_summary (~5 м)
+GEOHASH_PRECISION = 9
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Сколько ячеек geohash максимум подставляем в запрос по прямоугольнику
+MAX_COVER_CELLS = 24
+# Ограничения выдачи для карты
+GEO_MAX_RESULTS = 500
+NEAREST_START_RADIUS_KM = 1.0
+NEAREST_MAX_RADIUS_KM = 200.0
+
+# Уровень зума карты -> длина префикса geohash для кластеризации
+_ZOOM_PRECISION = [
+    (3, 1), (5, 2), (8, 3), (10, 4), (13, 5), (15, 6), (17, 7),
+]
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    # Расстояние по дуге большого круга между двумя точками, в километрах
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def encode_geohash(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def geohash_or_none(lat: Optional[float], lon: Optional[float]) -> Optional[str]:
+    if lat is None or lon is None:
+        return None
+    return encode_geohash(lat, lon)
+
+
+def _cell_size(precision: int) -> tuple[float, float]:
+    # Размер ячейки geohash в градусах: (широта, долгота)
+    bits = precision * 5
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def geohash_cover(min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> list[str]:
+    # Набор префиксов geohash, покрывающий прямоугольник: берём самую точную длину,
+    # при которой ячеек не больше MAX_COVER_CELLS
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_step, lon_step = _cell_size(precision)
+        rows = math.floor((max_lat + 90) / lat_step) - math.floor((min_lat + 90) / lat_step) + 1
+        cols = math.floor((max_lon + 180) / lon_step) - math.floor((min_lon + 180) / lon_step) + 1
+        if rows * cols <= MAX_COVER_CELLS or precision == 1:
+            break
+
+    cells = set()
+    lat = math.floor((min_lat + 90) / lat_step) * lat_step - 90
+    while lat <= max_lat:
+        lon = math.floor((min_lon + 180) / lon_step) * lon_step - 180
+        while lon <= max_lon:
+            # Кодируем центр ячейки, чтобы не попасть на её границу
+            center_lat = min(lat + lat_step / 2, 90.0)
+            center_lon = min(lon + lon_step / 2, 180.0)
+            cells.add(encode_geohash(center_lat, center_lon, precision))
+            lon += lon_step
+        lat += lat_step
+    return sorted(cells)
+
+
+def zoom_to_precision(zoom: int) -> int:
+    for max_zoom, precision in _ZOOM_PRECISION:
+        if zoom < max_zoom:
+            return precision
+    return 8
+
+
+def radius_bbox(lat: float, lon: float, radius_km: float) -> tuple[float, float, float, float]:
+    d_lat = radius_km / KM_PER_DEGREE
+    d_lon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    return (
+        max(lat - d_lat, -90.0), max(lon - d_lon, -180.0),
+        min(lat + d_lat, 90.0), min(lon + d_lon, 180.0),
+    )
+
+
+def _distance_km(lat: float, lon: float):
+    # Та же формула гаверсинусов, но на стороне PostgreSQL
+    d_lat = func.radians(ListingSummary.latitude - lat)
+    d_lon = func.radians(ListingSummary.longitude - lon)
+    a = (
+        func.power(func.sin(d_lat * 0.5), 2)
+        + func.cos(math.radians(lat)) * func.cos(func.radians(ListingSummary.latitude)) * func.power(func.sin(d_lon * 0.5), 2)
+    )
+    return 2 * EARTH_RADIUS_KM * func.asin(func.sqrt(a))
+
+
+def _bbox_stmt(stmt, min_lat: float, min_lon: float, max_lat: float, max_lon: float):
+    # Префиксы geohash отбирают кандидатов по индексу, точные границы отсекают края ячеек.
+    # Префикс задаётся диапазоном [prefix, prefix~): колонка в collation "C", а "~" больше любого
+    # символа base32, поэтому условие работает и с подготовленными выражениями asyncpg
+    prefixes = geohash_cover(min_lat, min_lon, max_lat, max_lon)
+    return stmt.where(
+        or_(*[and_(ListingSummary.geohash >= prefix, ListingSummary.geohash < prefix + "~") for prefix in prefixes]),
+        ListingSummary.latitude.between(min_lat, max_lat),
+        ListingSummary.longitude.between(min_lon, max_lon),
+    )
+
+
+_point_columns = (
+    ListingSummary.id,
+    ListingSummary.name,
+    ListingSummary.price,
+    ListingSummary.type_of_transaction,
+    ListingSummary.type_of_housing,
+    ListingSummary.latitude,
+    ListingSummary.longitude,
+)
+
+
+async def search_bbox(
+        db: AsyncSession, filters: ListingFilters,
+        min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+        limit: int = GEO_MAX_RESULTS,
+):
+    stmt = _bbox_stmt(select(*_point_columns), min_lat, min_lon, max_lat, max_lon)
+    stmt = apply_listing_filters(stmt, filters, ListingSummary).order_by(ListingSummary.id.desc()).limit(limit)
+    result = await db.execute(stmt)
+    return [dict(row) for row in result.mappings().all()]
+
+
+async def search_radius(
+        db: AsyncSession, filters: ListingFilters,
+        lat: float, lon: float, radius_km: float,
+        limit: int = GEO_MAX_RESULTS,
+):
+    distance = _distance_km(lat, lon).label("distance_km")
+    stmt = _bbox_stmt(select(*_point_columns, distance), *radius_bbox(lat, lon, radius_km))
+    stmt = (
+        apply_listing_filters(stmt, filters, ListingSummary)
+        .where(distance <= radius_km)
+        .order_by(distance)
+        .limit(limit)
+    )
+    result = await db.execute(stmt)
+    return [dict(row) for row in result.mappings().all()]
+
+
+async def search_nearest(db: AsyncSession, filters: ListingFilters, lat: float, lon: float, n: int):
+    # Расширяем радиус вдвое, пока внутри круга не наберётся n объявлений:
+    # всё, что за пределами круга, заведомо дальше найденного
+    radius = NEAREST_START_RADIUS_KM
+    while True:
+        items = await search_radius(db, filters, lat, lon, radius, limit=n)
+        if len(items) >= n or radius >= NEAREST_MAX_RADIUS_KM:
+            return items
+        radius *= 2
+
+
+async def get_clusters(
+        db: AsyncSession, filters: ListingFilters,
+        min_lat: float, min_lon: float, max_lat: float, max_lon: float, zoom: int,
+):
+    # Одна агрегация по префиксу geohash: на мелком зуме — крупные кластеры, на крупном — точки
+    cell = func.substr(ListingSummary.geohash, 1, zoom_to_precision(zoom)).label("cell")
+    stmt = select(
+        cell,
+        func.count().label("count"),
+        func.avg(ListingSummary.latitude).label("latitude"),
+        func.avg(ListingSummary.longitude).label("longitude"),
+        func.min(ListingSummary.id).label("home_id"),
+    )
+    stmt = _bbox_stmt(stmt, min_lat, min_lon, max_lat, max_lon)
+    stmt = apply_listing_filters(stmt, filters, ListingSummary).group_by(cell).limit(GEO_MAX_RESULTS)
+    result = await db.execute(stmt)
+    return [
+        {
+            "geohash": row.cell,
+            "count": row.count,
+            "latitude": row.latitude,
+            "longitude": row.longitude,
+            # Для одиночной точки отдаём id объявления, чтобы карта могла открыть карточку
+            "home_id": row.home_id if row.count == 1 else None,
+        }
+        for row in result.all()
+    ]
@@ -0,0 +1,205 @@
+import argparse
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, or_
+
+from app.config import GEOCODE_CONCURRENCY
+from app.database import async_session_maker
+from app.models.users import Home
+from app.operations.cache import invalidate_listing
+from app.operations.geo import geohash_or_none
+from app.operations.geocoding import geocode_cache
+from app.operations.similar import refresh_similar_in_background
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_BATCH_SIZE = 50
+GEOCODE_MAX_ATTEMPTS = 6
+# Пауза опроса, если очередь пуста и никто не разбудил воркер
+GEOCODE_POLL_SECONDS = 30
+# Строка "арендуется" воркером на это время; если процесс упал — её подхватит другой
+GEOCODE_LEASE = timedelta(minutes=5)
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 6 * 3600
+
+PENDING, DONE, FAILED = "pending", "done", "failed"
+
+
+def backoff_delay(attempts: int) -> timedelta:
+    # Экспоненциальная задержка с джиттером, чтобы повторы не шли одной волной
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** attempts, BACKOFF_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+async def claim_batch(limit: int = GEOCODE_BATCH_SIZE):
+    # Забираем пачку ожидающих строк: SKIP LOCKED позволяет нескольким воркерам не мешать друг другу
+    # Строки без адреса не берутся: геокодировать нечего, а повторы шли бы бесконечно
+    now = datetime.utcnow()
+    due = (
+        select(Home.id)
+        .where(
+            Home.geocode_status == PENDING,
+            Home.address.is_not(None),
+            or_(Home.geocode_next_attempt_at.is_(None), Home.geocode_next_attempt_at <= now),
+        )
+        .order_by(Home.geocode_next_attempt_at.nulls_first(), Home.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    async with async_session_maker() as db:
+        result = await db.execute(
+            update(Home)
+            .where(Home.id.in_(due.scalar_subquery()))
+            .values(geocode_next_attempt_at=now + GEOCODE_LEASE)
+            .returning(Home.id, Home.address, Home.geocode_attempts, Home.geocode_next_attempt_at.label("lease"))
+        )
+        rows = result.all()
+        await db.commit()
+    return rows
+
+
+async def _store_result(home_id: int, lease: datetime, values: dict) -> bool:
+    # Результат пишется, только пока аренда наша: правка объявления сбрасывает geocode_next_attempt_at,
+    # а после истечения аренды строку мог забрать другой воркер — в обоих случаях результат устарел
+    async with async_session_maker() as db:
+        result = await db.execute(
+            update(Home)
+            .where(Home.id == home_id, Home.geocode_next_attempt_at == lease, Home.geocode_status == PENDING)
+            .values(**values)
+        )
+        await db.commit()
+    return result.rowcount > 0
+
+
+async def geocode_home(home_id: int, address: str, attempts: int, lease: datetime):
+    try:
+        coordinates = await geocode_cache.lookup(address)
+    except Exception as e:
+        attempts += 1
+        logger.warning(f"Geocoding failed for home {home_id} (attempt {attempts}): {e}")
+        if attempts >= GEOCODE_MAX_ATTEMPTS:
+            values = {"geocode_status": FAILED, "geocode_attempts": attempts, "geocode_next_attempt_at": None}
+        else:
+            values = {
+                "geocode_attempts": attempts,
+                "geocode_next_attempt_at": datetime.utcnow() + backoff_delay(attempts),
+            }
+        await _store_result(home_id, lease, values)
+        return
+
+    if coordinates is None:
+        # Адрес не найден — повтор не поможет, пока адрес не изменят
+        logger.warning(f"Address not found for home {home_id}: {address}")
+        await _store_result(home_id, lease, {"geocode_status": FAILED, "geocode_next_attempt_at": None})
+        return
+
+    lat, lon = coordinates
+    stored = await _store_result(home_id, lease, {
+        "latitude": lat,
+        "longitude": lon,
+        "geohash": geohash_or_none(lat, lon),
+        "geocode_status": DONE,
+        "geocode_next_attempt_at": None,
+    })
+    if stored:
+        invalidate_listing(home_id)
+        # Координаты участвуют в ранжировании похожих объявлений
+        await refresh_similar_in_background(home_id)
+
+
+class GeocodeWorker:
+    # Фоновый пул геокодирования: стартует в lifespan приложения
+    def __init__(self, concurrency: int = GEOCODE_CONCURRENCY, batch_size: int = GEOCODE_BATCH_SIZE):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def notify(self):
+        # Вызывается после сохранения объявления, чтобы не ждать следующего опроса
+        self._wakeup.set()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def process_batch(self) -> int:
+        rows = await claim_batch(self.batch_size)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(row):
+            async with semaphore:
+                await geocode_home(row.id, row.address, row.geocode_attempts, row.lease)
+
+        await asyncio.gather(*(run(row) for row in rows))
+        return len(rows)
+
+    async def drain(self):
+        # Обрабатывает очередь до конца (используется командой повторного геокодирования)
+        total = 0
+        while processed := await self.process_batch():
+            total += processed
+        return total
+
+    async def _run(self):
+        while True:
+            try:
+                processed = await self.process_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error in geocode worker")
+                processed = 0
+
+            if processed < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=GEOCODE_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+
+geocode_worker = GeocodeWorker()
+
+
+async def mark_for_regeocode(include_failed: bool = False) -> int:
+    # Ставит в очередь объявления без координат (и, по желанию, ранее не найденные)
+    condition = or_(Home.latitude.is_(None), Home.longitude.is_(None))
+    if include_failed:
+        condition = or_(condition, Home.geocode_status == FAILED)
+    async with async_session_maker() as db:
+        result = await db.execute(
+            update(Home)
+            .where(condition, Home.address.is_not(None))
+            .values(geocode_status=PENDING, geocode_attempts=0, geocode_next_attempt_at=None)
+        )
+        await db.commit()
+    return result.rowcount
+
+
+async def _main(args):
+    marked = await mark_for_regeocode(include_failed=args.include_failed)
+    print(f"Queued {marked} homes for geocoding")
+    if args.run:
+        processed = await geocode_worker.drain()
+        print(f"Processed {processed} homes")
+
+
+if __name__ == "__main__":
+    # python -m app.operations.geocode_worker [--include-failed] [--run]
+    parser = argparse.ArgumentParser(description="Re-geocode homes with missing coordinates")
+    parser.add_argument("--include-failed", action="store_true", help="also retry homes whose address was not found")
+    parser.add_argument("--run", action="store_true", help="process the queue now instead of leaving it to the app")
+    asyncio.run(_main(parser.parse_args()))
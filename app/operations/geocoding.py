@@ -0,0 +1,216 @@
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+import httpx
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import GEOCODER_BACKEND, YANDEX_API_KEY, GEOCODE_CACHE_TTL_DAYS, GEOCODE_NEGATIVE_TTL_HOURS, \
+    GEOCODE_RATE_PER_SECOND
+from app.database import async_session_maker
+from app.models.users import GeocodeCacheEntry
+from app.operations.cache import TTLCache, InFlight
+from app.operations.http_clients import http_clients, GEOCODER, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# Значение-маркер "в памяти ничего нет" (None в кэше означает "адрес не найден")
+_MISS = object()
+
+
+class GeocodingError(Exception):
+    # Геокодер недоступен или ответил ошибкой — такой результат не кэшируется
+    pass
+
+
+def normalize_address(address: str) -> str:
+    # Ключ кэша: регистр, "ё", лишние пробелы и пунктуация по краям не влияют на результат
+    address = address.lower().replace("ё", "е")
+    address = re.sub(r"\s*,\s*", ", ", address)
+    address = re.sub(r"\s+", " ", address)
+    return address.strip(" .,;")
+
+
+class RateLimiter:
+    # Token bucket: не больше rate запросов в секунду к внешнему геокодеру
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class GeocoderBackend:
+    async def geocode(self, address: str) -> Optional[tuple[float, float]]:
+        # Возвращает (lat, lon) или None, если адрес не найден
+        raise NotImplementedError
+
+
+class YandexGeocoder(GeocoderBackend):
+    base_url = "https://geocode-maps.yandex.ru/1.x/"
+
+    def __init__(self, api_key: str = YANDEX_API_KEY):
+        self.api_key = api_key
+
+    async def geocode(self, address: str) -> Optional[tuple[float, float]]:
+        params = {
+            "apikey": self.api_key,
+            "geocode": address,
+            "format": "json"
+        }
+        try:
+            response = await http_clients.get(GEOCODER).get(self.base_url, params=params)
+        except (httpx.HTTPError, CircuitOpenError) as e:
+            raise GeocodingError(f"Geocoder unavailable: {e.__class__.__name__}")
+        if response.status_code != 200:
+            raise GeocodingError(f"Error fetching coordinates: {response.status_code}")
+
+        members = response.json()["response"]["GeoObjectCollection"]["featureMember"]
+        if not members:
+            return None
+        lon, lat = map(float, members[0]["GeoObject"]["Point"]["pos"].split())  # Координаты объекта
+        return lat, lon
+
+
+class StubGeocoder(GeocoderBackend):
+    # Локальная заглушка без сети: известные адреса из словаря, остальные —
+    # детерминированная точка в окрестностях Минска по хэшу адреса
+    def __init__(self, known: Optional[dict] = None, delay: float = 0.0):
+        self.known = {normalize_address(key): value for key, value in (known or {}).items()}
+        self.delay = delay
+        self.calls = 0
+
+    async def geocode(self, address: str) -> Optional[tuple[float, float]]:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        key = normalize_address(address)
+        if self.known:
+            return self.known.get(key)
+        digest = hashlib.sha1(key.encode()).digest()
+        lat = 53.80 + digest[0] / 255 * 0.2
+        lon = 27.40 + digest[1] / 255 * 0.3
+        return lat, lon
+
+
+def make_backend(name: str) -> GeocoderBackend:
+    if name == "stub":
+        return StubGeocoder()
+    if name == "yandex":
+        return YandexGeocoder()
+    raise ValueError(f"Unknown geocoder backend: {name}")
+
+
+class GeocodeCache:
+    # LRU в памяти -> таблица geocode_cache -> внешний геокодер.
+    # Параллельные запросы одного адреса объединяются в один вызов геокодера.
+    def __init__(
+            self,
+            backend: GeocoderBackend,
+            ttl: timedelta = timedelta(days=GEOCODE_CACHE_TTL_DAYS),
+            negative_ttl: timedelta = timedelta(hours=GEOCODE_NEGATIVE_TTL_HOURS),
+            maxsize: int = 10000,
+            use_db: bool = True,
+            rate_limiter: Optional[RateLimiter] = None,
+    ):
+        self.backend = backend
+        self.rate_limiter = rate_limiter
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.use_db = use_db
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl.total_seconds())
+        self._inflight = InFlight()
+
+    async def lookup(self, address: str) -> Optional[tuple[float, float]]:
+        key = normalize_address(address)
+        cached = self._memory.get(key, _MISS)
+        if cached is not _MISS:
+            return cached
+
+        return await self._inflight.run(key, lambda: self._resolve(key, address))
+
+    async def _resolve(self, key: str, address: str) -> Optional[tuple[float, float]]:
+        if self.use_db:
+            entry = await self._load(key)
+            if entry is not None:
+                coordinates = (entry.latitude, entry.longitude) if entry.found else None
+                remaining = (entry.expires_at - datetime.utcnow()).total_seconds()
+                self._memory.set(key, coordinates, ttl=remaining)
+                return coordinates
+
+        # Лимит расходуется только на реальные обращения к геокодеру, не на попадания в кэш
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+        coordinates = await self.backend.geocode(address)
+        ttl = self.ttl if coordinates is not None else self.negative_ttl
+        self._memory.set(key, coordinates, ttl=ttl.total_seconds())
+        if self.use_db:
+            await self._store(key, coordinates, ttl)
+        return coordinates
+
+    async def _load(self, key: str) -> Optional[GeocodeCacheEntry]:
+        # Ошибка кэша не должна ломать геокодирование — просто идём к геокодеру
+        try:
+            async with async_session_maker() as db:
+                result = await db.execute(
+                    select(GeocodeCacheEntry).where(
+                        GeocodeCacheEntry.address_key == key,
+                        GeocodeCacheEntry.expires_at > datetime.utcnow(),
+                    )
+                )
+                return result.scalar_one_or_none()
+        except Exception:
+            logger.exception("Error while reading geocode cache")
+            return None
+
+    async def _store(self, key: str, coordinates: Optional[tuple[float, float]], ttl: timedelta):
+        now = datetime.utcnow()
+        values = {
+            "address_key": key,
+            "latitude": coordinates[0] if coordinates else None,
+            "longitude": coordinates[1] if coordinates else None,
+            "found": coordinates is not None,
+            "expires_at": now + ttl,
+            "updated_at": now,
+        }
+        stmt = insert(GeocodeCacheEntry).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[GeocodeCacheEntry.address_key],
+            set_={column: stmt.excluded[column] for column in values if column != "address_key"},
+        )
+        try:
+            async with async_session_maker() as db:
+                await db.execute(stmt)
+                await db.commit()
+        except Exception:
+            logger.exception("Error while writing geocode cache")
+
+    def clear_memory(self):
+        self._memory.clear()
+
+
+geocode_cache = GeocodeCache(make_backend(GEOCODER_BACKEND), rate_limiter=RateLimiter(GEOCODE_RATE_PER_SECOND))
+
+
+def set_geocoder_backend(backend: GeocoderBackend, use_db: bool = True):
+    # Подмена геокодера (например, StubGeocoder в тестах); кэш в памяти сбрасывается
+    geocode_cache.backend = backend
+    geocode_cache.use_db = use_db
+    geocode_cache.clear_memory()
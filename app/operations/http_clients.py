@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+except ImportError:  # h2 необязателен: без него HTTP/1.1 с keep-alive
+    h2 = None
+
+logger = logging.getLogger(__name__)
+
+# Имена внешних сервисов
+NEWS, GEOCODER, VISITS = "news", "geocoder", "visits"
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+# Верхние границы корзин гистограммы задержек, мс
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class CircuitOpenError(Exception):
+    # Сервис недавно падал подряд: запрос не отправляется, чтобы не ждать таймаутов впустую
+    pass
+
+
+@dataclass
+class UpstreamConfig:
+    name: str
+    timeout: httpx.Timeout = field(default_factory=lambda: httpx.Timeout(5.0, connect=2.0))
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    http2: bool = True
+    follow_redirects: bool = False
+    retries: int = 2
+    backoff_base: float = 0.2
+    backoff_max: float = 5.0
+    breaker_failures: int = 5
+    breaker_reset_seconds: float = 30.0
+
+
+class CircuitBreaker:
+    # closed -> open после breaker_failures ошибок подряд; через breaker_reset_seconds пропускается
+    # одна пробная попытка (half-open): успех закрывает цепь, ошибка снова открывает.
+    # Пробная попытка без исхода (например, отменённая) через reset_seconds уступает место следующей.
+    # Каждое открытие и закрытие меняет поколение: исход запроса, пропущенного в прошлом поколении
+    # (например, медленный ответ, начатый до открытия цепи), состояние уже не меняет
+    def __init__(self, failures: int, reset_seconds: float):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._trial_at: Optional[float] = None
+        self._generation = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> Optional[int]:
+        # Поколение, в котором запрос пропущен, или None, если цепь открыта
+        state = self.state
+        if state == "closed":
+            return self._generation
+        now = time.monotonic()
+        if state == "half-open" and (self._trial_at is None or now - self._trial_at >= self.reset_seconds):
+            self._trial_at = now
+            return self._generation
+        return None
+
+    def record_success(self, generation: int):
+        if generation != self._generation:
+            return
+        self._consecutive = 0
+        if self._opened_at is not None:
+            self._opened_at = None
+            self._trial_at = None
+            self._generation += 1
+
+    def record_failure(self, generation: int):
+        if generation != self._generation:
+            return
+        self._consecutive += 1
+        if self._trial_at is not None or self._consecutive >= self.failures:
+            self._opened_at = time.monotonic()
+            self._trial_at = None
+            self._generation += 1
+
+
+class UpstreamMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0  # Не отправлены из-за открытой цепи
+        self.statuses: dict[int, int] = {}
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_total_ms = 0.0
+
+    def observe(self, latency_ms: float, status: Optional[int]):
+        self.requests += 1
+        self.latency_total_ms += latency_ms
+        index = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if latency_ms <= bound), len(LATENCY_BUCKETS_MS))
+        self.latency_buckets[index] += 1
+        if status is None:
+            self.errors += 1
+        else:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if status >= 500:
+                self.errors += 1
+
+    def snapshot(self) -> dict:
+        bounds = [f"le_{bound}ms" for bound in LATENCY_BUCKETS_MS] + ["inf"]
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+            "latency_avg_ms": round(self.latency_total_ms / self.requests, 1) if self.requests else None,
+            "latency_histogram": dict(zip(bounds, self.latency_buckets)),
+        }
+
+
+class Upstream:
+    # Пул соединений одного внешнего сервиса: таймауты, повторы с джиттером, circuit breaker и метрики.
+    # Клиент создаётся при первом запросе и живёт до закрытия реестра в lifespan
+    def __init__(self, config: UpstreamConfig, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.config = config
+        self.transport = transport
+        self.breaker = CircuitBreaker(config.breaker_failures, config.breaker_reset_seconds)
+        self.metrics = UpstreamMetrics()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            config = self.config
+            self._client = httpx.AsyncClient(
+                timeout=config.timeout,
+                limits=httpx.Limits(
+                    max_connections=config.max_connections,
+                    max_keepalive_connections=config.max_keepalive_connections,
+                ),
+                http2=config.http2 and h2 is not None and self.transport is None,
+                follow_redirects=config.follow_redirects,
+                transport=self.transport,
+            )
+        return self._client
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.config.backoff_base * 2 ** attempt, self.config.backoff_max)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def request(self, method: str, url: str, *, retry: Optional[bool] = None, **kwargs) -> httpx.Response:
+        # Повторяются сетевые ошибки и ответы 429/502/503/504; POST — только если retry=True
+        if retry is None:
+            retry = method.upper() in IDEMPOTENT_METHODS
+        attempts = 1 + (self.config.retries if retry else 0)
+        for attempt in range(attempts):
+            generation = self.breaker.allow()
+            if generation is None:
+                self.metrics.rejected += 1
+                raise CircuitOpenError(f"Circuit for {self.config.name} is open")
+            if attempt:
+                self.metrics.retries += 1
+
+            started = time.monotonic()
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                self.metrics.observe((time.monotonic() - started) * 1000, None)
+                self.breaker.record_failure(generation)
+                if attempt + 1 == attempts:
+                    raise
+                logger.warning(f"{self.config.name}: {method} {url} failed ({e.__class__.__name__}), retrying")
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            self.metrics.observe((time.monotonic() - started) * 1000, response.status_code)
+            if response.status_code >= 500 or response.status_code == 429:
+                self.breaker.record_failure(generation)
+            else:
+                self.breaker.record_success(generation)
+            if response.status_code in RETRY_STATUSES and attempt + 1 < attempts:
+                await response.aclose()
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            return response
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class HttpClientRegistry:
+    # Общие клиенты внешних сервисов на всё приложение; закрываются в lifespan.
+    # Для тестов и локального запуска транспорт подменяется заглушкой: set_transport(name, httpx.MockTransport(...))
+    def __init__(self, configs: list[UpstreamConfig]):
+        self._upstreams = {config.name: Upstream(config) for config in configs}
+
+    def get(self, name: str) -> Upstream:
+        return self._upstreams[name]
+
+    async def set_transport(self, name: str, transport: Optional[httpx.AsyncBaseTransport]):
+        upstream = self._upstreams[name]
+        await upstream.aclose()
+        self._upstreams[name] = Upstream(upstream.config, transport)
+
+    def metrics(self) -> dict:
+        return {
+            name: {**upstream.metrics.snapshot(), "circuit": upstream.breaker.state}
+            for name, upstream in self._upstreams.items()
+        }
+
+    async def aclose(self):
+        for upstream in self._upstreams.values():
+            await upstream.aclose()
+
+
+http_clients = HttpClientRegistry([
+    # Страница новостей большая и иногда медленная; опрашивается раз в несколько минут
+    UpstreamConfig(NEWS, timeout=httpx.Timeout(15.0, connect=5.0), max_connections=2,
+                   max_keepalive_connections=1, follow_redirects=True),
+    UpstreamConfig(GEOCODER, timeout=httpx.Timeout(5.0, connect=2.0), max_connections=10),
+    # Пересылка визитов: параллельные POST по одному визиту, короткие таймауты
+    UpstreamConfig(VISITS, timeout=httpx.Timeout(5.0, connect=1.0), max_connections=32,
+                   max_keepalive_connections=16, http2=False),
+])
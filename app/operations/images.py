@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from app.config import PHOTO_DIR, IMAGE_WORKERS
+from app.operations.cache import InFlight
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow необязателен: без него отдаются оригиналы
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+# Фиксированные ширины превью; оригинал отдаётся без параметра size
+PHOTO_VARIANTS = {
+    "thumb": 320,
+    "card": 640,
+    "full": 1600,
+}
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+VARIANT_QUALITY = 82
+VARIANT_DIR = PHOTO_DIR / "variants"
+
+_executor: Optional[ProcessPoolExecutor] = None
+_inflight = InFlight()
+
+
+def variants_available() -> bool:
+    return Image is not None
+
+
+def pick_format(accept: Optional[str]) -> str:
+    # WebP — если браузер его поддерживает, иначе JPEG
+    return "webp" if accept and "image/webp" in accept else "jpeg"
+
+
+def variant_path(name: str, size: str, fmt: str) -> Path:
+    return VARIANT_DIR / size / f"{Path(name).stem}.{fmt}"
+
+
+def render_variant(source: str, target: str, width: int, fmt: str):
+    # Выполняется в отдельном процессе: декодирование и ресайз не держат event loop и GIL
+    pil_format = VARIANT_FORMATS[fmt][0]
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+        if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_target = f"{target}.{os.getpid()}.tmp"
+        image.save(tmp_target, pil_format, quality=VARIANT_QUALITY, optimize=True)
+        os.replace(tmp_target, target)  # Атомарно: читатели не увидят недописанный файл
+
+
+def image_size(path) -> Optional[tuple[int, int]]:
+    # Размеры из заголовка файла, без декодирования пикселей; None — нет Pillow или файл не читается
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def get_variant(name: str, size: str, fmt: str) -> Optional[Path]:
+    # Путь к превью; при первом обращении оно генерируется и кэшируется на диске.
+    # None — превью недоступно (нет Pillow или исходника), нужно отдать оригинал.
+    if not variants_available() or size not in PHOTO_VARIANTS:
+        return None
+
+    target = variant_path(name, size, fmt)
+    if target.exists():
+        return target
+
+    source = PHOTO_DIR / name
+    if not source.exists():
+        return None
+
+    # Одновременные запросы одного превью ждут одну и ту же задачу
+    loop = asyncio.get_running_loop()
+    try:
+        await _inflight.run(target, lambda: loop.run_in_executor(
+            _get_executor(), render_variant, str(source), str(target), PHOTO_VARIANTS[size], fmt
+        ))
+    except Exception:
+        logger.exception(f"Error while rendering {size}/{fmt} variant of {name}")
+        return None
+    return target
+
+
+async def generate_variants(names: list[str], fmt: str = "webp"):
+    # Фоновая генерация при загрузке, чтобы первый просмотр не ждал ресайза
+    if not variants_available():
+        return
+    await asyncio.gather(*(get_variant(name, size, fmt) for name in names for size in PHOTO_VARIANTS))
@@ -0,0 +1,222 @@
+from typing import Optional
+
+from sqlalchemy import select, func, cast, case, literal_column, and_, Text, ColumnElement
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.users import Home, Options, Photo, ListingSummary
+from app.shemas.schemas import ListingFilters
+
+# Размер страницы по умолчанию и жёсткий предел для ленты объявлений
+LISTING_PAGE_SIZE = 20
+LISTING_MAX_PAGE_SIZE = 100
+
+
+def listing_filter_conditions(filters: ListingFilters, source=Home) -> dict[str, ColumnElement]:
+    # Условия активных фильтров по измерениям (type_of_transaction, type_of_housing, price, rooms):
+    # фасетам нужно исключать условие собственного измерения
+    conditions = {}
+    if filters.type_of_transaction:
+        conditions["type_of_transaction"] = source.type_of_transaction == filters.type_of_transaction
+    if filters.type_of_housing:
+        conditions["type_of_housing"] = source.type_of_housing == filters.type_of_housing
+    price = []
+    if filters.min_price is not None:
+        price.append(source.price_value >= filters.min_price)
+    if filters.max_price is not None:
+        price.append(source.price_value <= filters.max_price)
+    if price:
+        conditions["price"] = and_(*price)
+    if filters.rooms is not None:
+        if source is ListingSummary:
+            conditions["rooms"] = ListingSummary.rooms == filters.rooms
+        else:
+            conditions["rooms"] = Home.options.has(Options.numbers_of_room_value == filters.rooms)
+    return conditions
+
+
+def apply_listing_filters(stmt, filters: ListingFilters, source=Home):
+    # Все фильтры применяются на стороне БД; source — Home или сводка ListingSummary
+    for condition in listing_filter_conditions(filters, source).values():
+        stmt = stmt.where(condition)
+    return stmt
+
+
+async def get_listing_page(
+        db: AsyncSession,
+        filters: ListingFilters,
+        cursor: Optional[int] = None,
+        limit: int = LISTING_PAGE_SIZE,
+):
+    # Keyset-пагинация по id: новые объявления первыми, курсор — id последнего элемента страницы.
+    # Читается только сводка listing_summary: фото уже лежат в ней списком имён
+    limit = min(limit, LISTING_MAX_PAGE_SIZE)
+    stmt = (
+        select(ListingSummary)
+        .order_by(ListingSummary.id.desc())
+        .limit(limit + 1)  # Лишняя строка показывает, есть ли следующая страница
+    )
+    stmt = apply_listing_filters(stmt, filters, ListingSummary)
+    if cursor is not None:
+        stmt = stmt.where(ListingSummary.id < cursor)
+
+    result = await db.execute(stmt)
+    items = result.scalars().all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = items[-1].id
+
+    return items, next_cursor
+
+
+# Быстрый путь: Postgres сам собирает JSON (json_build_object + json_agg), а эндпоинт отдаёт
+# готовые байты — без гидрации ORM-объектов и повторной сериализации в FastAPI.
+# Результат приводится к text, чтобы драйвер не разбирал JSON обратно в Python-объекты.
+
+CARD_KEYS = ("id", "name", "price", "description", "address", "photos", "type_of_transaction", "type_of_housing")
+AD_KEYS = ("id", "name", "price", "description", "latitude", "longitude", "address",
+           "type_of_transaction", "type_of_housing", "photos", "options")
+AD_OPTION_KEYS = {
+    "rooms": "numbers_of_room",
+    "square": "square",
+    "year_of_construction": "year_of_construction",
+    "floor": "floor",
+    "ceiling_height": "ceiling_height",
+    "balcony": "balcony",
+    "internet": "internet",
+    "elevator": "elevator",
+}
+
+_EMPTY_ARRAY = literal_column("'[]'::json")
+
+
+def _json_object(pairs) -> ColumnElement:
+    args = []
+    for key, value in pairs:
+        args += [literal_column(f"'{key}'"), value]
+    return func.json_build_object(*args)
+
+
+def _photos_json(home_id) -> ColumnElement:
+    # Имена фото объявления массивом в порядке загрузки
+    photos = (
+        select(func.json_agg(aggregate_order_by(Photo.photo, Photo.id)))
+        .where(Photo.home_id == home_id)
+        .scalar_subquery()
+    )
+    return func.coalesce(photos, _EMPTY_ARRAY)
+
+
+def _ad_options_json(home_id) -> ColumnElement:
+    # Опции с пустыми строками вместо отсутствующих значений, как в ответе /ads/
+    options = (
+        select(_json_object((key, func.coalesce(getattr(Options, column), "")) for key, column in AD_OPTION_KEYS.items()))
+        .where(Options.home_id == home_id)
+        .order_by(Options.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    return func.coalesce(options, _json_object((key, literal_column("''")) for key in AD_OPTION_KEYS))
+
+
+def _card_json(source, keys=CARD_KEYS, photos: Optional[ColumnElement] = None) -> ColumnElement:
+    # source — модель Home или колонки подзапроса с теми же именами;
+    # photos — готовый JSON-массив фото, если он уже есть в источнике (сводка)
+    special = {
+        "photos": lambda: photos if photos is not None else _photos_json(source.id),
+        "options": lambda: _ad_options_json(source.id),
+    }
+    return _json_object((key, special[key]() if key in special else getattr(source, key)) for key in keys)
+
+
+def _json_array(element, order_by) -> ColumnElement:
+    return cast(func.coalesce(func.json_agg(aggregate_order_by(element, order_by)), _EMPTY_ARRAY), Text)
+
+
+async def get_listing_page_json(
+        db: AsyncSession,
+        filters: ListingFilters,
+        cursor: Optional[int] = None,
+        limit: int = LISTING_PAGE_SIZE,
+) -> bytes:
+    # То же, что get_listing_page, но страница и курсор вычисляются одним запросом в готовый JSON
+    limit = min(limit, LISTING_MAX_PAGE_SIZE)
+    page = (
+        select(*(getattr(ListingSummary, key) for key in CARD_KEYS),
+               func.row_number().over(order_by=ListingSummary.id.desc()).label("rn"))
+        .order_by(ListingSummary.id.desc())
+        .limit(limit + 1)
+    )
+    page = apply_listing_filters(page, filters, ListingSummary)
+    if cursor is not None:
+        page = page.where(ListingSummary.id < cursor)
+    page = page.subquery()
+
+    in_page = page.c.rn <= limit
+    stmt = select(
+        cast(
+            func.coalesce(
+                func.json_agg(aggregate_order_by(_card_json(page.c, photos=page.c.photos), page.c.id.desc())).filter(in_page),
+                _EMPTY_ARRAY,
+            ),
+            Text,
+        ).label("items"),
+        # Последний id страницы, если за ней есть ещё строки
+        case((func.count() > limit, func.min(page.c.id).filter(in_page))).label("next_cursor"),
+    )
+    row = (await db.execute(stmt)).one()
+    next_cursor = "null" if row.next_cursor is None else str(row.next_cursor)
+    return f'{{"items":{row.items},"next_cursor":{next_cursor}}}'.encode()
+
+
+async def get_user_cards_json(db: AsyncSession, user_id: int) -> bytes:
+    # Карточки всех объявлений пользователя (/itemsbyid)
+    stmt = select(_json_array(_card_json(Home), Home.id)).where(Home.user_id == user_id)
+    return (await db.execute(stmt)).scalar_one().encode()
+
+
+async def get_user_ads_json(db: AsyncSession, user_id: int) -> Optional[bytes]:
+    # Объявления пользователя с опциями (/ads/); None — объявлений нет
+    stmt = (
+        select(_json_array(_card_json(Home, AD_KEYS), Home.id), func.count())
+        .where(Home.user_id == user_id)
+    )
+    body, count = (await db.execute(stmt)).one()
+    return body.encode() if count else None
+
+
+async def get_real_estate_json(db: AsyncSession, user_id: int) -> Optional[bytes]:
+    # Объявления в форме схемы AddRealEstate (/get-real-estate/); None — объявлений нет
+    rooms = (
+        select(Options.numbers_of_room)
+        .where(Options.home_id == Home.id)
+        .order_by(Options.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    first_photo = (
+        select(Photo.photo)
+        .where(Photo.home_id == Home.id)
+        .order_by(Photo.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    item = _json_object((
+        ("id", Home.id),
+        ("name", Home.name),
+        ("price", Home.price),
+        ("type_of_transaction", Home.type_of_transaction),
+        ("type_of_housing", Home.type_of_housing),
+        ("number_of_rooms", func.coalesce(rooms, "")),
+        ("description", func.coalesce(Home.description, "")),
+        ("options", cast(_ad_options_json(Home.id), Text)),
+        ("latitude", Home.latitude),
+        ("longitude", Home.longitude),
+        ("address", Home.address),
+        ("photo", func.coalesce("/operations/get-photo/" + cast(Home.id, Text) + "/" + first_photo, "")),
+    ))
+    stmt = select(_json_array(item, Home.id), func.count()).where(Home.user_id == user_id)
+    body, count = (await db.execute(stmt)).one()
+    return body.encode() if count else None
@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urljoin
+
+from lxml import html as lxml_html
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import NEWS_SOURCE, NEWS_REFRESH_MINUTES
+from app.database import async_session_maker
+from app.models.users import News
+from app.operations.cache import news_cache
+from app.operations.http_clients import http_clients, NEWS
+
+logger = logging.getLogger(__name__)
+
+NEWS_PAGE_SIZE = 20
+NEWS_MAX_PAGE_SIZE = 100
+
+NEWS_FIELDS = ("title", "image_url", "views", "date", "content")
+
+
+@dataclass
+class FetchResult:
+    body: Optional[bytes]  # None — страница не изменилась с прошлой загрузки
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+class NewsSource:
+    base_url: str
+
+    async def fetch(self, etag: Optional[str] = None, last_modified: Optional[str] = None) -> FetchResult:
+        raise NotImplementedError
+
+
+class HttpNewsSource(NewsSource):
+    # Условный GET через общий клиент NEWS: при неизменной странице сайт отвечает 304 без тела
+    def __init__(self, url: str):
+        self.base_url = url
+
+    async def fetch(self, etag: Optional[str] = None, last_modified: Optional[str] = None) -> FetchResult:
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        response = await http_clients.get(NEWS).get(self.base_url, headers=headers)
+        if response.status_code == 304:
+            return FetchResult(None, etag, last_modified)
+        response.raise_for_status()
+        return FetchResult(response.content, response.headers.get("etag"), response.headers.get("last-modified"))
+
+
+class FileNewsSource(NewsSource):
+    # Сохранённая страница на диске — для загрузки без сети; версия файла определяется по mtime
+    def __init__(self, path: Path, base_url: str = "https://realt.by/news/"):
+        self.path = path
+        self.base_url = base_url
+
+    async def fetch(self, etag: Optional[str] = None, last_modified: Optional[str] = None) -> FetchResult:
+        version = f"{os.stat(self.path).st_mtime_ns:x}"
+        if version == etag:
+            return FetchResult(None, etag)
+        return FetchResult(await asyncio.to_thread(self.path.read_bytes), version)
+
+
+def make_source(location: str) -> NewsSource:
+    if location.startswith("file://"):
+        return FileNewsSource(Path(location.removeprefix("file://")))
+    return HttpNewsSource(location)
+
+
+def _has_class(name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def _first(nodes):
+    return nodes[0] if nodes else None
+
+
+def _text(node) -> Optional[str]:
+    if node is None:
+        return None
+    return " ".join(node.text_content().split()) or None
+
+
+def parse_news_html(page: bytes | str, base_url: str) -> list[dict]:
+    # Синхронный разбор lxml: вызывается в потоке, чтобы не занимать цикл событий.
+    # Новость без ссылки пропускается — ссылка служит ключом дедупликации
+    tree = lxml_html.fromstring(page)
+    items = []
+    for node in tree.xpath(f"//div[{_has_class('bd-item')}]"):
+        link = _first(node.xpath(f".//div[{_has_class('title')}]//a[{_has_class('b12')}]"))
+        href = link.get("href") if link is not None else None
+        if not href:
+            continue
+        image = _first(node.xpath(".//img"))
+        items.append({
+            "url": urljoin(base_url, href),
+            "title": _text(link),
+            "image_url": urljoin(base_url, image.get("src")) if image is not None and image.get("src") else None,
+            "views": _text(_first(node.xpath(f".//span[{_has_class('views')}]"))),
+            "date": _text(_first(node.xpath(f".//span[{_has_class('data')}]"))),
+            "content": _text(_first(node.xpath(f".//div[{_has_class('bd-item-right-center-2')}]"))),
+        })
+    return items
+
+
+async def upsert_news(items: list[dict]) -> int:
+    # На странице новые новости сверху: вставляем снизу вверх, чтобы у свежих id был больше.
+    # Уже известные url обновляются, только если что-то поменялось; возвращает число затронутых строк
+    unique = {}
+    for item in reversed(items):
+        unique.setdefault(item["url"], item)
+    if not unique:
+        return 0
+    now = datetime.utcnow()
+    stmt = insert(News).values([{**item, "first_seen_at": now, "updated_at": now} for item in unique.values()])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[News.url],
+        set_={**{field: stmt.excluded[field] for field in NEWS_FIELDS}, "updated_at": stmt.excluded.updated_at},
+        where=tuple_(*(getattr(News, field) for field in NEWS_FIELDS)).is_distinct_from(
+            tuple_(*(stmt.excluded[field] for field in NEWS_FIELDS))
+        ),
+    ).returning(News.id)
+    async with async_session_maker() as db:
+        result = await db.execute(stmt)
+        changed = len(result.all())
+        await db.commit()
+    return changed
+
+
+class NewsIngestor:
+    # Периодическая загрузка новостей в таблицу news: стартует в lifespan приложения.
+    # ETag/Last-Modified хранятся в памяти: после перезапуска первая загрузка будет полной
+    def __init__(self, source: NewsSource, interval_minutes: int = NEWS_REFRESH_MINUTES):
+        self.source = source
+        self.interval = interval_minutes * 60
+        self._etag = None
+        self._last_modified = None
+        self._task = None
+
+    async def ingest(self) -> int:
+        result = await self.source.fetch(self._etag, self._last_modified)
+        if result.body is None:
+            return 0
+        items = await asyncio.to_thread(parse_news_html, result.body, self.source.base_url)
+        if not items:
+            logger.warning(f"No news found on {self.source.base_url}, page layout may have changed")
+        changed = await upsert_news(items)
+        # Валидаторы запоминаются только после сохранения: иначе сбой записи спрятался бы за 304
+        self._etag, self._last_modified = result.etag, result.last_modified
+        if changed:
+            news_cache.clear()
+        return changed
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.ingest()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error in news ingestor")
+            await asyncio.sleep(self.interval)
+
+
+news_ingestor = NewsIngestor(make_source(NEWS_SOURCE))
+
+
+async def get_news_page(db: AsyncSession, cursor: Optional[int] = None, limit: int = NEWS_PAGE_SIZE):
+    # Keyset по id: свежие новости первыми; страницы кэшируются до следующей загрузки с изменениями
+    key = (cursor, limit)
+    cached = news_cache.get(key)
+    if cached is not None:
+        return cached
+
+    stmt = (
+        select(News.id, News.url, *(getattr(News, field) for field in NEWS_FIELDS))
+        .order_by(News.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        stmt = stmt.where(News.id < cursor)
+    rows = (await db.execute(stmt)).mappings().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]["id"]
+    page = ([dict(row) for row in rows], next_cursor)
+    news_cache.set(key, page)
+    return page
+
+
+if __name__ == "__main__":
+    # python -m app.operations.news [--source file:///tmp/news.html]
+    parser = argparse.ArgumentParser(description="Fetch news once and store them in the news table")
+    parser.add_argument("--source", default=NEWS_SOURCE, help="page URL or file:// path to a saved page")
+    args = parser.parse_args()
+
+    async def main():
+        try:
+            return await NewsIngestor(make_source(args.source)).ingest()
+        finally:
+            await http_clients.aclose()
+
+    print(f"Stored {asyncio.run(main())} news")
@@ -0,0 +1,46 @@
+import re
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+# Цена, площадь и параметры квартиры приходят из формы строками ("85 000", "54,5").
+# Здесь они приводятся к числам для типизированных колонок *_value.
+# Правила совпадают с бэкфилом в миграции 122277ced8b1.
+
+_INT_RE = re.compile(r"^[0-9]{1,9}$")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def _clean(value) -> str:
+    if value is None:
+        return ""
+    return _SPACES_RE.sub("", str(value)).replace(",", ".")
+
+
+def to_decimal(value, int_digits: int = 12) -> Optional[Decimal]:
+    # int_digits соответствует точности колонки: Numeric(14, 2) -> 12 знаков до точки
+    cleaned = _clean(value)
+    if not re.fullmatch(rf"[0-9]{{1,{int_digits}}}(\.[0-9]{{1,2}})?", cleaned):
+        return None
+    try:
+        return Decimal(cleaned)
+    except InvalidOperation:
+        return None
+
+
+def to_int(value) -> Optional[int]:
+    cleaned = _clean(value)
+    if not _INT_RE.match(cleaned):
+        return None
+    return int(cleaned)
+
+
+def apply_numeric_fields(home=None, options=None):
+    # Заполняем числовые колонки по строковым значениям перед сохранением
+    if home is not None:
+        home.price_value = to_decimal(home.price)
+    if options is not None:
+        options.numbers_of_room_value = to_int(options.numbers_of_room)
+        options.square_value = to_decimal(options.square, int_digits=8)
+        options.year_of_construction_value = to_int(options.year_of_construction)
+        options.floor_value = to_int(options.floor)
+        options.ceiling_height_value = to_decimal(options.ceiling_height, int_digits=4)
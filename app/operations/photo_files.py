@@ -0,0 +1,71 @@
+import os
+import re
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from starlette.responses import FileResponse, Response
+
+from app.config import PHOTO_DIR, PHOTO_ACCEL_REDIRECT_PREFIX
+
+# Имена фото после загрузки через app.operations.uploads: <sha256>.<ext>
+CONTENT_ADDRESSED_RE = re.compile(r"^[0-9a-f]{64}\.(jpg|png|webp|gif)$")
+
+# Файл по такому URL никогда не меняется, поэтому кэшируется на год без перепроверок
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Старые uuid-имена тоже не перезаписываются, но доступ к ним идёт через проверку в БД
+LEGACY_CACHE_CONTROL = "public, max-age=86400"
+
+
+def is_content_addressed(name: str) -> bool:
+    return CONTENT_ADDRESSED_RE.match(name) is not None
+
+
+def photo_url(name: str, home_id: Optional[int] = None, size: Optional[str] = None) -> str:
+    # Для фото с хэшем в имени — постоянный URL без обращения к БД
+    if is_content_addressed(name) or home_id is None:
+        url = f"/operations/photos/{name}"
+    else:
+        url = f"/operations/get-photo/{home_id}/{name}"
+    return url + (f"?size={size}" if size else "")
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in tags
+
+
+def photo_response(
+        request: Request,
+        path: Path,
+        media_type: Optional[str] = None,
+        etag: Optional[str] = None,
+        cache_control: str = IMMUTABLE_CACHE_CONTROL,
+        vary_accept: bool = False,
+) -> Response:
+    # Отдача файла фото: один stat, сильный ETag, 304 на If-None-Match, Range через FileResponse
+    # или передача файла фронтовому прокси через X-Accel-Redirect
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if etag is None:
+        etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if vary_accept:
+        headers["Vary"] = "Accept"
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if PHOTO_ACCEL_REDIRECT_PREFIX:
+        relative = path.relative_to(PHOTO_DIR).as_posix()
+        headers["X-Accel-Redirect"] = PHOTO_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + relative
+        return Response(headers=headers, media_type=media_type)
+
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
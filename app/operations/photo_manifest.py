@@ -0,0 +1,213 @@
+import argparse
+import asyncio
+import logging
+import mimetypes
+import os
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import PHOTO_DIR, PHOTO_RECONCILE_INTERVAL_MINUTES, PHOTO_RECONCILE_DELETE_ORPHANS
+from app.database import async_session_maker
+from app.models.users import Photo
+from app.operations.cache import invalidate_listing
+from app.operations.images import PHOTO_VARIANTS, generate_variants, variant_path, image_size
+from app.operations.photo_files import photo_url
+from app.operations.uploads import StoredPhoto
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_MAX_HOMES = 100
+RECONCILE_BATCH_SIZE = 500
+# Файл моложе этого считается "в процессе загрузки": запись в БД могла ещё не закоммититься
+ORPHAN_GRACE_SECONDS = 3600
+
+OK, MISSING = "ok", "missing"
+
+
+def new_photo(home_id: int, stored: StoredPhoto) -> Photo:
+    # Запись о фото со всеми метаданными, известными после сохранения файла
+    return Photo(
+        home_id=home_id,
+        photo=stored.name,
+        content_hash=stored.content_hash,
+        width=stored.width,
+        height=stored.height,
+        size_bytes=stored.size,
+        mime_type=stored.mime_type,
+        variants=[],
+        status=OK,
+        checked_at=datetime.utcnow(),
+    )
+
+
+def manifest_entry(photo: Photo, size: Optional[str] = None) -> dict:
+    return {
+        "photo": photo.photo,
+        "url": photo_url(photo.photo, photo.home_id, size),
+        "width": photo.width,
+        "height": photo.height,
+        "size_bytes": photo.size_bytes,
+        "mime_type": photo.mime_type,
+        "content_hash": photo.content_hash,
+        # Готовые превью; остальные размеры сгенерируются при первом запросе
+        "variants": {name: photo_url(photo.photo, photo.home_id, name) for name in photo.variants or []},
+    }
+
+
+async def get_manifest(db: AsyncSession, home_ids: list[int], size: Optional[str] = None) -> dict[int, list[dict]]:
+    # Один запрос на любое число объявлений; отсутствующие на диске файлы пропускаются
+    result = await db.execute(
+        select(Photo)
+        .where(Photo.home_id.in_(home_ids), Photo.status != MISSING)
+        .order_by(Photo.home_id, Photo.id)
+    )
+    manifest = {home_id: [] for home_id in home_ids}
+    for photo in result.scalars():
+        manifest[photo.home_id].append(manifest_entry(photo, size))
+    return manifest
+
+
+async def generate_and_record_variants(names: list[str]):
+    # Фоновая генерация превью с отметкой готовых размеров в БД для манифеста
+    await generate_variants(names)
+    for name in names:
+        ready = [size for size in PHOTO_VARIANTS if variant_path(name, size, "webp").exists()]
+        if not ready:
+            continue
+        async with async_session_maker() as db:
+            await db.execute(update(Photo).where(Photo.photo == name).values(variants=ready))
+            await db.commit()
+
+
+def _check_files(rows) -> list[dict]:
+    # Выполняется в потоке: stat по пачке файлов и дозаполнение метаданных старых записей
+    now = datetime.utcnow()
+    changes = []
+    for row in rows:
+        path = PHOTO_DIR / row.photo
+        try:
+            stat_result = os.stat(path)
+        except FileNotFoundError:
+            changes.append({"id": row.id, "status": MISSING, "checked_at": now})
+            continue
+        values = {"id": row.id, "status": OK, "checked_at": now}
+        if row.size_bytes is None:
+            values["size_bytes"] = stat_result.st_size
+            values["mime_type"] = mimetypes.guess_type(row.photo)[0]
+            values["width"], values["height"] = image_size(path) or (None, None)
+        changes.append(values)
+    return changes
+
+
+def _find_orphans(referenced: set[str]) -> list[str]:
+    cutoff = time.time() - ORPHAN_GRACE_SECONDS
+    orphans = []
+    with os.scandir(PHOTO_DIR) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name not in referenced and entry.stat().st_mtime < cutoff:
+                orphans.append(entry.name)
+    return orphans
+
+
+def _remove_orphans(names: list[str]):
+    for name in names:
+        for path in [PHOTO_DIR / name] + [variant_path(name, size, fmt) for size in PHOTO_VARIANTS
+                                          for fmt in ("webp", "jpeg")]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+async def reconcile_photos() -> dict:
+    # Сверка записей с диском: помечает пропавшие файлы и находит файлы без записей
+    missing = 0
+    changed_homes = set()
+    last_id = 0
+    while True:
+        async with async_session_maker() as db:
+            result = await db.execute(
+                select(Photo.id, Photo.home_id, Photo.photo, Photo.status, Photo.size_bytes)
+                .where(Photo.id > last_id)
+                .order_by(Photo.id)
+                .limit(RECONCILE_BATCH_SIZE)
+            )
+            rows = result.all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            changes = await asyncio.to_thread(_check_files, rows)
+            previous = {row.id: row for row in rows}
+            for values in changes:
+                row = previous[values["id"]]
+                if values["status"] == MISSING:
+                    missing += 1
+                if values["status"] != row.status:
+                    changed_homes.add(row.home_id)
+            # Массовое обновление по первичному ключу одним executemany
+            await db.execute(update(Photo), changes)
+            await db.commit()
+
+    if changed_homes:
+        invalidate_listing(*changed_homes)
+
+    async with async_session_maker() as db:
+        result = await db.execute(select(Photo.photo).distinct())
+        referenced = set(result.scalars())
+    orphans = await asyncio.to_thread(_find_orphans, referenced)
+    if orphans:
+        logger.warning(f"Found {len(orphans)} photo files without database records")
+        if PHOTO_RECONCILE_DELETE_ORPHANS:
+            await asyncio.to_thread(_remove_orphans, orphans)
+
+    if missing:
+        logger.warning(f"{missing} photo records point to missing files")
+    return {"missing": missing, "orphans": len(orphans), "changed_homes": len(changed_homes)}
+
+
+class PhotoReconciler:
+    # Периодическая сверка в фоне: стартует в lifespan приложения
+    def __init__(self, interval_minutes: int = PHOTO_RECONCILE_INTERVAL_MINUTES):
+        self.interval = interval_minutes * 60
+        self._task = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await reconcile_photos()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error in photo reconciler")
+            await asyncio.sleep(self.interval)
+
+
+photo_reconciler = PhotoReconciler()
+
+
+if __name__ == "__main__":
+    # python -m app.operations.photo_manifest [--delete-orphans]
+    parser = argparse.ArgumentParser(description="Reconcile photo records with files on disk")
+    parser.add_argument("--delete-orphans", action="store_true", help="remove files that no record refers to")
+    args = parser.parse_args()
+    if args.delete_orphans:
+        PHOTO_RECONCILE_DELETE_ORPHANS = True
+    print(asyncio.run(reconcile_photos()))
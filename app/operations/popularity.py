@@ -0,0 +1,312 @@
+import argparse
+import asyncio
+import logging
+import math
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, update, func, case, literal, Integer, BigInteger, Float
+from sqlalchemy.dialects.postgresql import insert, ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import POPULARITY_FLUSH_SECONDS, TRENDING_HALF_LIFE_HOURS
+from app.database import async_session_maker
+from app.models.users import Home, HomeStats, ListingSummary, FavoritesHome
+from app.operations.cache import trending_cache
+from app.operations.listings import apply_listing_filters, CARD_KEYS
+from app.shemas.schemas import ListingFilters
+
+logger = logging.getLogger(__name__)
+
+# Вклад событий в рейтинг trending
+VIEW_WEIGHT = 1.0
+FAVORITE_WEIGHT = 5.0
+# Столько объявлений в буфере — сброс запускается раньше срока
+FLUSH_MAX_HOMES = 5000
+# Если БД недоступна долго, буфер не растёт бесконечно: лишнее отбрасывается
+MAX_PENDING_HOMES = 50000
+
+POPULAR_MAX_OFFSET = 1000
+TRENDING_PAGE_SIZE = 20
+TRENDING_MAX_PAGE_SIZE = 100
+# Объявления с текущим рейтингом ниже этого в /trending не попадают
+TRENDING_MIN_SCORE = 0.5
+
+# Рейтинг хранится в лог-шкале относительно фиксированной эпохи: ln(Σ вес·e^(λ·t)).
+# Новое событие только добавляется к сумме, а текущее значение — это e^(trending_log - λ·now),
+# поэтому порядок по trending_log совпадает с порядком по затухшему рейтингу и строки не пересчитываются
+TRENDING_EPOCH = datetime(2026, 1, 1)
+DECAY_PER_HOUR = math.log(2) / TRENDING_HALF_LIFE_HOURS
+# exp() в Postgres падает с underflow на больших отрицательных аргументах, а вклад меньше e^-50 не важен
+_LOG_DIFF_LIMIT = 50
+
+VIEWS, FAVORITES, TRENDING = range(3)
+
+
+def _hours(moment: datetime) -> float:
+    return (moment - TRENDING_EPOCH).total_seconds() / 3600
+
+
+def event_log_weight(weight: float, moment: Optional[datetime] = None) -> float:
+    return math.log(weight) + DECAY_PER_HOUR * _hours(moment or datetime.utcnow())
+
+
+def logaddexp(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    # ln(e^a + e^b) без переполнения
+    if a is None:
+        return b
+    if b is None:
+        return a
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(max(low - high, -_LOG_DIFF_LIMIT)))
+
+
+def _sql_logaddexp(a, b):
+    return case(
+        (a.is_(None), b),
+        (b.is_(None), a),
+        else_=func.greatest(a, b) + func.ln(1 + func.exp(func.greatest(-func.abs(a - b), -_LOG_DIFF_LIMIT))),
+    )
+
+
+def trending_score(trending_log: Optional[float], now: Optional[datetime] = None) -> float:
+    if trending_log is None:
+        return 0.0
+    exponent = trending_log - DECAY_PER_HOUR * _hours(now or datetime.utcnow())
+    return math.exp(max(exponent, -_LOG_DIFF_LIMIT))
+
+
+async def write_counters(pending: dict[int, list]):
+    # Один INSERT ... SELECT FROM unnest(массивы) ON CONFLICT DO UPDATE на весь буфер.
+    # Строки идут по возрастанию home_id: воркеры берут блокировки в одном порядке и не ловят deadlock.
+    # JOIN с home отбрасывает счётчики объявлений, удалённых до сброса
+    home_ids = sorted(pending)
+    data = func.unnest(
+        literal(home_ids, ARRAY(Integer)),
+        literal([pending[home_id][VIEWS] for home_id in home_ids], ARRAY(BigInteger)),
+        literal([pending[home_id][FAVORITES] for home_id in home_ids], ARRAY(Integer)),
+        literal([pending[home_id][TRENDING] for home_id in home_ids], ARRAY(Float)),
+    ).table_valued("home_id", "views", "favorites", "trending_log").render_derived(name="pending")
+
+    stmt = insert(HomeStats).from_select(
+        ["home_id", "views_count", "favorites_count", "trending_log", "updated_at"],
+        select(
+            data.c.home_id,
+            data.c.views,
+            # Снятие из избранного, чей +1 ещё не сброшен, не должно дать отрицательный счётчик
+            func.greatest(data.c.favorites, 0),
+            data.c.trending_log,
+            literal(datetime.utcnow()),
+        )
+        .join(Home, Home.id == data.c.home_id)
+        .order_by(data.c.home_id),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[HomeStats.home_id],
+        set_={
+            "views_count": HomeStats.views_count + stmt.excluded.views_count,
+            "favorites_count": func.greatest(HomeStats.favorites_count + stmt.excluded.favorites_count, 0),
+            "trending_log": _sql_logaddexp(HomeStats.trending_log, stmt.excluded.trending_log),
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    async with async_session_maker() as db:
+        await db.execute(stmt)
+        await db.commit()
+
+
+class PopularityCounters:
+    # Буфер счётчиков в памяти воркера: home_id -> [просмотры, изменение избранного, вклад в trending].
+    # Фоновая задача сбрасывает его в home_stats раз в flush_seconds; стартует в lifespan приложения
+    def __init__(self, flush_seconds: float = POPULARITY_FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self._pending: dict[int, list] = {}
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def _entry(self, home_id: int) -> list:
+        entry = self._pending.get(home_id)
+        if entry is None:
+            entry = self._pending[home_id] = [0, 0, None]
+            if len(self._pending) >= FLUSH_MAX_HOMES:
+                self._wakeup.set()
+        return entry
+
+    def record_view(self, home_id: int):
+        entry = self._entry(home_id)
+        entry[VIEWS] += 1
+        entry[TRENDING] = logaddexp(entry[TRENDING], event_log_weight(VIEW_WEIGHT))
+
+    def record_favorite(self, home_id: int, delta: int):
+        entry = self._entry(home_id)
+        entry[FAVORITES] += delta
+        if delta > 0:
+            entry[TRENDING] = logaddexp(entry[TRENDING], event_log_weight(FAVORITE_WEIGHT * delta))
+
+    def _restore(self, pending: dict[int, list]):
+        # Неудачный сброс возвращается в буфер и уйдёт со следующим
+        for home_id, (views, favorites, trending_log) in pending.items():
+            if home_id not in self._pending and len(self._pending) >= MAX_PENDING_HOMES:
+                logger.warning(f"Popularity buffer is full, dropping counters for {len(pending)} homes")
+                return
+            entry = self._pending.setdefault(home_id, [0, 0, None])
+            entry[VIEWS] += views
+            entry[FAVORITES] += favorites
+            entry[TRENDING] = logaddexp(entry[TRENDING], trending_log)
+
+    async def flush(self) -> int:
+        async with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            try:
+                await write_counters(pending)
+            except BaseException:
+                self._restore(pending)
+                raise
+            return len(pending)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Последний сброс, чтобы не потерять накопленное при остановке
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Error flushing popularity counters on shutdown")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error flushing popularity counters")
+
+
+popularity_counters = PopularityCounters()
+
+
+def _card(row) -> dict:
+    card = {key: getattr(row, key) for key in CARD_KEYS}
+    card["favorites_count"] = row.favorites_count or 0
+    card["views_count"] = row.views_count or 0
+    return card
+
+
+async def get_popular_page(
+        db: AsyncSession,
+        filters: ListingFilters,
+        offset: int = 0,
+        limit: int = TRENDING_PAGE_SIZE,
+):
+    # Сортировка "популярные": больше добавлений в избранное, затем больше просмотров.
+    # Порядок меняется между запросами, поэтому страницы по смещению, а не по курсору.
+    # Строка home_stats есть у каждого объявления (триггер из миграции 3020670498a8), поэтому
+    # внутренний JOIN и порядок ровно как в индексе ix_home_stats_popular — без сортировки всей ленты
+    stmt = (
+        select(
+            *(getattr(ListingSummary, key) for key in CARD_KEYS),
+            HomeStats.favorites_count,
+            HomeStats.views_count,
+        )
+        .join(HomeStats, HomeStats.home_id == ListingSummary.id)
+        .order_by(
+            HomeStats.favorites_count.desc(),
+            HomeStats.views_count.desc(),
+            HomeStats.home_id.desc(),
+        )
+        .limit(limit + 1)
+        .offset(offset)
+    )
+    stmt = apply_listing_filters(stmt, filters, ListingSummary)
+    rows = (await db.execute(stmt)).all()
+
+    next_offset = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        if offset + limit <= POPULAR_MAX_OFFSET:
+            next_offset = offset + limit
+    return [_card(row) for row in rows], next_offset
+
+
+async def get_trending(db: AsyncSession, filters: ListingFilters, limit: int = TRENDING_PAGE_SIZE) -> list[dict]:
+    # Порог по trending_log отсекает затухшие объявления прямо по индексу ix_home_stats_trending_log
+    key = (tuple(sorted(filters.model_dump().items())), limit)
+    cached = trending_cache.get(key)
+    if cached is not None:
+        return cached
+
+    now = datetime.utcnow()
+    threshold = math.log(TRENDING_MIN_SCORE) + DECAY_PER_HOUR * _hours(now)
+    stmt = (
+        select(
+            *(getattr(ListingSummary, key) for key in CARD_KEYS),
+            HomeStats.favorites_count,
+            HomeStats.views_count,
+            HomeStats.trending_log,
+        )
+        .join(HomeStats, HomeStats.home_id == ListingSummary.id)
+        .where(HomeStats.trending_log >= threshold)
+        .order_by(HomeStats.trending_log.desc(), ListingSummary.id.desc())
+        .limit(limit)
+    )
+    stmt = apply_listing_filters(stmt, filters, ListingSummary)
+    rows = (await db.execute(stmt)).all()
+
+    items = [{**_card(row), "trending_score": round(trending_score(row.trending_log, now), 3)} for row in rows]
+    trending_cache.set(key, items)
+    return items
+
+
+async def recount_favorites() -> int:
+    # Сверка favorites_count с user_favorites: буферизованные изменения теряются при падении воркера
+    counts = (
+        select(FavoritesHome.home_id, func.count().label("favorites"))
+        .group_by(FavoritesHome.home_id)
+        .subquery()
+    )
+    async with async_session_maker() as db:
+        stmt = insert(HomeStats).from_select(
+            ["home_id", "favorites_count", "updated_at"],
+            select(counts.c.home_id, counts.c.favorites, literal(datetime.utcnow())),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[HomeStats.home_id],
+            set_={"favorites_count": stmt.excluded.favorites_count},
+            where=HomeStats.favorites_count != stmt.excluded.favorites_count,
+        )
+        result = await db.execute(stmt)
+        changed = result.rowcount
+        result = await db.execute(
+            update(HomeStats)
+            .where(HomeStats.favorites_count != 0, HomeStats.home_id.not_in(select(counts.c.home_id)))
+            .values(favorites_count=0)
+        )
+        await db.commit()
+    return changed + result.rowcount
+
+
+if __name__ == "__main__":
+    # python -m app.operations.popularity --recount-favorites
+    parser = argparse.ArgumentParser(description="Maintain listing popularity counters")
+    parser.add_argument("--recount-favorites", action="store_true", help="recompute favorite counts from user_favorites")
+    args = parser.parse_args()
+    if args.recount_favorites:
+        print(f"Updated {asyncio.run(recount_favorites())} counters")
@@ -0,0 +1,108 @@
+import html
+
+from sqlalchemy import select, func, or_, literal, Float
+from sqlalchemy.dialects.postgresql import aggregate_order_by, REGCONFIG
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.users import Home, Photo
+from app.operations.listings import apply_listing_filters
+from app.shemas.schemas import ListingFilters
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
+# Глубже ранжированную выдачу листают редко, а OFFSET там дорогой
+SEARCH_MAX_OFFSET = 1000
+# Вклад нечёткого совпадения адреса относительно полнотекстового ранга
+TRIGRAM_WEIGHT = 0.5
+
+# ts_headline отмечает совпадения маркерами, а не тегами: текст объявления экранируется уже после,
+# и только маркеры превращаются в <b>…</b>. Сами маркеры из текста объявления вырезаются заранее
+HIGHLIGHT_START, HIGHLIGHT_STOP = "\u27e6", "\u27e7"
+HEADLINE_OPTIONS = (
+    f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, "
+    "MaxWords=25, MinWords=8, MaxFragments=2, FragmentDelimiter= … "
+)
+
+
+def _config(name: str):
+    return literal(name, REGCONFIG)
+
+
+def _headline(column, query):
+    text = func.translate(func.coalesce(column, ""), HIGHLIGHT_START + HIGHLIGHT_STOP, "")
+    return func.ts_headline(_config("russian"), text, query, HEADLINE_OPTIONS)
+
+
+def _highlight_html(headline: str | None) -> str | None:
+    if headline is None:
+        return None
+    return html.escape(headline).replace(HIGHLIGHT_START, "<b>").replace(HIGHLIGHT_STOP, "</b>")
+
+
+def search_query(q: str):
+    # Запрос пользователя в синтаксисе веб-поиска ("кавычки", -исключение, or) в обеих конфигурациях
+    return func.websearch_to_tsquery(_config("russian"), q).op("||")(func.websearch_to_tsquery(_config("simple"), q))
+
+
+async def search_listings(
+        db: AsyncSession,
+        q: str,
+        filters: ListingFilters,
+        limit: int = SEARCH_PAGE_SIZE,
+        offset: int = 0,
+) -> list[dict]:
+    query = search_query(q)
+    rank = func.ts_rank_cd(Home.search_vector, query)
+    fuzzy = func.similarity(Home.address, q)
+    score = (rank + fuzzy * TRIGRAM_WEIGHT).cast(Float)
+
+    # Совпадения ищутся по GIN-индексам: @@ по search_vector и % (pg_trgm) по адресу
+    matches = (
+        select(Home.id, score.label("score"))
+        .where(or_(Home.search_vector.op("@@")(query), Home.address.op("%")(q)))
+        .order_by(score.desc(), Home.id.desc())
+        .limit(limit)
+        .offset(offset)
+    )
+    matches = apply_listing_filters(matches, filters).subquery()
+
+    # Подсветка считается только для строк страницы — ts_headline заметно дороже ранжирования
+    photos = (
+        select(func.array_agg(aggregate_order_by(Photo.photo, Photo.id)))
+        .where(Photo.home_id == Home.id)
+        .scalar_subquery()
+    )
+    stmt = (
+        select(
+            Home.id,
+            Home.name,
+            Home.price,
+            Home.address,
+            Home.type_of_transaction,
+            Home.type_of_housing,
+            photos.label("photos"),
+            matches.c.score,
+            _headline(Home.name, query).label("name_highlight"),
+            _headline(Home.description, query).label("description_highlight"),
+        )
+        .join(matches, matches.c.id == Home.id)
+        .order_by(matches.c.score.desc(), Home.id.desc())
+    )
+    rows = (await db.execute(stmt)).all()
+    return [
+        {
+            "id": row.id,
+            "name": row.name,
+            "price": row.price,
+            "address": row.address,
+            "type_of_transaction": row.type_of_transaction,
+            "type_of_housing": row.type_of_housing,
+            "photos": row.photos or [],
+            "score": row.score,
+            "highlight": {
+                "name": _highlight_html(row.name_highlight),
+                "description": _highlight_html(row.description_highlight),
+            },
+        }
+        for row in rows
+    ]
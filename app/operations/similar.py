@@ -0,0 +1,211 @@
+import logging
+from decimal import Decimal
+
+from fastapi import BackgroundTasks
+from sqlalchemy import select, delete, or_, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.database import async_session_maker
+from app.models.users import Home, Options, SimilarHome
+from app.operations.cache import similar_cache, invalidate_listing
+from app.operations.geo import haversine_km
+
+logger = logging.getLogger(__name__)
+
+# Сколько соседей храним на объявление и сколько кандидатов оцениваем при пересчёте
+SIMILAR_TOP_K = 12
+CANDIDATE_LIMIT = 200
+# Кандидаты берутся из окна ±50% по цене (индекс ix_home_price_value)
+PRICE_WINDOW = Decimal("0.5")
+# Расстояние, после которого география перестаёт влиять на похожесть
+DISTANCE_SCALE_KM = 10.0
+
+# Веса признаков во взвешенном расстоянии
+WEIGHTS = {
+    "price": 1.0,
+    "area": 0.7,
+    "rooms": 0.5,
+    "housing": 0.8,
+    "distance": 0.6,
+}
+
+# Штраф за признак, который не заполнен у одного из объявлений
+MISSING_PENALTY = 0.5
+
+_feature_columns = (
+    Home.id,
+    Home.type_of_transaction,
+    Home.type_of_housing,
+    Home.price_value,
+    Home.latitude,
+    Home.longitude,
+    Options.square_value,
+    Options.numbers_of_room_value,
+)
+
+
+def _relative_diff(a, b) -> float:
+    if a is None or b is None:
+        return MISSING_PENALTY
+    a, b = float(a), float(b)
+    top = max(abs(a), abs(b))
+    return abs(a - b) / top if top else 0.0
+
+
+def similarity_distance(a, b) -> float:
+    # Взвешенное расстояние между двумя объявлениями: 0 — идентичные, больше — менее похожие
+    price = _relative_diff(a.price_value, b.price_value)
+    area = _relative_diff(a.square_value, b.square_value)
+
+    if a.numbers_of_room_value is None or b.numbers_of_room_value is None:
+        rooms = MISSING_PENALTY
+    else:
+        rooms = min(abs(a.numbers_of_room_value - b.numbers_of_room_value), 3) / 3
+
+    housing = 0.0 if a.type_of_housing == b.type_of_housing else 1.0
+
+    if None in (a.latitude, a.longitude, b.latitude, b.longitude):
+        distance = MISSING_PENALTY
+    else:
+        km = haversine_km(a.latitude, a.longitude, b.latitude, b.longitude)
+        distance = min(km / DISTANCE_SCALE_KM, 1.0)
+
+    return (
+        WEIGHTS["price"] * price
+        + WEIGHTS["area"] * area
+        + WEIGHTS["rooms"] * rooms
+        + WEIGHTS["housing"] * housing
+        + WEIGHTS["distance"] * distance
+    )
+
+
+async def _load_features(db: AsyncSession, home_id: int):
+    result = await db.execute(
+        select(*_feature_columns)
+        .outerjoin(Options, Options.home_id == Home.id)
+        .where(Home.id == home_id)
+    )
+    return result.first()
+
+
+async def rebuild_neighbours(db: AsyncSession, home_id: int) -> list[int]:
+    # Пересчитывает top-K соседей одного объявления; возвращает их id
+    home = await _load_features(db, home_id)
+    await db.execute(delete(SimilarHome).where(SimilarHome.home_id == home_id))
+    if home is None or home.price_value is None:
+        return []
+
+    min_price = home.price_value * (1 - PRICE_WINDOW)
+    max_price = home.price_value * (1 + PRICE_WINDOW)
+    result = await db.execute(
+        select(*_feature_columns)
+        .outerjoin(Options, Options.home_id == Home.id)
+        .where(
+            Home.price_value.between(min_price, max_price),
+            Home.type_of_transaction == home.type_of_transaction,
+            Home.id != home_id,
+        )
+        .order_by(func.abs(Home.price_value - home.price_value))
+        .limit(CANDIDATE_LIMIT)
+    )
+    ranked = sorted(
+        ((similarity_distance(home, candidate), candidate.id) for candidate in result.all()),
+    )[:SIMILAR_TOP_K]
+
+    if ranked:
+        # Параллельный пересчёт того же объявления (фоновые задачи разных запросов) вставляет те же строки
+        await db.execute(
+            insert(SimilarHome).on_conflict_do_nothing(index_elements=["home_id", "similar_id"]),
+            [{"home_id": home_id, "similar_id": similar_id, "score": score} for score, similar_id in ranked],
+        )
+    return [similar_id for _, similar_id in ranked]
+
+
+async def forget_home(db: AsyncSession, home_id: int) -> set[int]:
+    # Убирает объявление из таблицы соседей; возвращает объявления, чьи списки стали неполными
+    result = await db.execute(
+        delete(SimilarHome)
+        .where(or_(SimilarHome.home_id == home_id, SimilarHome.similar_id == home_id))
+        .returning(SimilarHome.home_id)
+    )
+    return set(result.scalars().all()) - {home_id}
+
+
+async def refresh_similar(db: AsyncSession, home_id: int) -> set[int]:
+    # Инкрементальное обновление после изменения объявления: пересчитываем его собственный
+    # список и списки объявлений, которые ссылались на него или стали его соседями
+    result = await db.execute(select(SimilarHome.home_id).where(SimilarHome.similar_id == home_id))
+    affected = set(result.scalars().all())
+    affected.update(await rebuild_neighbours(db, home_id))
+    affected.discard(home_id)
+    for other_id in affected:
+        await rebuild_neighbours(db, other_id)
+    return affected | {home_id}
+
+
+async def refresh_similar_in_background(home_id: int):
+    # Запускается через BackgroundTasks: своя сессия, ответ клиенту не ждёт пересчёта
+    try:
+        async with async_session_maker() as db:
+            affected = await refresh_similar(db, home_id)
+            await db.commit()
+        invalidate_listing(*affected)
+    except Exception:
+        logger.exception(f"Error while refreshing similar homes for home {home_id}")
+
+
+async def rebuild_neighbours_in_background(home_ids: set[int]):
+    # После удаления объявления дозаполняем списки тех, кто на него ссылался
+    try:
+        async with async_session_maker() as db:
+            for home_id in home_ids:
+                await rebuild_neighbours(db, home_id)
+            await db.commit()
+        invalidate_listing(*home_ids)
+    except Exception:
+        logger.exception(f"Error while rebuilding similar homes for {sorted(home_ids)}")
+
+
+def _serialize(item: Home, score: float) -> dict:
+    return {
+        "id": item.id,
+        "name": item.name,
+        "price": item.price,
+        "address": item.address,
+        "type_of_transaction": item.type_of_transaction,
+        "type_of_housing": item.type_of_housing,
+        "latitude": item.latitude,
+        "longitude": item.longitude,
+        "photos": [photo.photo for photo in item.photos],
+        "score": round(score, 4),
+    }
+
+
+async def get_similar(
+        db: AsyncSession,
+        home_id: int,
+        background_tasks: BackgroundTasks,
+        limit: int = SIMILAR_TOP_K,
+) -> list[dict]:
+    cached = similar_cache.get(home_id)
+    if cached is not None:
+        return cached[:limit]
+
+    stmt = (
+        select(Home, SimilarHome.score)
+        .join(SimilarHome, SimilarHome.similar_id == Home.id)
+        .where(SimilarHome.home_id == home_id)
+        .order_by(SimilarHome.score, Home.id)
+        .options(selectinload(Home.photos))
+    )
+    rows = (await db.execute(stmt)).all()
+    if not rows:
+        # Соседи ещё не посчитаны (новое объявление или данные до миграции): чтение ничего не пишет,
+        # пересчёт уходит в фон и по завершении сбрасывает закэшированный пустой список
+        background_tasks.add_task(rebuild_neighbours_in_background, {home_id})
+
+    cached = [_serialize(item, score) for item, score in rows]
+    similar_cache.set(home_id, cached)
+    return cached[:limit]
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import BinaryIO, Optional
+
+from fastapi import HTTPException, UploadFile
+
+from app.config import PHOTO_DIR, MAX_PHOTO_SIZE, UPLOAD_CONCURRENCY
+from app.operations.images import image_size
+
+logger = logging.getLogger(__name__)
+
+# mkstemp создаёт файлы с правами 0600; фото же раздаёт nginx (X-Accel-Redirect) от другого пользователя
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+PHOTO_FILE_MODE = 0o666 & ~_UMASK
+
+# Копируем крупными блоками за один переход в пул потоков на файл
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+ALLOWED_PHOTO_TYPES = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+
+
+@dataclass
+class StoredPhoto:
+    name: str  # Имя файла в PHOTO_DIR: <sha256>.<ext>
+    content_hash: str
+    size: int
+    mime_type: str
+    created: bool  # False — такой файл уже был на диске (дедупликация)
+    width: Optional[int] = None
+    height: Optional[int] = None
+    # Собственная копия файла до коммита: если создатель общего файла откатится и удалит его,
+    # release_photos вернёт файл на место
+    hold: Optional[str] = None
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    # Тип определяем по сигнатуре файла, а не по Content-Type от клиента
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+async def validate_photo(photo: UploadFile) -> str:
+    # Проверки до записи на диск: размер из заголовков multipart и сигнатура файла
+    if photo.size is not None and photo.size > MAX_PHOTO_SIZE:
+        raise HTTPException(status_code=413, detail=f"Photo {photo.filename} is too large")
+
+    head = await photo.read(16)
+    await photo.seek(0)
+    mime_type = sniff_image_type(head)
+    if mime_type not in ALLOWED_PHOTO_TYPES:
+        raise HTTPException(status_code=415, detail=f"Unsupported photo type: {photo.filename}")
+    return mime_type
+
+
+def store_file(source: BinaryIO, mime_type: str) -> StoredPhoto:
+    # Потоковое копирование с подсчётом SHA-256; выполняется в потоке целиком.
+    # Файл называется по хэшу содержимого, поэтому одинаковые фото хранятся один раз.
+    hasher = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=PHOTO_DIR, prefix=".upload-")
+    try:
+        os.fchmod(fd, PHOTO_FILE_MODE)
+        with os.fdopen(fd, "wb") as out:
+            source.seek(0)
+            while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_PHOTO_SIZE:
+                    raise HTTPException(status_code=413, detail="Photo is too large")
+                hasher.update(chunk)
+                out.write(chunk)
+
+        content_hash = hasher.hexdigest()
+        name = f"{content_hash}{ALLOWED_PHOTO_TYPES[mime_type]}"
+        final_path = PHOTO_DIR / name
+        try:
+            # link атомарно создаёт файл, только если его ещё нет
+            os.link(tmp_path, final_path)
+            created = True
+        except FileExistsError:
+            created = False
+        except OSError:
+            # Файловая система без жёстких ссылок: обычное переименование
+            created = not final_path.exists()
+            if created:
+                os.replace(tmp_path, final_path)
+                tmp_path = None
+        # Размеры читаем здесь же, в потоке, пока файл горячий в page cache
+        width, height = image_size(final_path) or (None, None)
+        stored = StoredPhoto(
+            name=name, content_hash=content_hash, size=size, mime_type=mime_type, created=created,
+            width=width, height=height, hold=tmp_path,
+        )
+        tmp_path = None
+        return stored
+    finally:
+        if tmp_path is not None:
+            os.unlink(tmp_path)
+
+
+def store_bytes(data: bytes, mime_type: Optional[str] = None) -> StoredPhoto:
+    # То же для фото, которые уже в памяти (например, из ZIP-архива)
+    mime_type = mime_type or sniff_image_type(data[:16])
+    if mime_type not in ALLOWED_PHOTO_TYPES:
+        raise HTTPException(status_code=415, detail="Unsupported photo type")
+    return store_file(io.BytesIO(data), mime_type)
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_photos(stored: list[StoredPhoto]):
+    # Компенсация при ошибке: удаляем свою копию и только те файлы, что создала эта операция.
+    # Если на созданный файл успел дедуплицироваться параллельный запрос, он восстановит файл
+    # из своей копии в release_photos
+    for photo in stored:
+        if photo.hold is not None:
+            _unlink(photo.hold)
+            photo.hold = None
+        if photo.created:
+            _unlink(PHOTO_DIR / photo.name)
+
+
+def release_photos(stored: list[StoredPhoto]):
+    # Вызывается после коммита записей о фото: файл под именем по хэшу должен существовать,
+    # собственная копия больше не нужна
+    for photo in stored:
+        if photo.hold is None:
+            continue
+        final_path = PHOTO_DIR / photo.name
+        try:
+            os.link(photo.hold, final_path)
+        except FileExistsError:
+            pass
+        except OSError:
+            # Файловая система без жёстких ссылок
+            if not final_path.exists():
+                os.replace(photo.hold, final_path)
+        _unlink(photo.hold)
+        photo.hold = None
+
+
+async def save_photos(photos: list[UploadFile]) -> list[StoredPhoto]:
+    # Сначала проверяем все фото, потом пишем их параллельно с ограничением
+    mime_types = [await validate_photo(photo) for photo in photos]
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+    async def store(photo: UploadFile, mime_type: str) -> StoredPhoto:
+        async with semaphore:
+            stored = await asyncio.to_thread(store_file, photo.file, mime_type)
+        logger.info(f"Photo saved: {photo.filename} -> {stored.name}")
+        return stored
+
+    results = await asyncio.gather(
+        *(store(photo, mime_type) for photo, mime_type in zip(photos, mime_types)),
+        return_exceptions=True,
+    )
+    stored = [result for result in results if isinstance(result, StoredPhoto)]
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        remove_photos(stored)
+        raise errors[0]
+    return stored
@@ -0,0 +1,168 @@
+from collections import Counter
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import select, delete, func, literal, literal_column, String
+from sqlalchemy.dialects.postgresql import insert, ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.users import VisitUserDay, VisitUserHour, VisitDay, VisitHour
+
+DAY, HOUR = "day", "hour"
+# Ряды по умолчанию и предельные периоды отчётов
+DEFAULT_SPAN = {DAY: timedelta(days=30), HOUR: timedelta(hours=48)}
+MAX_SPAN = {DAY: timedelta(days=366), HOUR: timedelta(days=14)}
+TOP_USERS_MAX_DAYS = 90
+TOP_USERS_MAX_LIMIT = 100
+# Сколько хранить строки "пользователь за период": они нужны только для уникальных и топа.
+# Итоги visit_days/visit_hours хранятся без ограничения — они маленькие
+USER_ROLLUP_RETENTION = {DAY: timedelta(days=TOP_USERS_MAX_DAYS), HOUR: MAX_SPAN[HOUR]}
+
+# Модели по гранулярности: (пользователь за период, итоги за период, колонка периода)
+ROLLUPS = {
+    DAY: (VisitUserDay, VisitDay, "day"),
+    HOUR: (VisitUserHour, VisitHour, "hour"),
+}
+
+
+def _array(values: list, item_type):
+    return literal(values, ARRAY(item_type))
+
+
+def bucket_of(moment: datetime, period: str):
+    if period == DAY:
+        return moment.date()
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+async def _upsert_user_buckets(db: AsyncSession, period: str, counts: Counter) -> Counter:
+    # Визиты пользователя за период прибавляются одним INSERT ... SELECT FROM unnest ON CONFLICT.
+    # xmax = 0 только у вставленных строк: так без отдельного запроса видно, сколько пользователей
+    # в периоде появилось впервые. Возвращает число новых пользователей по периодам
+    model, _, column = ROLLUPS[period]
+    keys = sorted(counts)  # Один порядок блокировок у всех воркеров
+    bucket_type = model.__table__.c[column].type
+    data = func.unnest(
+        _array([bucket for bucket, _ in keys], bucket_type),
+        _array([user_id for _, user_id in keys], String()),
+        _array([counts[key] for key in keys], model.visits.type),
+    ).table_valued("bucket", "user_id", "visits").render_derived(name="batch")
+    stmt = insert(model).from_select(
+        [column, "user_id", "visits"],
+        select(data.c.bucket, data.c.user_id, data.c.visits).order_by(data.c.bucket, data.c.user_id),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[column, "user_id"],
+        set_={"visits": model.visits + stmt.excluded.visits},
+    ).returning(
+        getattr(model, column),
+        literal_column(f"{model.__tablename__}.xmax = 0").label("inserted"),
+    )
+    new_users = Counter()
+    for bucket, inserted in (await db.execute(stmt)).all():
+        if inserted:
+            new_users[bucket] += 1
+    return new_users
+
+
+async def _upsert_totals(db: AsyncSession, period: str, visits: Counter, new_users: Counter):
+    _, model, column = ROLLUPS[period]
+    stmt = insert(model).values([
+        {column: bucket, "visits": visits[bucket], "uniques": new_users[bucket]}
+        for bucket in sorted(visits)
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[column],
+        set_={
+            "visits": model.visits + stmt.excluded.visits,
+            "uniques": model.uniques + stmt.excluded.uniques,
+        },
+    )
+    await db.execute(stmt)
+
+
+def _user_rollup_cutoff(period: str, now: datetime):
+    return bucket_of(now - USER_ROLLUP_RETENTION[period], period)
+
+
+async def update_rollups(db: AsyncSession, events: list[dict]):
+    # Вызывается в транзакции записи пачки визитов: агрегаты и сырые строки фиксируются вместе
+    now = datetime.utcnow()
+    for period in (DAY, HOUR):
+        counts = Counter()
+        for event in events:
+            if event["user_id"] is None:
+                continue
+            counts[(bucket_of(datetime.fromisoformat(event["visit_time"]), period), event["user_id"])] += 1
+        if not counts:
+            continue
+        visits = Counter()
+        for (bucket, _), number in counts.items():
+            visits[bucket] += number
+        # Поздние визиты (повтор с диска) за уже очищенные периоды идут только в сумму визитов:
+        # строк пользователей там нет, и каждый посчитался бы новым уникальным
+        cutoff = _user_rollup_cutoff(period, now)
+        recent = Counter({key: number for key, number in counts.items() if key[0] >= cutoff})
+        new_users = await _upsert_user_buckets(db, period, recent) if recent else Counter()
+        await _upsert_totals(db, period, visits, new_users)
+
+
+async def prune_rollups(db: AsyncSession) -> dict:
+    # Вызывается обслуживанием секций visits: строки пользователей старше срока удаляются
+    # по диапазону первичного ключа (период — первая колонка)
+    now = datetime.utcnow()
+    pruned = {}
+    for period in (DAY, HOUR):
+        model, _, column = ROLLUPS[period]
+        result = await db.execute(
+            delete(model).where(getattr(model, column) < _user_rollup_cutoff(period, now))
+        )
+        pruned[model.__tablename__] = result.rowcount
+    return pruned
+
+
+async def visit_series(db: AsyncSession, period: str, start: datetime, end: datetime) -> list[dict]:
+    # Визиты и уникальные пользователи по дням или часам; периоды без визитов заполняются нулями
+    _, model, column = ROLLUPS[period]
+    first, last = bucket_of(start, period), bucket_of(end, period)
+    bucket = getattr(model, column)
+    result = await db.execute(
+        select(bucket, model.visits, model.uniques).where(bucket >= first, bucket <= last).order_by(bucket)
+    )
+    rows = {row[0]: row for row in result.all()}
+
+    step = timedelta(days=1) if period == DAY else timedelta(hours=1)
+    series = []
+    current = first
+    while current <= last:
+        row = rows.get(current)
+        series.append({
+            "bucket": current.isoformat(),
+            "visits": row.visits if row else 0,
+            "uniques": row.uniques if row else 0,
+        })
+        current += step
+    return series
+
+
+async def top_users(db: AsyncSession, days: int, limit: int) -> list[dict]:
+    # Самые активные пользователи за последние days дней по дневным агрегатам
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    visits = func.sum(VisitUserDay.visits).label("visits")
+    result = await db.execute(
+        select(VisitUserDay.user_id, visits, func.count().label("active_days"))
+        .where(VisitUserDay.day >= since)
+        .group_by(VisitUserDay.user_id)
+        .order_by(visits.desc(), VisitUserDay.user_id)
+        .limit(limit)
+    )
+    return [dict(row) for row in result.mappings()]
+
+
+async def count_users_on(db: AsyncSession, day: date) -> dict:
+    result = await db.execute(select(VisitDay.visits, VisitDay.uniques).where(VisitDay.day == day))
+    row = result.one_or_none()
+    return {
+        "date": day.isoformat(),
+        "count": row.uniques if row else 0,
+        "visits": row.visits if row else 0,
+    }
@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func
+
+from app.config import VISIT_RETENTION_DAYS, VISIT_PARTITION_PREMAKE_DAYS, VISIT_PARTITION_MAINTENANCE_MINUTES
+from app.database import async_session_maker
+from app.operations.visit_analytics import prune_rollups
+
+logger = logging.getLogger(__name__)
+
+
+async def maintain_partitions(
+        retention_days: int = VISIT_RETENTION_DAYS,
+        premake_days: int = VISIT_PARTITION_PREMAKE_DAYS,
+) -> dict:
+    # Секции на сегодня и premake_days вперёд создаются заранее: без них вставка визитов упадёт
+    # (пачка уйдёт на диск и повторится). Секции старше срока хранения удаляются целиком —
+    # без DELETE, очистки VACUUM и раздувания таблицы. Функции SQL заданы в миграции 3e30986a6c37.
+    # Заодно чистятся агрегаты "пользователь за период" старше своего срока хранения
+    today = datetime.utcnow().date()
+    async with async_session_maker() as db:
+        created = (await db.execute(
+            select(func.visits_ensure_partitions(today, today + timedelta(days=premake_days)))
+        )).scalar_one()
+        dropped = (await db.execute(
+            select(func.visits_drop_partitions(today - timedelta(days=retention_days)))
+        )).scalar_one()
+        pruned = await prune_rollups(db)
+        await db.commit()
+    if created or dropped or any(pruned.values()):
+        logger.info(f"Visit partitions: created {created}, dropped {dropped}; pruned rollups {pruned}")
+    return {"created": created, "dropped": dropped, "pruned": pruned}
+
+
+class VisitPartitionMaintainer:
+    # Периодическое обслуживание секций visits: стартует в lifespan приложения
+    def __init__(self, interval_minutes: int = VISIT_PARTITION_MAINTENANCE_MINUTES):
+        self.interval = interval_minutes * 60
+        self._task = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await maintain_partitions()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error in visit partition maintenance")
+            await asyncio.sleep(self.interval)
+
+
+visit_partition_maintainer = VisitPartitionMaintainer()
+
+
+if __name__ == "__main__":
+    # python -m app.operations.visit_partitions [--retention-days N] [--premake-days N]
+    parser = argparse.ArgumentParser(description="Create upcoming visit partitions and drop expired ones")
+    parser.add_argument("--retention-days", type=int, default=VISIT_RETENTION_DAYS)
+    parser.add_argument("--premake-days", type=int, default=VISIT_PARTITION_PREMAKE_DAYS)
+    args = parser.parse_args()
+    print(asyncio.run(maintain_partitions(args.retention_days, args.premake_days)))
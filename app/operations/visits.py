@@ -0,0 +1,324 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app.config import SPRING_BOOT_API_URL, VISIT_FORWARD_BATCH_URL, VISIT_FORWARD_ENABLED, VISIT_FLUSH_MS, \
+    VISIT_BATCH_SIZE, VISIT_QUEUE_SIZE, VISIT_SPILL_DIR, VISIT_RETENTION_DAYS
+from app.database import async_session_maker
+from app.models.users import Visit
+from app.operations.http_clients import http_clients, VISITS
+from app.operations.visit_analytics import update_rollups
+
+logger = logging.getLogger(__name__)
+
+# Одновременных POST, если у сервиса нет пакетного эндпоинта и визиты уходят по одному
+FORWARD_CONCURRENCY = 16
+# Как часто подбирать пачки, отложенные на диск
+SPILL_REPLAY_SECONDS = 60
+
+DB, FORWARD = "db", "forward"
+
+
+class VisitQueueFull(Exception):
+    pass
+
+
+def _spill(kind: str, events: list[dict]):
+    # Пачка, которую не удалось записать или переслать, сохраняется в NDJSON и повторяется позже
+    VISIT_SPILL_DIR.mkdir(parents=True, exist_ok=True)
+    path = VISIT_SPILL_DIR / f"{kind}-{datetime.utcnow():%Y%m%d%H%M%S}-{uuid.uuid4().hex}.ndjson"
+    _write_events(path, events)
+    logger.warning(f"Spilled {len(events)} visits to {path}")
+
+
+def _write_events(path: Path, events: list[dict]):
+    with open(path, "w", encoding="utf-8") as file:
+        file.writelines(json.dumps(event) + "\n" for event in events)
+
+
+def _release(path: Path, events: list[dict] | None = None):
+    # Файл возвращается в очередь на диске; если часть визитов уже обработана, остаются только остальные
+    if events is not None:
+        _write_events(path, events)
+    os.rename(path, path.with_suffix(".ndjson"))
+
+
+def _dead_letter(path: Path, reason: Exception):
+    # Повтор не поможет: файл откладывается под другим именем и больше не подбирается
+    target = path.with_suffix(".dead")
+    os.rename(path, target)
+    logger.error(f"Moved spilled visits to {target}: {reason.__class__.__name__}: {reason}")
+
+
+def _is_permanent(error: Exception) -> bool:
+    if isinstance(error, (ValueError, KeyError, TypeError)):  # Битый файл или визит
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return 400 <= status < 500 and status not in (408, 429)
+    if isinstance(error, DataError):
+        return True
+    if isinstance(error, IntegrityError):
+        # Нет секции на свежий день — обслуживание секций отстаёт, это пройдёт
+        return "no partition" not in str(error.orig)
+    return False
+
+
+def _within_retention(events: list[dict]) -> list[dict]:
+    # Секции старше срока хранения удалены: такие визиты записать уже некуда
+    cutoff = datetime.utcnow().date() - timedelta(days=VISIT_RETENTION_DAYS)
+    return [event for event in events if datetime.fromisoformat(event["visit_time"]).date() >= cutoff]
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _claim_spilled(kind: str) -> list[tuple[Path, list[dict]]]:
+    # Переименование забирает файл себе: другие воркеры его уже не увидят.
+    # Файлы, которые повторял упавший процесс, тоже подбираются
+    if not VISIT_SPILL_DIR.exists():
+        return []
+    paths = list(VISIT_SPILL_DIR.glob(f"{kind}-*.ndjson"))
+    for path in VISIT_SPILL_DIR.glob(f"{kind}-*.replaying-*"):
+        pid = path.suffix.removeprefix(".replaying-")
+        if pid.isdigit() and not _is_alive(int(pid)):
+            paths.append(path)
+    claimed = []
+    for path in sorted(paths):
+        target = path.with_suffix(f".replaying-{os.getpid()}")
+        try:
+            os.rename(path, target)
+        except FileNotFoundError:
+            continue
+        try:
+            with open(target, encoding="utf-8") as file:
+                claimed.append((target, [json.loads(line) for line in file if line.strip()]))
+        except ValueError as e:
+            _dead_letter(target, e)
+    return claimed
+
+
+async def write_visits(events: list[dict]):
+    # Один multi-row INSERT на пачку; агрегаты для аналитики обновляются в той же транзакции
+    rows = [
+        {"user_id": event["user_id"], "visit_time": datetime.fromisoformat(event["visit_time"])}
+        for event in events
+    ]
+    async with async_session_maker() as db:
+        await db.execute(insert(Visit), rows)
+        await update_rollups(db, events)
+        await db.commit()
+
+
+class VisitPipeline:
+    # Визиты принимаются в ограниченную очередь в памяти воркера и пишутся в visits пачками:
+    # каждые VISIT_FLUSH_MS или по VISIT_BATCH_SIZE строк. Записанные пачки пересылаются в
+    # сервис статистики отдельной задачей с повторами; неудачи откладываются на диск.
+    # Стартует в lifespan приложения
+    def __init__(
+            self,
+            flush_ms: int = VISIT_FLUSH_MS,
+            batch_size: int = VISIT_BATCH_SIZE,
+            queue_size: int = VISIT_QUEUE_SIZE,
+            forward_enabled: bool = VISIT_FORWARD_ENABLED,
+    ):
+        self.flush_seconds = flush_ms / 1000
+        self.batch_size = batch_size
+        self.forward_enabled = forward_enabled
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._forward_queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size // batch_size))
+        self._collecting: list[dict] = []  # Пачка, которую писатель добирает прямо сейчас
+        self._tasks: list[asyncio.Task] = []
+
+    def accept(self, user_id: str):
+        event = {"user_id": user_id, "visit_time": datetime.utcnow().isoformat()}
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            raise VisitQueueFull()
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._tasks.append(asyncio.create_task(self._run_writer()))
+        if self.forward_enabled:
+            self._tasks.append(asyncio.create_task(self._run_forwarder()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        # Остаток очереди пишется одной пачкой, а неотправленное откладывается на диск:
+        # остановка не ждёт внешний сервис
+        remaining, self._collecting = self._collecting + self._drain(self._queue), []
+        if remaining:
+            try:
+                await write_visits(remaining)
+                self._queue_forward(remaining)
+            except Exception:
+                logger.exception("Error writing visits on shutdown")
+                _spill(DB, remaining)
+        for events in self._drain(self._forward_queue):
+            _spill(FORWARD, events)
+
+    @staticmethod
+    def _drain(queue: asyncio.Queue) -> list:
+        items = []
+        while not queue.empty():
+            items.append(queue.get_nowait())
+        return items
+
+    async def _next_batch(self, idle_timeout: float) -> list[dict]:
+        # Ждём первый визит (пустой список, если за idle_timeout ничего не пришло),
+        # затем добираем пачку не дольше flush_seconds
+        # asyncio.timeout, а не wait_for: wait_for в 3.11 может проглотить отмену задачи при stop()
+        try:
+            async with asyncio.timeout(idle_timeout):
+                self._collecting = [await self._queue.get()]
+        except TimeoutError:
+            return []
+        batch = self._collecting
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                async with asyncio.timeout(timeout):
+                    batch.append(await self._queue.get())
+            except TimeoutError:
+                break
+        self._collecting = []
+        return batch
+
+    def _queue_forward(self, events: list[dict]):
+        if not self.forward_enabled:
+            return
+        try:
+            self._forward_queue.put_nowait(events)
+        except asyncio.QueueFull:
+            _spill(FORWARD, events)
+
+    async def _run_writer(self):
+        replay_at = 0.0
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch(idle_timeout=SPILL_REPLAY_SECONDS)
+            if batch:
+                try:
+                    await write_visits(batch)
+                    self._queue_forward(batch)
+                except asyncio.CancelledError:
+                    _spill(DB, batch)
+                    raise
+                except Exception:
+                    logger.exception("Error writing visits")
+                    await asyncio.to_thread(_spill, DB, batch)
+            if loop.time() >= replay_at:
+                replay_at = loop.time() + SPILL_REPLAY_SECONDS
+                await self._replay(DB, self._replay_write)
+
+    async def _replay_write(self, events: list[dict]):
+        await write_visits(events)
+        self._queue_forward(events)
+
+    async def _replay(self, kind: str, handler):
+        # Каждый файл обрабатывается сам по себе: неудача одного не задерживает остальные.
+        # Временные ошибки оставляют файл на диске до следующего прохода, постоянные — откладывают его
+        claimed = await asyncio.to_thread(_claim_spilled, kind)
+        for index, (path, events) in enumerate(claimed):
+            if kind == DB:
+                fresh = _within_retention(events)
+                if len(fresh) < len(events):
+                    logger.warning(f"Dropping {len(events) - len(fresh)} spilled visits older than retention")
+                    events = fresh
+            try:
+                if events:
+                    await handler(events)
+            except asyncio.CancelledError:
+                _release(path, events)
+                for unclaimed, _ in claimed[index + 1:]:
+                    _release(unclaimed)
+                raise
+            except Exception as e:
+                if _is_permanent(e):
+                    _dead_letter(path, e)
+                else:
+                    logger.warning(f"Replaying spilled visits failed, will retry later: {e}")
+                    # forward оставляет в events только неотправленные визиты: отправленные повторно не уйдут
+                    await asyncio.to_thread(_release, path, events)
+                continue
+            os.unlink(path)
+
+    async def forward(self, events: list[dict]):
+        # Пакетный эндпоинт, если он настроен; иначе по одному POST на визит.
+        # Пул, таймауты, повторы с джиттером и circuit breaker — у общего клиента VISITS;
+        # повтор POST допустим: сервис статистики считает визиты, а не платежи
+        upstream = http_clients.get(VISITS)
+        if VISIT_FORWARD_BATCH_URL:
+            response = await upstream.post(VISIT_FORWARD_BATCH_URL, json=events, retry=True)
+            response.raise_for_status()
+            return
+
+        semaphore = asyncio.Semaphore(FORWARD_CONCURRENCY)
+
+        async def send(event):
+            async with semaphore:
+                response = await upstream.post(SPRING_BOOT_API_URL, json={"user_id": event["user_id"]}, retry=True)
+                response.raise_for_status()
+
+        results = await asyncio.gather(*(send(event) for event in events), return_exceptions=True)
+        failed = [event for event, result in zip(events, results) if isinstance(result, Exception)]
+        if failed:
+            # На диск откладываются только неотправленные визиты
+            events[:] = failed
+            raise next(result for result in results if isinstance(result, Exception))
+
+    async def _run_forwarder(self):
+        replay_at = 0.0
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                async with asyncio.timeout(SPILL_REPLAY_SECONDS):
+                    events = await self._forward_queue.get()
+            except TimeoutError:
+                events = None
+            if events:
+                try:
+                    await self.forward(events)
+                except asyncio.CancelledError:
+                    _spill(FORWARD, events)
+                    raise
+                except Exception:
+                    logger.exception("Error forwarding visits")
+                    await asyncio.to_thread(_spill, FORWARD, events)
+            if loop.time() >= replay_at:
+                replay_at = loop.time() + SPILL_REPLAY_SECONDS
+                await self._replay(FORWARD, self.forward)
+
+
+visit_pipeline = VisitPipeline()
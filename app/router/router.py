@@ -1,37 +1,64 @@
 import logging
+import json
 import os
 import traceback
 import uuid
 import zipfile
-from datetime import datetime
+from datetime import datetime, timezone
 from io import BytesIO
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
-import aiofiles
-import httpx
 import requests
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Form
-from pydantic import json
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Form, Query, BackgroundTasks, Request
 from sqlalchemy import select, insert, delete
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload, selectinload
-from starlette.responses import FileResponse, StreamingResponse
+from starlette.responses import FileResponse, StreamingResponse, Response
 
 from starlette.staticfiles import StaticFiles
 
 from app.database import get_async_session
 
-from app.shemas.schemas import AddRealEstate, FavoriteCreate, HomeBase, HomeBase2
+from app.shemas.schemas import AddRealEstate, FavoriteCreate, HomeBase, HomeBase2, ListingFilters
 from app.operations.crud import delete_item, update_item, delete_user, verify_token, get_coordinates, \
-    get_options_by_home_id, fetch_news, parse_news, find_similar_announcements_by_price
-
-from app.models.users import Home, User, FavoritesHome, Photo, Options, Visit
+    fetch_news, parse_news, find_similar_announcements_by_price
+from app.operations.listings import get_listing_page, get_listing_page_json, get_user_cards_json, get_user_ads_json, \
+    get_real_estate_json, LISTING_PAGE_SIZE, LISTING_MAX_PAGE_SIZE, AD_OPTION_KEYS
+from app.operations.numeric import apply_numeric_fields
+from app.operations.similar import get_similar, forget_home, refresh_similar_in_background, \
+    rebuild_neighbours_in_background, SIMILAR_TOP_K
+from app.operations.cache import invalidate_listing
+from app.operations.geocoding import normalize_address
+from app.operations.geocode_worker import geocode_worker
+from app.operations.uploads import save_photos, remove_photos, release_photos
+from app.operations.images import get_variant, pick_format, PHOTO_VARIANTS, VARIANT_FORMATS
+from app.operations.photo_manifest import get_manifest, new_photo, generate_and_record_variants, MANIFEST_MAX_HOMES
+from app.operations.photo_files import photo_response, photo_url, is_content_addressed, etag_matches, \
+    IMMUTABLE_CACHE_CONTROL, LEGACY_CACHE_CONTROL
+from app.operations.detail import get_item_response
+from app.operations.export import open_export, EXPORT_MEDIA_TYPES
+from app.operations.bulk_import import import_listings
+from app.operations.facets import get_facets
+from app.operations.favorites import add_favorite, remove_favorite, favorite_flags, get_favorites_page, HomeNotFound, \
+    FAVORITES_PAGE_SIZE, FAVORITES_MAX_PAGE_SIZE, FAVORITES_STATUS_MAX_IDS
+from app.operations.popularity import popularity_counters, get_popular_page, get_trending, POPULAR_MAX_OFFSET, \
+    TRENDING_PAGE_SIZE, TRENDING_MAX_PAGE_SIZE
+from app.operations.news import get_news_page, NEWS_PAGE_SIZE, NEWS_MAX_PAGE_SIZE
+from app.operations.visits import visit_pipeline, VisitQueueFull
+from app.operations.visit_analytics import count_users_on, visit_series, top_users, DAY, DEFAULT_SPAN, MAX_SPAN, \
+    TOP_USERS_MAX_DAYS, TOP_USERS_MAX_LIMIT
+from app.operations.http_clients import http_clients
+from app.operations.search import search_listings, SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE, SEARCH_MAX_OFFSET
+from app.operations.geo import search_bbox, search_radius, search_nearest, get_clusters, \
+    GEO_MAX_RESULTS, NEAREST_MAX_RADIUS_KM
+
+from app.models.users import Home, User, FavoritesHome, Photo, Options
 
 from app.models import users
-from app.dependencies import get_current_user
+from app.dependencies import get_current_user, get_current_superuser
 from app.shemas.users import BaseUser, BaseUserWithRole, UpdateRoleRequest
-from app.config import PHOTO_DIR
+from app.config import PHOTO_DIR, LISTING_SQL_JSON
 from app.operations import crud
 from app.shemas import schemas
 
@@ -49,12 +76,6 @@ router = APIRouter(
 #     await session.commit()
 #     return new_add
 
-router.mount("/uploads", StaticFiles(directory="D:/flats/uploads"), name="uploads")
-
-
-SPRING_BOOT_API_URL = "http://localhost:5050/api/record-visit"
-
-
 # Убедитесь, что папка существует
 os.makedirs(PHOTO_DIR, exist_ok=True)
 # PHOTO_DIR.mkdir(parents=True, exist_ok=True)
@@ -62,23 +83,98 @@ os.makedirs(PHOTO_DIR, exist_ok=True)
 
 logger = logging.getLogger(__name__)
 
+# Допустимые значения ?size= для фотографий
+PHOTO_SIZE_PATTERN = "^(" + "|".join(PHOTO_VARIANTS) + ")$"
+
+
+@router.get("/announcements/{announcement_id}/similar")
+async def get_similar_announcements(
+    announcement_id: int,
+    background_tasks: BackgroundTasks,
+    limit: int = Query(SIMILAR_TOP_K, ge=1, le=SIMILAR_TOP_K),
+    db: AsyncSession = Depends(get_async_session),
+):
+    # Top-K похожих по цене, площади, комнатам, типу жилья и расстоянию (из таблицы соседей + кэш)
+    return await get_similar(db, announcement_id, background_tasks, limit)
+
 
 @router.get("/announcements/{announcement_id}/similar_by_price", response_model=List[HomeBase2])
 async def get_similar_announcements_by_price(
     announcement_id: int,
     db: AsyncSession = Depends(get_async_session),
-    price_range_percentage: float = 10
+    price_range_percentage: float = 10,
+    limit: int = Query(20, ge=1, le=100),
 ):
     similar_announcements = await find_similar_announcements_by_price(
-        announcement_id, db, price_range_percentage
+        announcement_id, db, price_range_percentage, limit
     )
 
     # Преобразуем каждый результат в объект, который соответствует HomeBase
     return [HomeBase2(**announcement.__dict__) for announcement in similar_announcements]
 
 
+@router.get("/geo/bbox")
+async def geo_bbox(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lon: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lon: float = Query(..., ge=-180, le=180),
+    limit: int = Query(GEO_MAX_RESULTS, ge=1, le=GEO_MAX_RESULTS),
+    filters: ListingFilters = Depends(),
+    db: AsyncSession = Depends(get_async_session),
+):
+    # Объявления в видимой области карты
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(status_code=400, detail="Invalid bounding box")
+    return await search_bbox(db, filters, min_lat, min_lon, max_lat, max_lon, limit)
+
+
+@router.get("/geo/radius")
+async def geo_radius(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(..., gt=0, le=NEAREST_MAX_RADIUS_KM),
+    limit: int = Query(GEO_MAX_RESULTS, ge=1, le=GEO_MAX_RESULTS),
+    filters: ListingFilters = Depends(),
+    db: AsyncSession = Depends(get_async_session),
+):
+    # Объявления в радиусе от точки, ближайшие первыми
+    return await search_radius(db, filters, lat, lon, radius_km, limit)
+
+
+@router.get("/geo/nearest")
+async def geo_nearest(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    n: int = Query(10, ge=1, le=100),
+    filters: ListingFilters = Depends(),
+    db: AsyncSession = Depends(get_async_session),
+):
+    return await search_nearest(db, filters, lat, lon, n)
+
+
+@router.get("/geo/clusters")
+async def geo_clusters(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lon: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lon: float = Query(..., ge=-180, le=180),
+    zoom: int = Query(..., ge=0, le=22),
+    filters: ListingFilters = Depends(),
+    db: AsyncSession = Depends(get_async_session),
+):
+    # Кластеры точек для текущего зума: количество и центр каждой ячейки geohash
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(status_code=400, detail="Invalid bounding box")
+    return await get_clusters(db, filters, min_lat, min_lon, max_lat, max_lon, zoom)
+
+
 @router.get("/itemsbyid")
 async def get_items_by_user(user_id: int, db: AsyncSession = Depends(get_async_session)):
+    if LISTING_SQL_JSON:
+        # JSON собирает Postgres, отдаём байты как есть
+        return Response(content=await get_user_cards_json(db, user_id), media_type="application/json")
+
     # Выполнение запроса, чтобы получить все дома для данного пользователя
     result = await db.execute(
         select(Home)
@@ -132,46 +228,70 @@ async def get_user(user_id: int, db: AsyncSession = Depends(get_async_session)):
 
 
 @router.get("/news")
-async def get_news():
-    news = await parse_news()
-    return {"news": news}
-
+async def get_news(
+    cursor: Optional[int] = None,  # id последней новости предыдущей страницы
+    limit: int = Query(NEWS_PAGE_SIZE, ge=1, le=NEWS_MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_session),
+):
+    # Новости из таблицы news: сайт опрашивает фоновый загрузчик, а не каждый запрос
+    news, next_cursor = await get_news_page(db, cursor, limit)
+    return {"news": news, "next_cursor": next_cursor}
 
-@router.post("/track-visit")
-async def track_visit(user_id: str, db: AsyncSession = Depends(get_async_session)):
-    # Сначала сохраняем информацию о визите в базу данных
-    new_visit = Visit(user_id=user_id, visit_time=datetime.utcnow())
 
-    db.add(new_visit)
-    await db.commit()  # Асинхронный commit
-    await db.refresh(new_visit)  # Асинхронный refresh для получения обновленного объекта
+@router.post("/track-visit", status_code=202)
+async def track_visit(user_id: str):
+    # Визит только ставится в очередь: запись в БД и пересылка в Spring Boot идут пачками в фоне
+    try:
+        visit_pipeline.accept(user_id)
+    except VisitQueueFull:
+        raise HTTPException(status_code=503, detail="Visit queue is full", headers={"Retry-After": "1"})
+    return {"status": "accepted"}
 
-    # Отправляем запрос в Spring Boot API с использованием httpx
-    payload = {"user_id": user_id}
-    headers = {"Content-Type": "application/json"}
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(SPRING_BOOT_API_URL, json=payload, headers=headers)
+@router.get("/count-users-today")
+async def count_users_today(db: AsyncSession = Depends(get_async_session)):
+    # Уникальные пользователи за текущие сутки (UTC) из агрегата visit_days
+    return await count_users_on(db, datetime.utcnow().date())
 
-    # Проверяем статус ответа от Spring Boot API
-    if response.status_code == 200:
-        return {"status": "success"}
-    else:
-        raise HTTPException(status_code=500, detail="Error while sending data to Spring Boot API")
 
+@router.get("/http-metrics")
+async def get_http_metrics(user: User = Depends(get_current_superuser)):
+    # Запросы, ошибки, повторы, задержки и состояние circuit breaker по каждому внешнему сервису.
+    # Только для администраторов: имена и состояние внутренних сервисов наружу не отдаются
+    return http_clients.metrics()
 
-@router.get("/count-users-today")
-async def count_users_today():
-    async with httpx.AsyncClient() as client:
-        response = await client.get("http://localhost:5050/api/count-users-today")
 
-    if response.status_code != 200:
-        raise HTTPException(status_code=500, detail="Error while fetching user count")
+@router.get("/analytics/visits")
+async def get_visit_analytics(
+    period: str = Query(DAY, pattern="^(day|hour)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_session),
+    user: User = Depends(get_current_superuser),
+):
+    # Ряд визитов и уникальных пользователей по дням или часам (UTC) из агрегатов, без чтения visits.
+    # Аналитика — внутренние данные, только для администраторов
+    end = _naive_utc(end) if end else datetime.utcnow()
+    start = _naive_utc(start) if start else end - DEFAULT_SPAN[period]
+    if start > end or end - start > MAX_SPAN[period]:
+        raise HTTPException(status_code=400, detail=f"Period must be at most {MAX_SPAN[period].days} days")
+    return {"period": period, "series": await visit_series(db, period, start, end)}
+
+
+@router.get("/analytics/top-users")
+async def get_top_users(
+    days: int = Query(7, ge=1, le=TOP_USERS_MAX_DAYS),
+    limit: int = Query(10, ge=1, le=TOP_USERS_MAX_LIMIT),
+    db: AsyncSession = Depends(get_async_session),
+    user: User = Depends(get_current_superuser),
+):
+    # user_id и число визитов — персональные данные: только для администраторов
+    return {"days": days, "users": await top_users(db, days, limit)}
 
-    return response.json()
 
 @router.post("/add-real-estate/")
 async def add_real_estate(
+    background_tasks: BackgroundTasks,
     name: str = Form(...),
     price: str = Form(...),
     type_of_transaction: str = Form(...),
@@ -192,57 +312,33 @@ async def add_real_estate(
 ):
     logger.info("Starting add_real_estate process")
 
-    # Получение координат для адреса
-    try:
-        lat, lon = await get_coordinates(address)
-        logger.info(f"Coordinates for address '{address}': lat={lat}, lon={lon}")
-    except Exception as e:
-        logger.error(f"Error geocoding address: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error geocoding address: {str(e)}")
-
-    # Сохранение фотографий
-    photo_names = []
+    # Сохранение фотографий: проверка размера и типа, параллельная запись, дедупликация по хэшу
     try:
-        for photo in photos:
-            unique_filename = f"{uuid.uuid4().hex}_{photo.filename}"
-            photo_path = os.path.join(PHOTO_DIR, unique_filename)
-
-            photo_names.append(unique_filename)
-            logger.info(f"Saving photo: {unique_filename}")
-
-            async with aiofiles.open(photo_path, 'wb') as out_file:
-                while content := await photo.read(1024):
-                    await out_file.write(content)
-            logger.info(f"Photo saved: {unique_filename}")
+        stored_photos = await save_photos(photos)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error while saving photo: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error while saving photo: {str(e)}")
+    photo_names = [stored.name for stored in stored_photos]
 
-    # Создание нового дома в базе данных
-    new_home = users.Home(
-        name=name,
-        price=price,
-        type_of_transaction=type_of_transaction,
-        type_of_housing=type_of_housing,
-        description=description,
-        address=address,
-        latitude=lat,
-        longitude=lon,
-        user_id=BaseUser.id,
-    )
-
+    # Дом, опции и фото сохраняются одной транзакцией: flush выдаёт id дома, коммит один
     try:
+        new_home = users.Home(
+            name=name,
+            price=price,
+            type_of_transaction=type_of_transaction,
+            type_of_housing=type_of_housing,
+            description=description,
+            address=address,
+            # Координаты заполнит фоновый геокодер (app.operations.geocode_worker)
+            geocode_status="pending",
+            user_id=BaseUser.id,
+        )
+        apply_numeric_fields(home=new_home)
         db.add(new_home)
-        await db.commit()  # Коммитим, чтобы сохранить новый дом и присвоить ему ID
-        await db.refresh(new_home)  # Обновляем объект new_home с ID из базы данных
-        logger.info(f"Home created with ID: {new_home.id}")
-    except Exception as e:
-        await db.rollback()
-        logger.error(f"Error during home creation: {str(e)}\n{traceback.format_exc()}")
-        raise HTTPException(status_code=500, detail=f"Error during home creation: {str(e)}")
+        await db.flush()  # INSERT ... RETURNING id без коммита
 
-    # Создание объекта Options с переданными параметрами
-    try:
         new_options = users.Options(
             home_id=new_home.id,
             numbers_of_room=number_of_rooms,
@@ -254,37 +350,59 @@ async def add_real_estate(
             internet=internet,
             elevator=elevator
         )
-        db.add(new_options)
-        await db.commit()  # Коммитим изменения
-        await db.refresh(new_home)  # Обновляем объект new_home с ID из базы данных
-        logger.info(f"Options added to the database for home ID: {new_home.id}")
+        apply_numeric_fields(options=new_options)
+        # Опции и все фото уходят пачкой при коммите
+        db.add_all([new_options] + [new_photo(new_home.id, stored) for stored in stored_photos])
+        await db.commit()
+        logger.info(f"Home created with ID: {new_home.id}")
     except Exception as e:
         await db.rollback()
-        logger.error(f"Error while adding options data to the database: {str(e)}\n{traceback.format_exc()}")
-        raise HTTPException(status_code=500, detail=f"Error while adding options data to the database: {str(e)}")
+        # Объявление не создано — файлы, записанные этим запросом, удаляем
+        remove_photos(stored_photos)
+        logger.error(f"Error during home creation: {str(e)}\n{traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Error during home creation: {str(e)}")
+    release_photos(stored_photos)
 
-    # Создание записей для фотографий
-    try:
-        for photo_name in photo_names:
-            new_photo = users.Photo(
-                home_id=new_home.id,  # Связываем фото с домом
-                photo=photo_name,  # Сохраняем имя файла
-            )
-            db.add(new_photo)
+    # Превью генерируются в пуле процессов после ответа
+    background_tasks.add_task(generate_and_record_variants, photo_names)
+    geocode_worker.notify()
+    # Соседи для блока "похожие" считаются после ответа
+    background_tasks.add_task(refresh_similar_in_background, new_home.id)
 
-        await db.commit()  # Сохраняем фотографии в базе данных
-        logger.info(f"Photos added to the database for home ID: {new_home.id}")
-    except Exception as e:
-        await db.rollback()
-        logger.error(f"Error while adding photos to the database: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error while adding photos to the database: {str(e)}")
+    return {"message": "Real estate added", "home_id": new_home.id, "geocode_status": new_home.geocode_status}
 
-    return {"message": "Real estate added", "home_id": new_home.id}
+
+@router.post("/import")
+async def import_real_estate(
+    file: UploadFile = File(...),  # NDJSON (по объекту на строку) или CSV с заголовком
+    photos_zip: Optional[UploadFile] = File(None),  # Фото, на которые ссылаются строки по имени файла
+    format: Optional[str] = Form(None, pattern="^(ndjson|csv)$"),
+    db: AsyncSession = Depends(get_async_session),
+    BaseUser: int = Depends(get_current_user),
+):
+    # Массовая загрузка объявлений: ошибки отдельных строк попадают в отчёт и не прерывают импорт
+    if format is None:
+        format = "csv" if (file.filename or "").lower().endswith(".csv") else "ndjson"
+    report = await import_listings(
+        db, file.file, format, BaseUser.id, archive=photos_zip.file if photos_zip else None,
+    )
+    logger.info(f"Import finished: {report.imported} imported, {report.failed} failed")
+
+    # Координаты проставит фоновый геокодер, похожие объявления досчитаются при первом просмотре
+    if report.imported:
+        geocode_worker.notify()
+    return {
+        "imported": report.imported,
+        "failed": report.failed,
+        "home_ids": report.home_ids,
+        "errors": report.errors,
+    }
 
 
 @router.put("/edit-real-estate/{home_id}")
 async def edit_real_estate(
     home_id: int,
+    background_tasks: BackgroundTasks,
     name: str = Form(...),
     price: str = Form(...),  # Цена как строка
     type_of_transaction: str = Form(...),
@@ -304,12 +422,36 @@ async def edit_real_estate(
 ):
     logger.info(f"Начинаем процесс редактирования недвижимости для home_id {home_id}")
 
-    # Получаем существующую недвижимость по ID
-    existing_home = await db.execute(select(users.Home).filter(users.Home.id == home_id))
-    home = existing_home.scalar_one_or_none()
+    # Недвижимость и её параметры одним запросом
+    existing = await db.execute(
+        select(users.Home, users.Options)
+        .outerjoin(users.Options, users.Options.home_id == users.Home.id)
+        .where(users.Home.id == home_id)
+        .order_by(users.Options.id)
+        .limit(1)
+    )
+    row = existing.first()
 
-    if not home:
+    if not row:
         raise HTTPException(status_code=404, detail="Недвижимость не найдена")
+    home, options = row
+
+    if not options:
+        raise HTTPException(status_code=404, detail="Параметры не найдены для этой недвижимости")
+
+    # Если адрес не изменился и координаты уже есть, к геокодеру не обращаемся
+    address_changed = home.latitude is None or normalize_address(home.address or "") != normalize_address(address)
+
+    # Сохраняем новые фотографии до изменений в БД: невалидный файл не должен оставить объявление без фото
+    stored_photos = []
+    if photos:
+        try:
+            stored_photos = await save_photos(photos)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении фото: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Ошибка при сохранении фото: {str(e)}")
 
     # Обновляем данные недвижимости как строки
     home.name = name
@@ -319,22 +461,14 @@ async def edit_real_estate(
     home.description = description
     home.address = address
 
-    # Получаем координаты для адреса
-    try:
-        lat, lon = await get_coordinates(address)
-        logger.info(f"Координаты для адреса '{address}': lat={lat}, lon={lon}")
-        home.latitude = lat
-        home.longitude = lon
-    except Exception as e:
-        logger.error(f"Ошибка при геокодировании адреса: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Ошибка при геокодировании адреса: {str(e)}")
-
-    # Обновляем параметры недвижимости как строки
-    existing_options = await db.execute(select(users.Options).filter(users.Options.home_id == home_id))
-    options = existing_options.scalar_one_or_none()
-
-    if not options:
-        raise HTTPException(status_code=404, detail="Параметры не найдены для этой недвижимости")
+    # Новый адрес геокодируется в фоне; старые координаты к нему уже не относятся
+    if address_changed:
+        home.latitude = None
+        home.longitude = None
+        home.geohash = None
+        home.geocode_status = "pending"
+        home.geocode_attempts = 0
+        home.geocode_next_attempt_at = None
 
     # Обновляем параметры как строки, без конвертации
     options.numbers_of_room = number_of_rooms  # Количество комнат (строка)
@@ -346,68 +480,71 @@ async def edit_real_estate(
     options.internet = internet  # Интернет (строка)
     options.elevator = elevator  # Лифт (строка)
 
-    # Обрабатываем фотографии, если они переданы
-    if photos:
-        # Удаляем старые фотографии
-        await db.execute(delete(users.Photo).filter(users.Photo.home_id == home_id))
-        await db.commit()
-
-        # Сохраняем новые фотографии
-        photo_names = []
-        try:
-            for photo in photos:
-                unique_filename = f"{uuid.uuid4().hex}_{photo.filename}"
-                photo_path = os.path.join(PHOTO_DIR, unique_filename)
-
-                photo_names.append(unique_filename)
-                logger.info(f"Сохраняем фото: {unique_filename}")
-
-                async with aiofiles.open(photo_path, 'wb') as out_file:
-                    while content := await photo.read(1024):
-                        await out_file.write(content)
-                logger.info(f"Фото сохранено: {unique_filename}")
-        except Exception as e:
-            logger.error(f"Ошибка при сохранении фото: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Ошибка при сохранении фото: {str(e)}")
+    # Числовые копии полей для фильтров и поиска похожих
+    apply_numeric_fields(home=home, options=options)
 
-        # Добавляем новые фотографии в базу данных
-        for photo_name in photo_names:
-            new_photo = users.Photo(
-                home_id=home.id,  # Связываем фото с домом
-                photo=photo_name,  # Сохраняем имя файла
-            )
-            db.add(new_photo)
-        logger.info(f"Фотографии обновлены для недвижимости с ID: {home.id}")
+    # onupdate у Home не сработает, если изменились только параметры или фото,
+    # а правка должна попасть в инкрементальную выгрузку /export?updated_since=
+    home.updated_at = datetime.utcnow()
 
-    # Сохраняем изменения в базе данных
+    # Всё изменение — одна транзакция: замена фото, дом и параметры фиксируются одним коммитом
     try:
+        if stored_photos:
+            await db.execute(delete(users.Photo).filter(users.Photo.home_id == home_id))
+            db.add_all([new_photo(home.id, stored) for stored in stored_photos])
         await db.commit()
-        await db.refresh(home)
         logger.info(f"Недвижимость с ID {home.id} была обновлена")
     except Exception as e:
         await db.rollback()
+        remove_photos(stored_photos)
         logger.error(f"Ошибка при обновлении недвижимости: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка при обновлении недвижимости: {str(e)}")
+    release_photos(stored_photos)
+
+    if stored_photos:
+        background_tasks.add_task(generate_and_record_variants, [stored.name for stored in stored_photos])
+    invalidate_listing(home.id)
+    if address_changed:
+        geocode_worker.notify()
+    background_tasks.add_task(refresh_similar_in_background, home.id)
 
-    return {"message": "Недвижимость обновлена", "home_id": home.id}
+    return {"message": "Недвижимость обновлена", "home_id": home.id, "geocode_status": home.geocode_status}
 
 
 
 @router.delete("/items/{item_id}")
-async def delete_item_route(item_id: int, db: AsyncSession = Depends(get_async_session)):
+async def delete_item_route(
+    item_id: int,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_session),
+):
     # Удаление всех фотографий, связанных с домом
     await db.execute(delete(Photo).where(Photo.home_id == item_id))
+    # Убираем дом из таблицы похожих; списки, где он был, дозаполним после ответа
+    orphaned_neighbours = await forget_home(db, item_id)
     await db.execute(delete(FavoritesHome).where(FavoritesHome.home_id == item_id))
     await db.execute(delete(Options).where(Options.home_id == item_id))
     # Теперь можно безопасно удалить сам дом
     await db.execute(delete(Home).where(Home.id == item_id))
     await db.commit()
+
+    invalidate_listing(item_id, *orphaned_neighbours)
+    if orphaned_neighbours:
+        background_tasks.add_task(rebuild_neighbours_in_background, orphaned_neighbours)
     return {"detail": "Item deleted successfully"}
 
 
 @router.put("/operations/items/{item_id}")
-async def update_item_route(item_id: int, update_data: AddRealEstate, db: AsyncSession = Depends(get_async_session)):
-    return await update_item(db, item_id, update_data)
+async def update_item_route(
+    item_id: int,
+    update_data: AddRealEstate,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_session),
+):
+    result = await update_item(db, item_id, update_data)
+    invalidate_listing(item_id)
+    background_tasks.add_task(refresh_similar_in_background, item_id)
+    return result
 
 
 @router.delete("/users/{user_id}", response_model=dict)
@@ -416,64 +553,116 @@ async def delete_user_endpoint(user_id: int, db: AsyncSession = Depends(get_asyn
 
 
 @router.get("/items/{id}")
-async def get_item(id: int, db: AsyncSession = Depends(get_async_session)):
-    # Получаем данные по ID из базы данных, включая связанные фотографии и опции
-    result = await db.execute(
-        select(Home)
-        .options(selectinload(Home.photos), selectinload(Home.options))  # Загружаем фотографии и опции
-        .filter(Home.id == id)
-    )
-    item = result.scalar_one_or_none()  # Получаем один результат или None
-
-    if item is None:
+async def get_item(id: int, request: Request, db: AsyncSession = Depends(get_async_session)):
+    # Карточка собирается одним запросом и кэшируется уже сериализованной;
+    # повторный просмотр с If-None-Match получает 304 без тела
+    cached = await get_item_response(db, id)
+    if cached is None:
         raise HTTPException(status_code=404, detail="Item not found")
 
-    options = await get_options_by_home_id(item.id, db)
+    # Просмотр копится в памяти воркера и уходит в home_stats пачкой
+    popularity_counters.record_view(id)
+    etag, body = cached
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/items")
+async def get_items(
+    filters: ListingFilters = Depends(),
+    cursor: Optional[int] = None,  # id последнего объявления предыдущей страницы
+    limit: int = Query(LISTING_PAGE_SIZE, ge=1, le=LISTING_MAX_PAGE_SIZE),
+    sort: str = Query("new", pattern="^(new|popular)$"),
+    offset: int = Query(0, ge=0, le=POPULAR_MAX_OFFSET),  # Только для sort=popular
+    db: AsyncSession = Depends(get_async_session),
+):
+    if sort == "popular":
+        # Популярные: по счётчикам home_stats; страницы по смещению, в ответе next_offset
+        items, next_offset = await get_popular_page(db, filters, offset, limit)
+        return {"items": items, "next_offset": next_offset}
+
+    # Одна страница объявлений с фильтрами из сводки listing_summary — без JOIN и догрузки фото
+    if LISTING_SQL_JSON:
+        body = await get_listing_page_json(db, filters, cursor, limit)
+        return Response(content=body, media_type="application/json")
+
+    items, next_cursor = await get_listing_page(db, filters, cursor, limit)
 
-    # Возвращаем данные в нужном формате, включая опции
     return {
-        "id": item.id,
-        "user_id": item.user_id,
-        "name": item.name,
-        "price": item.price,
-        "description": item.description,
-        "latitude": item.latitude,
-        "longitude": item.longitude,
-        "address": item.address,
-        "type_of_transaction": item.type_of_transaction,
-        "type_of_housing": item.type_of_housing,
-        "photos": [photo.photo for photo in item.photos],  # Список фотографий
-        "options": options
+        "items": [
+            {
+                "id": item.id,
+                "name": item.name,
+                "price": item.price,
+                "description": item.description,
+                "address": item.address,
+                "photos": item.photos,  # Имена фотографий из сводки
+                "type_of_transaction": item.type_of_transaction,
+                "type_of_housing": item.type_of_housing,
+            }
+            for item in items
+        ],
+        "next_cursor": next_cursor,
     }
 
 
-@router.get("/items")
-async def get_items(db: AsyncSession = Depends(get_async_session)):
-    # Выполнение запроса, чтобы получить все дома вместе с их фотографиями
-    result = await db.execute(
-        select(Home)
-        .options(selectinload(Home.photos))  # Используем selectinload для загрузки связанных фотографий
-    )
-    items = result.scalars().all()
+@router.get("/trending")
+async def get_trending_items(
+    filters: ListingFilters = Depends(),
+    limit: int = Query(TRENDING_PAGE_SIZE, ge=1, le=TRENDING_MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_session),
+):
+    # Объявления по затухающему рейтингу просмотров и добавлений в избранное
+    return {"items": await get_trending(db, filters, limit)}
 
-    # Возвращаем список домов с добавленным путем к фотографии
-    return [
-        {
-            "id": item.id,
-            "name": item.name,
-            "price": item.price,
-            "description": item.description,
-            "address": item.address,
-            "photos": [photo.photo for photo in item.photos],  # Извлекаем имена фотографий
-            "type_of_transaction": item.type_of_transaction,
-            "type_of_housing": item.type_of_housing,
 
-        }
-        for item in items
-    ]
+@router.get("/facets")
+async def get_items_facets(filters: ListingFilters = Depends()):
+    # Количество объявлений по значениям фильтров боковой панели при текущем наборе фильтров
+    return await get_facets(filters)
 
 
+@router.get("/search")
+async def search_items(
+    q: str = Query(..., min_length=1, max_length=200),
+    filters: ListingFilters = Depends(),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, le=SEARCH_MAX_OFFSET),
+    db: AsyncSession = Depends(get_async_session),
+):
+    # Полнотекстовый поиск по названию, адресу и описанию плюс нечёткое совпадение адреса;
+    # результаты отсортированы по релевантности, совпадения подсвечены <b>...</b>
+    items = await search_listings(db, q, filters, limit, offset)
+    return {"items": items, "next_offset": offset + limit if len(items) == limit else None}
+
 
+def _naive_utc(moment: datetime) -> datetime:
+    # Время в БД хранится в UTC без зоны; время с зоной из запроса приводится к нему
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+@router.get("/export")
+async def export_items(
+    filters: ListingFilters = Depends(),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    updated_since: Optional[datetime] = None,  # Только объявления, изменённые начиная с этого момента (UTC)
+):
+    # Полная или инкрементальная выгрузка объявлений потоком.
+    # X-Export-Watermark передаётся в updated_since следующей выгрузки; он взят из снимка этой
+    # выгрузки с запасом назад, поэтому часть строк придёт повторно — применять их нужно по id.
+    # Ограничение: удалённые объявления в выгрузку не попадают (надгробий нет), инкрементальный
+    # потребитель о них не узнает — для сверки удалений нужна периодическая полная выгрузка
+    if updated_since is not None:
+        updated_since = _naive_utc(updated_since)
+    watermark, body = await open_export(format, filters, updated_since)
+    headers = {"Content-Disposition": f'attachment; filename="listings.{format}"'}
+    if watermark is not None:
+        headers["X-Export-Watermark"] = watermark.isoformat()
+    return StreamingResponse(body, media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
 
 
 @router.get("/users")
@@ -511,72 +700,125 @@ async def get_real_estate(
     db: AsyncSession = Depends(get_async_session),
     user=Depends(get_current_user),
 ):
+    if LISTING_SQL_JSON:
+        body = await get_real_estate_json(db, user.id)
+        if body is None:
+            raise HTTPException(status_code=404, detail="No real estate found for the user")
+        return Response(content=body, media_type="application/json")
+
     try:
         # Запрашиваем данные для текущего пользователя
-        query = select(Home).where(Home.user_id == user.id)
+        query = (
+            select(Home)
+            .where(Home.user_id == user.id)
+            .options(selectinload(Home.photos), selectinload(Home.options))
+            .order_by(Home.id)
+        )
         result = await db.execute(query)
         user_real_estate = result.scalars().all()
-
-        if not user_real_estate:
-            raise HTTPException(status_code=404, detail="No real estate found for the user")
-
-        # Формируем корректный URL для фото
-        for real_estate in user_real_estate:
-            real_estate.photo = f"http://127.0.0.1:8000/operations/get-photo/{Path(real_estate.photo).name}"
-
-        return user_real_estate
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving data: {str(e)}")
 
+    if not user_real_estate:
+        raise HTTPException(status_code=404, detail="No real estate found for the user")
 
-@router.get("/get-photo/{home_id}")
-async def get_photos_by_home(home_id: int, db: AsyncSession = Depends(get_async_session)):
-    # Выполняем запрос к базе данных для получения всех фото для данного home_id
-    result = await db.execute(select(Photo).filter(Photo.home_id == home_id))
-    photos = result.scalars().all()
-
-    if not photos:
-        raise HTTPException(status_code=404, detail="No photos found for the given home ID")
-
-    # Формируем пути к фотографиям
-    photo_paths = [Path("uploads/photos") / photo.photo for photo in photos]
-
-    # Проверяем существование файлов
-    missing_files = [str(photo_path) for photo_path in photo_paths if not photo_path.exists()]
-    if missing_files:
-        raise HTTPException(status_code=404, detail=f"Files not found: {', '.join(missing_files)}")
-
-    # Возвращаем список URL-адресов изображений
-    # Здесь вместо путей мы формируем ссылку на изображение для клиента
+    # Формируем корректный URL для фото
     return [
-        {"photo": str(photo_path.relative_to(Path("uploads/photos")))} for photo_path in photo_paths
+        {
+            "id": real_estate.id,
+            "name": real_estate.name,
+            "price": real_estate.price,
+            "type_of_transaction": real_estate.type_of_transaction,
+            "type_of_housing": real_estate.type_of_housing,
+            "number_of_rooms": (real_estate.options.numbers_of_room if real_estate.options else None) or "",
+            "description": real_estate.description or "",
+            "options": json.dumps(
+                {key: getattr(real_estate.options, column, None) or "" for key, column in AD_OPTION_KEYS.items()},
+                ensure_ascii=False,
+            ),
+            "latitude": real_estate.latitude,
+            "longitude": real_estate.longitude,
+            "address": real_estate.address,
+            "photo": f"/operations/get-photo/{real_estate.id}/{real_estate.photos[0].photo}" if real_estate.photos else "",
+        }
+        for real_estate in user_real_estate
     ]
 
 
-@router.get("/get-photo/{home_id}/{photo_name}")
-async def get_photo(home_id: int, photo_name: str, db: AsyncSession = Depends(get_async_session)):
-    # Выполняем запрос к базе данных для получения всех фото для данного home_id
-    result = await db.execute(select(Photo).filter(Photo.home_id == home_id))
-    photos = result.scalars().all()
+@router.get("/get-photo/{home_id}")
+async def get_photos_by_home(
+    home_id: int,
+    size: Optional[str] = Query(None, pattern=PHOTO_SIZE_PATTERN),  # thumb | card | full
+    db: AsyncSession = Depends(get_async_session),
+):
+    # Список строится по метаданным из БД, без проверки файлов на диске;
+    # пропавшие файлы помечает фоновая сверка и они просто не попадают в ответ
+    manifest = await get_manifest(db, [home_id], size)
+    photos = manifest[home_id]
 
     if not photos:
         raise HTTPException(status_code=404, detail="No photos found for the given home ID")
 
-    # Формируем путь к нужной фотографии
-    photo = next((photo for photo in photos if photo.photo == photo_name), None)
+    return [{"photo": photo["photo"], "url": photo["url"]} for photo in photos]
+
 
-    if not photo:
+@router.get("/photos/manifest")
+async def get_photos_manifest(
+    home_ids: List[int] = Query(..., min_length=1, max_length=MANIFEST_MAX_HOMES),
+    size: Optional[str] = Query(None, pattern=PHOTO_SIZE_PATTERN),
+    db: AsyncSession = Depends(get_async_session),
+):
+    # Фото сразу для нескольких объявлений (например, для страницы выдачи) одним запросом
+    manifest = await get_manifest(db, list(dict.fromkeys(home_ids)), size)
+    return {"homes": [{"home_id": home_id, "photos": photos} for home_id, photos in manifest.items()]}
+
+
+@router.get("/photos/{photo_name}")
+async def get_photo_by_hash(
+    photo_name: str,
+    request: Request,
+    size: Optional[str] = Query(None, pattern=PHOTO_SIZE_PATTERN),  # thumb | card | full
+):
+    # Фото с хэшем содержимого в имени: файл неизменяем, БД не нужна
+    if not is_content_addressed(photo_name):
         raise HTTPException(status_code=404, detail="Photo not found")
+    return await _serve_photo(request, photo_name, size, IMMUTABLE_CACHE_CONTROL)
 
-    # Получаем путь к фотографии
-    photo_path = Path("uploads/photos") / photo.photo
 
-    # Проверяем существование файла
-    if not photo_path.exists():
-        raise HTTPException(status_code=404, detail="File not found")
+@router.get("/get-photo/{home_id}/{photo_name}")
+async def get_photo(
+    home_id: int,
+    photo_name: str,
+    request: Request,
+    size: Optional[str] = Query(None, pattern=PHOTO_SIZE_PATTERN),  # thumb | card | full
+    db: AsyncSession = Depends(get_async_session),
+):
+    if not is_content_addressed(photo_name):
+        # Старые имена проверяем одной точечной выборкой по дому и имени
+        result = await db.execute(
+            select(Photo.id).where(Photo.home_id == home_id, Photo.photo == photo_name).limit(1)
+        )
+        if result.scalar_one_or_none() is None:
+            raise HTTPException(status_code=404, detail="Photo not found")
+        return await _serve_photo(request, photo_name, size, LEGACY_CACHE_CONTROL)
+
+    return await _serve_photo(request, photo_name, size, IMMUTABLE_CACHE_CONTROL)
+
+
+async def _serve_photo(request: Request, photo_name: str, size: Optional[str], cache_control: str):
+    # Уменьшенная копия (WebP, если браузер его принимает); без size — оригинал
+    if size:
+        fmt = pick_format(request.headers.get("accept"))
+        variant = await get_variant(photo_name, size, fmt)
+        if variant is not None:
+            etag = f'"{Path(photo_name).stem}-{size}-{fmt}"' if is_content_addressed(photo_name) else None
+            return photo_response(
+                request, variant, media_type=VARIANT_FORMATS[fmt][1], etag=etag,
+                cache_control=cache_control, vary_accept=True,
+            )
 
-    # Возвращаем сам файл фотографии
-    return FileResponse(photo_path)
+    etag = f'"{Path(photo_name).stem}"' if is_content_addressed(photo_name) else None
+    return photo_response(request, PHOTO_DIR / photo_name, etag=etag, cache_control=cache_control)
 
 # @router.get("/get-photo/{home_id}")
 # async def get_photo(home_id: int, db: AsyncSession = Depends(get_async_session)):
@@ -628,6 +870,12 @@ async def get_user_ads(
     user=Depends(get_current_user),
     db: AsyncSession = Depends(get_async_session)
 ):
+    if LISTING_SQL_JSON:
+        body = await get_user_ads_json(db, user.id)
+        if body is None:
+            raise HTTPException(status_code=404, detail="Объявления не найдены")
+        return Response(content=body, media_type="application/json")
+
     # Асинхронный запрос объявлений пользователя с загрузкой связанных фотографий и опций
     result = await db.execute(
         select(Home)
@@ -678,28 +926,12 @@ async def add_to_favorites(
     db: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
-    # Проверяем, существует ли недвижимость
-    query = select(Home).where(Home.id == favorite.home_id)
-    result = await db.execute(query)
-    home = result.scalar_one_or_none()
-    if not home:
+    # Один INSERT ... ON CONFLICT DO NOTHING: повторное добавление не ошибка
+    try:
+        created = await add_favorite(db, current_user.id, favorite.home_id)
+    except HomeNotFound:
         raise HTTPException(status_code=404, detail="Home not found")
-
-    # Проверяем, есть ли уже запись в избранном
-    query = select(FavoritesHome).where(
-        FavoritesHome.user_id == current_user.id,
-        FavoritesHome.home_id == favorite.home_id
-    )
-    result = await db.execute(query)
-    existing_favorite = result.scalar_one_or_none()
-    if existing_favorite:
-        raise HTTPException(status_code=400, detail="Already in favorites")
-
-    # Добавляем запись в избранное
-    new_favorite = FavoritesHome(user_id=current_user.id, home_id=favorite.home_id)
-    db.add(new_favorite)
-    await db.commit()
-    return {"message": "Added to favorites"}
+    return {"message": "Added to favorites", "created": created}
 
 
 @router.delete("/favorites/{home_id}")
@@ -708,34 +940,32 @@ async def remove_from_favorites(
     db: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
-    # Проверяем, существует ли запись в избранном
-    query = select(FavoritesHome).where(
-        FavoritesHome.user_id == current_user.id,
-        FavoritesHome.home_id == home_id
-    )
-    result = await db.execute(query)
-    favorite = result.scalar_one_or_none()
-    if not favorite:
-        raise HTTPException(status_code=404, detail="Not in favorites")
+    # Один DELETE ... RETURNING: повторное удаление не ошибка
+    removed = await remove_favorite(db, current_user.id, home_id)
+    return {"message": "Removed from favorites", "removed": removed}
 
-    # Удаляем запись
-    await db.delete(favorite)
-    await db.commit()
-    return {"message": "Removed from favorites"}
+
+@router.get("/favorites/status")
+async def get_favorites_status(
+    home_ids: List[int] = Query(..., min_length=1, max_length=FAVORITES_STATUS_MAX_IDS),
+    db: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_user)
+):
+    # Отметки "в избранном" сразу для всей страницы объявлений
+    flags = await favorite_flags(db, current_user.id, home_ids)
+    return {"favorites": {str(home_id): flag for home_id, flag in flags.items()}}
 
 
-@router.get("/favorites/", response_model=List[HomeBase])
+@router.get("/favorites/")
 async def get_favorites(
+    cursor: Optional[int] = None,  # id последнего объявления предыдущей страницы
+    limit: int = Query(FAVORITES_PAGE_SIZE, ge=1, le=FAVORITES_MAX_PAGE_SIZE),
     db: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
-    # Получаем все записи в избранном для текущего пользователя
-    query = select(Home).join(FavoritesHome).where(FavoritesHome.user_id == current_user.id)
-    result = await db.execute(query)
-    homes = result.scalars().all()
+    items, next_cursor = await get_favorites_page(db, current_user.id, cursor, limit)
 
-    if not homes:
+    if not items and cursor is None:
         raise HTTPException(status_code=404, detail="No favorites found")
 
-    # Возвращаем список избранных домов как сериализованный список Pydantic моделей
-    return homes
\ No newline at end of file
+    return {"items": items, "next_cursor": next_cursor}
\ No newline at end of file
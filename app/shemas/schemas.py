@@ -1,4 +1,5 @@
 from datetime import datetime
+from decimal import Decimal
 from typing import Optional, List
 
 from pydantic import BaseModel, ConfigDict
@@ -101,3 +102,33 @@ class Home(HomeBase2):
     pass
 
 
+# Фильтры ленты объявлений (query-параметры GET /operations/items)
+class ListingFilters(BaseModel):
+    type_of_transaction: Optional[str] = None
+    type_of_housing: Optional[str] = None
+    min_price: Optional[Decimal] = None
+    max_price: Optional[Decimal] = None
+    rooms: Optional[int] = None
+
+
+# Строка массового импорта объявлений (NDJSON или CSV, POST /operations/import)
+class ImportRow(BaseModel):
+    name: str
+    price: str
+    type_of_transaction: str
+    type_of_housing: str
+    description: str = ""
+    address: str
+    number_of_rooms: str = ""
+    square: str = ""
+    year_of_construction: str = ""
+    floor: str = ""
+    ceiling_height: str = ""
+    balcony: str = ""
+    internet: str = ""
+    elevator: str = ""
+    latitude: Optional[float] = None  # Если координаты переданы, геокодирование не нужно
+    longitude: Optional[float] = None
+    photos: List[str] = []  # Имена файлов внутри ZIP-архива с фото
+
+    model_config = ConfigDict(coerce_numbers_to_str=True)
@@ -0,0 +1,4 @@
+import os
+
+# app.config требует SECRET_AUTH при импорте
+os.environ.setdefault("SECRET_AUTH", "test")
@@ -0,0 +1,70 @@
+import asyncio
+
+from sqlalchemy.dialects.postgresql import asyncpg
+
+from app.operations.facets import FACET_COLUMNS, compute_facets, facet_conditions
+from app.shemas.schemas import ListingFilters
+
+
+def _sql(element) -> str:
+    return str(element.compile(dialect=asyncpg.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def _conditions_sql(conditions) -> str:
+    return " AND ".join(_sql(condition) for condition in conditions)
+
+
+FILTERS = ListingFilters(type_of_transaction="rent", min_price=100)
+
+
+def test_facet_excludes_its_own_dimension():
+    per_facet, active = facet_conditions(FILTERS)
+    assert set(active) == {"type_of_transaction", "price"}
+
+    transaction = _conditions_sql(per_facet["type_of_transaction"])
+    assert "type_of_transaction" not in transaction
+    assert "price_value >= 100" in transaction
+
+    price = _conditions_sql(per_facet["price"])
+    assert "type_of_transaction = 'rent'" in price
+    assert "price_value" not in price
+
+
+def test_other_facets_keep_all_filters():
+    per_facet, _ = facet_conditions(FILTERS)
+    for name in set(FACET_COLUMNS) - {"type_of_transaction", "price"}:
+        sql = _conditions_sql(per_facet[name])
+        assert "type_of_transaction = 'rent'" in sql
+        assert "price_value >= 100" in sql
+
+
+def test_no_filters_no_conditions():
+    per_facet, active = facet_conditions(ListingFilters())
+    assert active == {}
+    assert all(conditions == [] for conditions in per_facet.values())
+
+
+class _Result:
+    def all(self):
+        return []
+
+
+class _CapturingSession:
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, stmt):
+        self.statements.append(stmt)
+        return _Result()
+
+
+def test_compute_facets_filters_each_count_separately():
+    db = _CapturingSession()
+    asyncio.run(compute_facets(db, FILTERS))
+    sql = _sql(db.statements[0])
+
+    # Фильтры не попадают в общий WHERE через AND — каждый count считается со своим FILTER
+    where = sql.split("\nFROM ", 1)[1].split("WHERE", 1)[1].split("GROUP BY", 1)[0]
+    assert " OR " in where
+    assert "count(*) FILTER (WHERE home.price_value >= 100) AS count_type_of_transaction" in sql
+    assert "count(*) FILTER (WHERE home.type_of_transaction = 'rent') AS count_price" in sql